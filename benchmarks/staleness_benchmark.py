@@ -0,0 +1,66 @@
+"""Compare the latest commit time lookup of GitPython with the ref based staleness
+check."""
+
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import git
+
+from devsync.data import GitRepo
+
+GIT_ENV = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": "bench",
+    "GIT_AUTHOR_EMAIL": "bench@example.com",
+    "GIT_COMMITTER_NAME": "bench",
+    "GIT_COMMITTER_EMAIL": "bench@example.com",
+}
+
+
+def create_repos(root: Path, count: int, branches: int) -> list[Path]:
+    repos = []
+    for i in range(count):
+        path = root / f"repo{i:04d}"
+        subprocess.check_call(["git", "init", "-q", str(path)], env=GIT_ENV)
+        subprocess.check_call(["git", "commit", "-q", "--allow-empty", "-m", "init"], cwd=path, env=GIT_ENV)
+        for branch in range(branches):
+            subprocess.check_call(["git", "branch", f"feature{branch}"], cwd=path, env=GIT_ENV)
+        repos.append(path)
+    return repos
+
+
+def gitpython_commit_time(path: Path) -> float:
+    git_repo = git.Repo(path)
+    return max(head.commit.committed_date for head in git_repo.heads)
+
+
+def measure(name: str, repos: list[Path], lookup) -> float:
+    start = time.perf_counter()
+    for path in repos:
+        lookup(path)
+    duration = time.perf_counter() - start
+    print(f"{name:<24} {duration:8.3f}s {duration / len(repos) * 1000:8.2f}ms/repo")
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repos", type=int, default=300, help="Number of repositories to create")
+    parser.add_argument("--branches", type=int, default=5, help="Branches per repository")
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repos = create_repos(Path(temp_dir), arguments.repos, arguments.branches)
+        print(f"{len(repos)} repos with {arguments.branches + 1} branches each")
+
+        measure("GitPython heads", repos, gitpython_commit_time)
+        measure("for-each-ref (cold)", repos, lambda path: GitRepo(path).is_update_required(0))
+        measure("ref fingerprint (warm)", repos, lambda path: GitRepo(path).is_update_required(0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Time the phases of a backup on generated trees of several sizes and compare them
+against stored baselines."""
+
+import argparse
+import dataclasses
+import json
+import logging
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from benchmarks.tree import PRESETS, Tree, TreeGenerator, TreeSpec
+from devsync.data import BackupFolder, Target, find_repos_in_backup_folders
+from devsync.engine import CopyEngine
+from devsync.index import DiscoveryIndex
+from devsync.log import init_logging, logger
+from devsync.manifest import SyncManifest
+from devsync.sync import BackupOptions, RepoSync, RSync
+
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+MIN_DURATION = 0.05  # Phases faster than this are too noisy to compare
+
+
+class Suite:
+    def __init__(self, root: Path, tree: Tree, jobs: int):
+        self.__root = root
+        self.__tree = tree
+        self.__jobs = jobs
+        self.__results: dict[str, float] = {}
+        self.__backup_folders: list[BackupFolder] = []
+
+    def measure(self, phase: str, function: Callable[[], object]) -> None:
+        start = time.perf_counter()
+        function()
+        self.__results[phase] = time.perf_counter() - start
+
+    def run(self) -> dict[str, float]:
+        index = DiscoveryIndex(self.__root / "discovery.json")
+        self.measure("discovery", lambda: self.discover(index))
+        self.measure("discovery_indexed", lambda: self.discover(index))
+        repos = [repo for element in self.__backup_folders for repo in element.repos]
+        self.measure("staleness", lambda: [repo.is_update_required(0) for repo in repos])
+        self.measure("staleness_cached", lambda: [repo.is_update_required(0) for repo in repos])
+
+        target_path = self.__root / "target"
+        target_path.mkdir()
+        target = Target(target_path)
+        repo_sync = RepoSync(self.__tree.home, self.__backup_folders)
+        options = BackupOptions(jobs=self.__jobs)
+        self.measure("repo_clone", lambda: self.update_repos(repo_sync, target, options))
+        for repo in self.__tree.repos[::4]:
+            TreeGenerator.commit(repo)
+        self.measure("repo_fetch", lambda: self.update_repos(repo_sync, target, options))
+
+        self.measure("sync", lambda: self.sync(target))
+        self.measure("sync_unchanged", lambda: self.sync(target))
+        return self.__results
+
+    def discover(self, index: DiscoveryIndex) -> None:
+        self.__backup_folders = [BackupFolder(self.__tree.home, folder) for folder in self.__tree.folders]
+        find_repos_in_backup_folders(self.__backup_folders, self.__jobs, index)
+
+    @staticmethod
+    def update_repos(repo_sync: RepoSync, target: Target, options: BackupOptions) -> None:
+        manifest = SyncManifest(target.state_dir)
+        failures = repo_sync.update_repos(target, options, manifest)
+        if failures:
+            msg = f"{len(failures)} repos failed to update"
+            raise RuntimeError(msg)
+        manifest.save()
+
+    def sync(self, target: Target) -> None:
+        if shutil.which("rsync"):
+            RSync(self.__tree.home, self.__backup_folders).sync(target, BackupOptions())
+        else:
+            CopyEngine(self.__tree.home, self.__backup_folders).sync(target, False)
+
+
+def run_preset(name: str, spec: TreeSpec, jobs: int) -> dict[str, float]:
+    with tempfile.TemporaryDirectory(prefix="devsync-bench-") as temp_dir:
+        root = Path(temp_dir)
+        start = time.perf_counter()
+        tree = TreeGenerator(spec).generate(root)
+        print(
+            f"\n{name}: {len(tree.repos)} repos, {tree.files} files, {tree.size / 1e6:.1f} MB "
+            f"(generated in {time.perf_counter() - start:.1f}s)"
+        )
+        return Suite(root, tree, jobs).run()
+
+
+def compare(name: str, results: dict[str, float], baseline: dict[str, float], tolerance: float) -> list[str]:
+    """Print the results next to the baseline and return the phases that regressed."""
+    regressions = []
+    for phase, duration in results.items():
+        expected = baseline.get(phase)
+        if expected is None:
+            print(f"  {phase:<20} {duration:8.3f}s")
+            continue
+        ratio = duration / expected if expected else 0.0
+        regressed = ratio > tolerance and duration >= MIN_DURATION
+        print(f"  {phase:<20} {duration:8.3f}s  baseline {expected:8.3f}s  {ratio:5.2f}x{'  REGRESSION' * regressed}")
+        if regressed:
+            regressions.append(f"{name}/{phase}")
+    return regressions
+
+
+def load_baseline(path: Path) -> dict[str, dict[str, float]]:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", choices=PRESETS, default=["small", "medium"], help="Tree sizes to run")
+    parser.add_argument("--hg-repos", type=int, default=0, help="Mercurial repos to add to each tree")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size, the median of each phase is kept")
+    parser.add_argument("--jobs", type=int, default=4, help="Parallel jobs for discovery and repo updates")
+    parser.add_argument("--baseline", type=Path, default=BASELINE, help="Baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as new baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Slowdown factor reported as regression")
+    parser.add_argument("--verbose", action="store_true", help="Show the log output of devsync")
+    arguments = parser.parse_args()
+
+    if arguments.verbose:
+        init_logging()
+    else:
+        logger.setLevel(logging.WARNING)
+
+    baseline = load_baseline(arguments.baseline)
+    regressions = []
+    for name in arguments.sizes:
+        spec = dataclasses.replace(PRESETS[name], hg_repos=arguments.hg_repos)
+        runs = [run_preset(name, spec, arguments.jobs) for _ in range(arguments.repeat)]
+        results = {phase: statistics.median(run[phase] for run in runs) for phase in runs[0]}
+        print(f"Median of {len(runs)} runs:")
+        regressions.extend(compare(name, results, baseline.get(name, {}), arguments.tolerance))
+        baseline[name] = {phase: round(duration, 4) for phase, duration in results.items()}
+
+    if arguments.save_baseline:
+        arguments.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"\nBaseline saved to {arguments.baseline}")
+    if regressions:
+        print(f"\nRegressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
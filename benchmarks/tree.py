@@ -0,0 +1,136 @@
+"""Generate synthetic home trees with backup folders, repositories and local bare
+remotes for benchmarks."""
+
+import dataclasses
+import os
+import random
+import shutil
+import subprocess
+from pathlib import Path
+
+GIT_ENV = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": "bench",
+    "GIT_AUTHOR_EMAIL": "bench@example.com",
+    "GIT_COMMITTER_NAME": "bench",
+    "GIT_COMMITTER_EMAIL": "bench@example.com",
+    "HGUSER": "bench <bench@example.com>",
+}
+
+# Relative weights of file sizes in bytes, roughly a source tree with some assets
+FILE_SIZES = {1_000: 60, 10_000: 30, 100_000: 8, 1_000_000: 2}
+
+
+@dataclasses.dataclass(frozen=True)
+class TreeSpec:
+    """Shape of a generated tree.
+
+    Repos are spread round robin over the folders at a random depth. Each one has a
+    bare remote it was pushed to, so updates can fetch without network access.
+    """
+
+    folders: int = 2
+    git_repos: int = 10
+    hg_repos: int = 0
+    depth: int = 2
+    directories: int = 3  # Subdirectories per level below a folder
+    files: int = 5  # Files per directory, repos included
+    file_sizes: tuple[tuple[int, int], ...] = tuple(FILE_SIZES.items())
+    seed: int = 0
+
+
+PRESETS = {
+    "small": TreeSpec(folders=2, git_repos=10, depth=2, directories=3, files=5),
+    "medium": TreeSpec(folders=4, git_repos=50, depth=3, directories=4, files=8),
+    "large": TreeSpec(folders=8, git_repos=200, depth=4, directories=4, files=10),
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class Tree:
+    home: Path
+    remotes: Path
+    folders: list[str]
+    repos: list[Path]
+    files: int
+    size: int
+
+
+class TreeGenerator:
+    def __init__(self, spec: TreeSpec):
+        self.__spec = spec
+        self.__random = random.Random(spec.seed)
+        self.__files = 0
+        self.__size = 0
+
+    def generate(self, root: Path) -> Tree:
+        """Create the tree below root, the home is ``root/home`` and the bare remotes
+        are in ``root/remotes``."""
+        home = root / "home"
+        remotes = root / "remotes"
+        remotes.mkdir(parents=True)
+        folders = [f"Folder{index}" for index in range(self.__spec.folders)]
+        directories = {folder: self.__create_directories(home / folder, self.__spec.depth) for folder in folders}
+
+        hg_repos = self.__spec.hg_repos if shutil.which("hg") else 0
+        if hg_repos < self.__spec.hg_repos:
+            print(f"hg is not installed, skipping {self.__spec.hg_repos} Mercurial repos")
+
+        repos = []
+        for index in range(self.__spec.git_repos + hg_repos):
+            folder = folders[index % len(folders)]
+            path = self.__random.choice(directories[folder]) / f"repo{index:04d}"
+            if index < self.__spec.git_repos:
+                self.__create_git_repo(path, remotes / f"repo{index:04d}.git")
+            else:
+                self.__create_hg_repo(path, remotes / f"repo{index:04d}.hg")
+            repos.append(path)
+        return Tree(home, remotes, folders, repos, self.__files, self.__size)
+
+    def __create_directories(self, path: Path, depth: int) -> list[Path]:
+        path.mkdir(parents=True)
+        self.__create_files(path)
+        directories = [path]
+        if depth > 0:
+            for index in range(self.__spec.directories):
+                directories.extend(self.__create_directories(path / f"dir{index}", depth - 1))
+        return directories
+
+    def __create_files(self, path: Path) -> None:
+        sizes, weights = zip(*self.__spec.file_sizes, strict=True)
+        for index, size in enumerate(self.__random.choices(sizes, weights, k=self.__spec.files)):
+            (path / f"file{index}.dat").write_bytes(self.__random.randbytes(size))
+            self.__files += 1
+            self.__size += size
+
+    def __create_git_repo(self, path: Path, remote: Path) -> None:
+        path.mkdir(parents=True)
+        self.__create_files(path)
+        git = ["git", "-c", "init.defaultBranch=main"]
+        subprocess.check_call([*git, "init", "-q", "--bare", str(remote)], env=GIT_ENV)
+        subprocess.check_call([*git, "init", "-q"], cwd=path, env=GIT_ENV)
+        subprocess.check_call(["git", "add", "."], cwd=path, env=GIT_ENV)
+        subprocess.check_call(["git", "commit", "-q", "-m", "init"], cwd=path, env=GIT_ENV)
+        subprocess.check_call(["git", "remote", "add", "origin", str(remote)], cwd=path, env=GIT_ENV)
+        subprocess.check_call(["git", "push", "-q", "origin", "main"], cwd=path, env=GIT_ENV)
+
+    def __create_hg_repo(self, path: Path, remote: Path) -> None:
+        path.mkdir(parents=True)
+        self.__create_files(path)
+        subprocess.check_call(["hg", "init", str(remote)], env=GIT_ENV)
+        subprocess.check_call(["hg", "init"], cwd=path, env=GIT_ENV)
+        subprocess.check_call(["hg", "commit", "-q", "-A", "-m", "init"], cwd=path, env=GIT_ENV)
+        subprocess.check_call(["hg", "push", "-q", str(remote)], cwd=path, env=GIT_ENV)
+        (path / ".hg" / "hgrc").write_text(f"[paths]\ndefault = {remote}\n")
+
+    @staticmethod
+    def commit(repo: Path) -> None:
+        """Add a commit to a generated repo and push it, so the next update fetches it."""
+        if (repo / ".hg").exists():
+            subprocess.check_call(
+                ["hg", "commit", "-q", "-m", "change", "--config", "ui.allowemptycommit=1"], cwd=repo, env=GIT_ENV
+            )
+            subprocess.check_call(["hg", "push", "-q"], cwd=repo, env=GIT_ENV)
+            return
+        subprocess.check_call(["git", "commit", "-q", "--allow-empty", "-m", "change"], cwd=repo, env=GIT_ENV)
+        subprocess.check_call(["git", "push", "-q", "origin", "main"], cwd=repo, env=GIT_ENV)
@@ -1,31 +1,115 @@
 import argparse
 import datetime
+import json
+import sys
 from pathlib import Path
 
 from devsync.args import dir_path
-from devsync.config import NAME
+from devsync.bundle import BundleChain
+from devsync.changes import ChangeJournal
+from devsync.config import CHANGE_JOURNAL, NAME, RUN_HISTORY
 from devsync.data import Target
-from devsync.log import logger
+from devsync.log import init_logging, logger
 from devsync.parser import YMLConfigParser
-from devsync.sync import run_backup
+from devsync.plan import create_plan
+from devsync.report import RunReport
+from devsync.runner import command_runner
+from devsync.sync import BackupOptions, run_backup
+from devsync.verify import run_verify
+from devsync.watch import Watcher
 
 
 def main():
-    logger.success(f"{NAME}\n")
+    if sys.argv[1:2] == ["restore"]:
+        restore(parse_restore_arguments(sys.argv[2:]))
+        return
+    if sys.argv[1:2] == ["watch"]:
+        watch(parse_watch_arguments(sys.argv[2:]))
+        return
+    if sys.argv[1:2] == ["verify"]:
+        verify(parse_verify_arguments(sys.argv[2:]))
+        return
+    if sys.argv[1:2] == ["plan"]:
+        plan(parse_plan_arguments(sys.argv[2:]))
+        return
 
     arguments = parse_arguments()
+    init_logging()
+    logger.success(f"{NAME}\n")
+
     config = Path(arguments.config.name)
-    backup_target = Target(arguments.target)
+    backup_target = Target(arguments.target, arguments.mirror, arguments.bundles)
 
     logger.verbose(f"Use config from: {config}\n\n{config.read_text()}")
 
     logger.notice(f"Starting Backup for {backup_target.path}\n")
-    yaml_parser = YMLConfigParser(config)
-    run_backup(yaml_parser, backup_target, arguments.last_update, arguments.dry_run)
+    run_report = RunReport(backup_target.path, arguments.dry_run)
+    with run_report.phase("config"):
+        yaml_parser = YMLConfigParser(config)
+    options = BackupOptions(
+        last_update=arguments.last_update,
+        report=arguments.dry_run,
+        jobs=arguments.jobs,
+        jobs_per_host=arguments.jobs_per_host,
+        rescan=arguments.rescan,
+        local_source=arguments.local_source,
+        rsync_jobs=arguments.rsync_jobs,
+        rsync_jobs_per_device=arguments.rsync_jobs_per_device,
+        shard_by=arguments.shard_by,
+        profile=arguments.profile,
+        engine=arguments.engine,
+        copy_jobs=arguments.copy_jobs,
+        command_timeout=arguments.command_timeout,
+        snapshots=arguments.snapshots,
+        time_budget=arguments.time_budget * 60,
+        resume=arguments.resume,
+        maintenance_jobs=arguments.maintenance_jobs,
+    )
+    try:
+        run_backup(yaml_parser, backup_target, options, run_report)
+    except KeyboardInterrupt:
+        command_runner.cancel_all()
+        raise
+    finally:
+        run_report.append_to(RUN_HISTORY)
 
     logger.success("Finished Backup\n")
 
 
+def restore(arguments):
+    init_logging()
+    logger.notice(f"Restoring {arguments.bundles} into {arguments.destination}\n")
+    BundleChain(arguments.bundles).restore(arguments.destination)
+    logger.success("Finished Restore\n")
+
+
+def watch(arguments):
+    init_logging()
+    yaml_parser = YMLConfigParser(Path(arguments.config.name))
+    roots = [element.path for element in yaml_parser.parse_backup_folder()]
+    logger.notice(f"Recording changes below {', '.join(str(root) for root in roots)} in {CHANGE_JOURNAL}\n")
+    try:
+        Watcher(roots, ChangeJournal(CHANGE_JOURNAL)).run()
+    except KeyboardInterrupt:
+        logger.success("Stopped watching\n")
+
+
+def verify(arguments):
+    init_logging()
+    yaml_parser = YMLConfigParser(Path(arguments.config.name))
+    result = run_verify(yaml_parser, Target(arguments.target), arguments.jobs, arguments.sample_percent)
+    if not result.ok:
+        sys.exit(1)
+    logger.success("Backup verified\n")
+
+
+def plan(arguments):
+    init_logging()
+    yaml_parser = YMLConfigParser(Path(arguments.config.name))
+    backup_plan = create_plan(yaml_parser, Target(arguments.target), arguments.jobs)
+    print(json.dumps(backup_plan.to_dict(), indent=1) if arguments.json else backup_plan.format_table())
+
+
 def parse_arguments():
     class DateAction(argparse.Action):
         def __call__(self, arg_parser, args, values, option_string=None):
@@ -39,6 +123,10 @@ def parse_arguments():
 
     parser = argparse.ArgumentParser(
         description="Backup Data and Repositories to external devices.",
+        epilog="Restore a Git repository stored as bundles with: devsync.py restore BUNDLES DESTINATION. "
+        "Record changes for faster syncs with: devsync.py watch CONFIG. "
+        "Compare the backup with the source with: devsync.py verify TARGET CONFIG. "
+        "Preview a backup without running git or rsync with: devsync.py plan TARGET CONFIG",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
     parser.add_argument(
@@ -57,17 +145,187 @@ def parse_arguments():
         type=int,
         nargs=3,
         action=DateAction,
-        default=(1970, 1, 1),
-        help="Last time update was performed. This will just update repositories after this date. Format: YYYY MM DD",
+        default=0,
+        help="Last time update was performed. Repositories without a recorded state on the target are just "
+        "updated if they have commits after this date. Format: YYYY MM DD",
     )
     parser.add_argument(
         "--dry-run",
         action="store_true",
         help="Perform a dry run without making real changes",
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of repositories to update in parallel",
+    )
+    parser.add_argument(
+        "--jobs-per-host",
+        type=int,
+        default=4,
+        help="Maximum number of parallel repository updates talking to the same remote host",
+    )
+    parser.add_argument(
+        "--rescan",
+        action="store_true",
+        help="Ignore the discovery index and the change journal and scan all backup folders again",
+    )
+    parser.add_argument(
+        "--local-source",
+        action="store_true",
+        help="Clone and pull repositories from the local working copies instead of their remotes",
+    )
+    parser.add_argument(
+        "--rsync-jobs",
+        type=int,
+        default=1,
+        help="Number of rsync processes to run in parallel. With 1 everything is synced by a single rsync call",
+    )
+    parser.add_argument(
+        "--rsync-jobs-per-device",
+        type=int,
+        default=2,
+        help="Maximum number of parallel rsync processes reading from or writing to the same block device",
+    )
+    parser.add_argument(
+        "--shard-by",
+        choices=("folder", "subdir"),
+        default="folder",
+        help="Split parallel rsync work per backup folder or per top-level subdirectory of each folder",
+    )
+    parser.add_argument(
+        "--profile",
+        default="",
+        help="Target profile selecting the rsync transfer strategy, e.g. usb-fat, local-ext4, network-mount or "
+        "remote-ssh. Overrides the targetProfile of the config. Detected from the target filesystem if neither is set",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("rsync", "native"),
+        default="rsync",
+        help="Sync data with rsync or the built-in copy engine. The native engine is used if rsync is not installed",
+    )
+    parser.add_argument(
+        "--copy-jobs",
+        type=int,
+        default=4,
+        help="Number of files the native copy engine copies in parallel",
+    )
+    parser.add_argument(
+        "--command-timeout",
+        type=float,
+        default=0,
+        help="Seconds after which a git or hg command is killed and the repo counted as failed. 0 disables it",
+    )
+    parser.add_argument(
+        "--mirror",
+        action="store_true",
+        help="Store repositories on the target as mirrors with all branches and tags but without working copy. "
+        "Existing working copies are converted, repositories stored as mirror stay mirrors",
+    )
+    parser.add_argument(
+        "--bundles",
+        action="store_true",
+        help="Store Git repositories on the target as a chain of incremental bundles written from the local "
+        "working copies, which is much faster on FAT and exFAT drives. Existing clones are converted, "
+        "repositories stored as bundles stay bundles",
+    )
+    parser.add_argument(
+        "--snapshots",
+        action="store_true",
+        help="Write the backup folders into a new timestamped snapshot on each run, hardlinking unchanged files "
+        "to the previous one. Expired snapshots are pruned by the snapshotRetention of the config",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=0,
+        metavar="MINUTES",
+        help="Stop starting repo updates and transfers once their estimated duration doesn't fit into the "
+        "remaining minutes. The ones that changed most often per second of work go first. 0 disables it",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run, skipping the repos and folders it completed according to the "
+        "checkpoint journal on the target",
+    )
+    parser.add_argument(
+        "--maintenance-jobs",
+        type=int,
+        default=1,
+        help="Number of updated Git repos on the target repacked in parallel once they are past the maintenance "
+        "thresholds of the config. 0 disables it",
+    )
 
     return parser.parse_args()
 
 
+def parse_restore_arguments(args: list[str]):
+    def bundle_chain(path: str) -> Path:
+        if not BundleChain.is_chain(Path(path)):
+            msg = f"{path} is not a directory with {BundleChain.STATE_FILE}"
+            raise argparse.ArgumentTypeError(msg)
+        return Path(path)
+
+    parser = argparse.ArgumentParser(
+        prog="devsync.py restore",
+        description="Rebuild a Git repository with working copy from the chain of bundles written by --bundles.",
+    )
+    parser.add_argument("bundles", type=bundle_chain, help="Directory of the repository on the backup target")
+    parser.add_argument("destination", type=Path, help="Empty or missing directory for the restored repository")
+    return parser.parse_args(args)
+
+
+def parse_watch_arguments(args: list[str]):
+    parser = argparse.ArgumentParser(
+        prog="devsync.py watch",
+        description="Record the directories changed below the backup folders, so the next backup only syncs those.",
+    )
+    parser.add_argument("config", type=argparse.FileType("r"), help="Path to config file")
+    return parser.parse_args(args)
+
+
+def parse_verify_arguments(args: list[str]):
+    parser = argparse.ArgumentParser(
+        prog="devsync.py verify",
+        description="Compare the content of the backup folders with the target by hashing both, only files changed "
+        "since the last verification and a rotating sample are read again.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("target", type=dir_path, help="Destination path of the backup")
+    parser.add_argument("config", type=argparse.FileType("r"), help="Path to config file")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="Number of files to hash in parallel")
+    parser.add_argument(
+        "--sample-percent",
+        type=float,
+        default=5,
+        help="Share of unchanged files hashed again on each run to detect bit rot, 0 disables it",
+    )
+    return parser.parse_args(args)
+
+
+def parse_plan_arguments(args: list[str]):
+    parser = argparse.ArgumentParser(
+        prog="devsync.py plan",
+        description="List the repos and folders a backup would update and estimate its size and duration from "
+        "earlier runs, without running git, hg or rsync.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("target", type=dir_path, help="Destination path of the backup")
+    parser.add_argument("config", type=argparse.FileType("r"), help="Path to config file")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of repositories the backup updates in parallel, used for the time estimate",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the plan as JSON instead of a table")
+    return parser.parse_args(args)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,169 @@
+import json
+from pathlib import Path
+
+from devsync.log import logger
+from devsync.runner import run_command
+
+
+class BundleChain:
+    """A Git repository stored as a chain of bundle files in a directory on the target.
+
+    The first bundle holds all branches and tags, every later one only the objects added
+    since the refs recorded with the previous one. Writing a few large files is much
+    faster than the many small loose objects of a fetch on FAT and exFAT drives. Once the
+    chain has ``MAX_LENGTH`` bundles, the next update replaces it by a single full bundle.
+    """
+
+    STATE_FILE = "bundles.json"
+    VERSION = 1
+    MAX_LENGTH = 16
+
+    def __init__(self, path: Path):
+        self.__path = path
+        self.__state = self.__load()
+
+    @staticmethod
+    def is_chain(path: Path) -> bool:
+        return (path / BundleChain.STATE_FILE).is_file()
+
+    @property
+    def path(self) -> Path:
+        return self.__path
+
+    @property
+    def bundles(self) -> list[Path]:
+        return [self.__path / name for name in self.__state["bundles"]]
+
+    @property
+    def refs(self) -> dict[str, str]:
+        """Branches and tags of the source at the last update."""
+        return self.__state["refs"]
+
+    @property
+    def head(self) -> str:
+        return self.__state["head"]
+
+    @property
+    def url(self) -> str:
+        return self.__state["url"]
+
+    def update(self, source: Path, refs: dict[str, str], head: str, url: str) -> Path | None:
+        """Bundle the commits of the repo at ``source`` since the last update.
+
+        Returns the new bundle or None if there were no new objects, e.g. if only branches
+        were deleted or moved back. The refs are recorded in both cases.
+        """
+        if refs == self.refs and self.bundles:
+            bundle = None
+        elif not self.bundles or len(self.bundles) >= BundleChain.MAX_LENGTH:
+            bundle = self.__create_bundle(source, refs, full=True) if refs else None
+        elif self.__has_new_objects(source, refs):
+            bundle = self.__create_bundle(source, refs, full=False)
+        else:
+            bundle = None
+
+        if bundle is not None and bundle.name.endswith("-full.bundle"):
+            self.__state["bundles"] = [bundle.name]
+        elif bundle is not None:
+            self.__state["bundles"].append(bundle.name)
+        self.__state.update(refs=refs, head=head, url=url)
+        self.save()
+        self.__remove_unused_bundles()
+        return bundle
+
+    def restore(self, destination: Path) -> None:
+        """Rebuild the repo with a checked out working copy from the chain of bundles."""
+        if destination.exists() and any(destination.iterdir()):
+            msg = f"Restore destination {destination} is not empty"
+            raise FileExistsError(msg)
+        if not self.bundles:
+            msg = f"No bundles found in {self.__path}"
+            raise FileNotFoundError(msg)
+
+        run_command(["git", "init", "-q", str(destination)], prefix=destination.name)
+        for bundle in self.bundles:
+            logger.verbose(f"Fetching {bundle.name}")
+            self.__git(["fetch", "-q", "--update-head-ok", str(bundle), "+refs/*:refs/*"], destination)
+
+        # Incremental bundles leave out branches that point to known commits and keep deleted ones
+        fetched = self.read_refs(destination)
+        for ref_name in fetched.keys() - self.refs.keys():
+            self.__git(["update-ref", "-d", ref_name], destination)
+        for ref_name, object_name in self.refs.items():
+            if fetched.get(ref_name) != object_name:
+                self.__git(["update-ref", ref_name, object_name], destination)
+
+        self.__git(["symbolic-ref", "HEAD", f"refs/heads/{self.head}"], destination)
+        if self.url:
+            self.__git(["remote", "add", "origin", self.url], destination)
+        if f"refs/heads/{self.head}" in self.refs:
+            self.__git(["reset", "-q", "--hard"], destination)
+
+    @staticmethod
+    def read_refs(path: Path) -> dict[str, str]:
+        output = run_command(
+            ["git", "for-each-ref", "--format=%(objectname) %(refname)", "refs/heads", "refs/tags"],
+            cwd=path,
+            prefix=path.name,
+            log_output=False,
+        )
+        return dict(reversed(line.split(" ", 1)) for line in output.splitlines())
+
+    def save(self) -> None:
+        self.__path.mkdir(parents=True, exist_ok=True)
+        state_file = self.__path / BundleChain.STATE_FILE
+        temporary_file = state_file.with_suffix(".tmp")
+        temporary_file.write_text(json.dumps(self.__state, indent=1, sort_keys=True))
+        temporary_file.replace(state_file)
+
+    def __load(self) -> dict:
+        empty = {"version": BundleChain.VERSION, "bundles": [], "refs": {}, "head": "", "url": "", "next": 1}
+        try:
+            state = json.loads((self.__path / BundleChain.STATE_FILE).read_text())
+        except FileNotFoundError:
+            return empty
+        if state.get("version") != BundleChain.VERSION:
+            msg = f"Unsupported bundle chain version {state.get('version')} in {self.__path}"
+            raise ValueError(msg)
+        return state
+
+    def __has_new_objects(self, source: Path, refs: dict[str, str]) -> bool:
+        output = self.__git(
+            [
+                "rev-list",
+                "--objects",
+                "--max-count=1",
+                "--ignore-missing",
+                *sorted(set(refs.values())),
+                "--not",
+                *sorted(set(self.refs.values())),
+            ],
+            source,
+        )
+        return bool(output.strip())
+
+    def __create_bundle(self, source: Path, refs: dict[str, str], full: bool) -> Path:
+        bundle = self.__path / f"{self.__state['next']:04d}{'-full' if full else ''}.bundle"
+        # Tips of the last update that are gone from the source are skipped, the bundle
+        # then holds their objects again instead of failing
+        prerequisites = [] if full else [f"^{object_name}" for object_name in sorted(set(self.refs.values()))]
+        logger.verbose(f"Writing {'full' if full else 'incremental'} bundle {bundle} with {len(refs)} refs")
+        self.__path.mkdir(parents=True, exist_ok=True)
+        self.__git(
+            ["bundle", "create", "-q", str(bundle), "--branches", "--tags", "--ignore-missing", *prerequisites],
+            source,
+        )
+        self.__state["next"] += 1
+        return bundle
+
+    def __remove_unused_bundles(self) -> None:
+        """Delete the bundles replaced by a full bundle and leftovers of interrupted runs."""
+        used = set(self.__state["bundles"])
+        for bundle in self.__path.glob("*.bundle"):
+            if bundle.name not in used:
+                logger.debug(f"Removing unused bundle {bundle}")
+                bundle.unlink()
+
+    @staticmethod
+    def __git(args: list[str], cwd: Path) -> str:
+        return run_command(["git", *args], cwd=cwd, prefix=cwd.name, log_output=False)
@@ -0,0 +1,185 @@
+import fcntl
+import json
+import os
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+from devsync.log import logger
+
+
+class ChangeJournal:
+    """Directories changed below the backup folders, recorded by ``devsync.py watch``.
+
+    The journal is a JSON lines file. A watch session starts with a ``start`` line listing
+    the watched roots and the process id of the watcher, followed by ``dirty`` lines with
+    the changed directories and the time of the change. Lost events are recorded as
+    ``overflow``, directories that can't be watched as ``unwatched`` and the end of the
+    session as ``stop``. Backups compact the journal.
+    """
+
+    VERSION = 1
+    SAFETY_MARGIN = 60.0  # Seconds to look back before the last sync for changes written late
+    RETENTION = 30 * 24 * 3600.0  # Seconds entries are kept by compact
+
+    def __init__(self, path: Path):
+        self.__path = path
+
+    @property
+    def path(self) -> Path:
+        return self.__path
+
+    def start(self, roots: list[Path]) -> None:
+        """Begin a new session, the entries of the previous one are dropped."""
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "event": "start",
+            "version": ChangeJournal.VERSION,
+            "time": time.time(),
+            "pid": os.getpid(),
+            "roots": [str(root) for root in roots],
+        }
+        temporary_path = self.__path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps(entry) + "\n")
+        temporary_path.replace(self.__path)
+
+    def record_dirty(self, directories: Iterable[str], when: float) -> None:
+        self.__append([{"event": "dirty", "time": when, "path": directory} for directory in sorted(directories)])
+
+    def record_overflow(self) -> None:
+        self.__append([{"event": "overflow", "time": time.time()}])
+
+    def record_unwatched(self, directory: str) -> None:
+        self.__append([{"event": "unwatched", "time": time.time(), "path": directory}])
+
+    def record_stop(self) -> None:
+        self.__append([{"event": "stop", "time": time.time()}])
+
+    def __append(self, entries: list[dict]) -> None:
+        with self.__path.open("a") as journal:
+            fcntl.flock(journal, fcntl.LOCK_EX)  # Not while a backup compacts the journal
+            journal.write("".join(json.dumps(entry) + "\n" for entry in entries))
+
+    def compact(self) -> None:
+        """Keep only the latest entry of each directory and event, so the journal of
+        a long running watcher doesn't grow with every change. That's all ``get_dirty``
+        needs to answer for any sync time. Entries older than ``RETENTION`` are dropped and
+        replaced by a ``compact`` line, targets synced before it are scanned completely.
+
+        The file is rewritten in place under a lock, so no entry the watcher appends
+        meanwhile is lost.
+        """
+        horizon = time.time() - ChangeJournal.RETENTION
+        try:
+            journal = self.__path.open("r+")
+        except FileNotFoundError:
+            return
+        with journal:
+            fcntl.flock(journal, fcntl.LOCK_EX)
+            try:
+                entries = [json.loads(line) for line in journal.read().splitlines()]
+            except ValueError:
+                return
+            if not entries or entries[0].get("event") != "start":
+                return
+            latest = {}
+            for entry in entries[1:]:
+                expired = entry["time"] < horizon and entry["event"] not in {"compact", "stop", "unwatched"}
+                kept = {"event": "compact", "time": horizon} if expired else entry
+                key = (kept["event"], kept.get("path"))
+                latest[key] = max(latest.get(key, kept), kept, key=lambda item: item["time"])
+            compacted = [entries[0], *sorted(latest.values(), key=lambda entry: entry["time"])]
+            if compacted == entries:
+                return
+            journal.seek(0)
+            journal.write("".join(json.dumps(entry) + "\n" for entry in compacted))
+            journal.truncate()
+        logger.verbose(f"Compacted change journal {self.__path} from {len(entries)} to {len(compacted)} entries")
+
+    def get_dirty(self, roots: list[Path], since: float) -> list[Path] | None:
+        """Directories below the roots changed since the given time.
+
+        Returns None if the journal can't tell, i.e. if no watcher is running, it started
+        after ``since``, watches other roots, lost events since, was compacted after it or
+        can't watch a directory. A sync that started after events were lost scanned
+        everything, so older losses don't count. Unwatched directories never are, nothing
+        records their changes.
+        """
+        try:
+            entries = [json.loads(line) for line in self.__path.read_text().splitlines()]
+        except (OSError, ValueError):
+            logger.verbose(f"No change journal at {self.__path}")
+            return None
+        if not entries or entries[0].get("event") != "start" or entries[0].get("version") != ChangeJournal.VERSION:
+            logger.verbose(f"Ignoring change journal {self.__path} with unknown format")
+            return None
+
+        if not ChangeJournal.covers(entries[0], roots, since):
+            return None
+
+        dirty = set()
+        start = since - ChangeJournal.SAFETY_MARGIN
+        for entry in entries[1:]:
+            if (
+                entry["event"] in {"stop", "unwatched"}
+                or (entry["event"] == "overflow" and entry["time"] >= start)
+                or (entry["event"] == "compact" and entry["time"] > start)  # Dropped entries this sync needs
+            ):
+                logger.verbose(f"Change journal has an {entry['event']} entry")
+                return None
+            if entry["event"] == "dirty" and entry["time"] >= start:
+                dirty.add(entry["path"])
+        return sorted(Path(directory) for directory in dirty)
+
+    @staticmethod
+    def covers(start: dict, roots: list[Path], since: float) -> bool:
+        """Whether the session watches the roots without interruption since the given time."""
+        if start["time"] > since:
+            logger.verbose("Change journal started after the last sync")
+            return False
+        if not {str(root) for root in roots} <= set(start["roots"]):
+            logger.verbose("Change journal doesn't watch all backup folders")
+            return False
+        if not ChangeJournal.is_running(start["pid"]):
+            logger.verbose(f"Watcher {start['pid']} of the change journal is not running")
+            return False
+        return True
+
+    @staticmethod
+    def is_running(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+
+class SyncStamp:
+    """Start time of the last complete data sync, stored on the target."""
+
+    VERSION = 1
+    FILENAME = "sync.json"
+
+    def __init__(self, state_dir: Path):
+        self.__path = state_dir / SyncStamp.FILENAME
+
+    @property
+    def path(self) -> Path:
+        return self.__path
+
+    def load(self) -> float | None:
+        try:
+            content = json.loads(self.__path.read_text())
+        except (OSError, ValueError):
+            return None
+        if not isinstance(content, dict) or content.get("version") != SyncStamp.VERSION:
+            return None
+        return content["time"]
+
+    def save(self, start: float) -> None:
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.__path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps({"version": SyncStamp.VERSION, "time": start}))
+        temporary_path.replace(self.__path)
@@ -0,0 +1,140 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from devsync.log import logger
+
+
+class CheckpointJournal:
+    """Write-ahead journal of the repos and backup folders completed by a run, stored on
+    the target.
+
+    Every entry is a JSON line that is fsynced before the next work starts, so it survives
+    a pulled drive or a suspended laptop. A run begins with a ``start`` line, followed by a
+    ``repo`` or ``folder`` line for each completed repo update and folder sync. The journal
+    is removed once a run completed everything, ``--resume`` continues an interrupted run
+    from the entries left behind. A line cut off by a crash is ignored, that repo or folder
+    is done again.
+    """
+
+    VERSION = 1
+    FILENAME = "checkpoint.jsonl"
+
+    def __init__(self, state_dir: Path):
+        self.__path = state_dir / CheckpointJournal.FILENAME
+        self.__lock = threading.Lock()
+        self.__repos: set[str] = set()
+        self.__folders: set[str] = set()
+        self.__started = time.time()
+
+    @property
+    def path(self) -> Path:
+        return self.__path
+
+    @property
+    def started(self) -> float:
+        """Start time of the run the journal belongs to."""
+        return self.__started
+
+    @property
+    def repos(self) -> set[str]:
+        """Repos completed by the interrupted run, relative to the home folder."""
+        return self.__repos
+
+    @property
+    def folders(self) -> set[str]:
+        return self.__folders
+
+    def start(self) -> None:
+        """Begin a new journal, dropping the entries of an earlier run."""
+        self.__repos.clear()
+        self.__folders.clear()
+        self.__started = time.time()
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.__path.with_suffix(".tmp")
+        with temporary_path.open("w") as journal:
+            journal.write(json.dumps({"event": "start", "version": CheckpointJournal.VERSION, "time": self.__started}))
+            journal.write("\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        temporary_path.replace(self.__path)
+        CheckpointJournal.sync_directory(self.__path.parent)
+
+    def load(self) -> bool:
+        """Read the completed work of an interrupted run, returns whether there was one."""
+        try:
+            lines = self.__path.read_text().splitlines()
+        except OSError:
+            lines = []
+        entries = [entry for entry in map(CheckpointJournal.parse_entry, lines) if entry is not None]
+        if not entries or entries[0].get("event") != "start" or entries[0].get("version") != CheckpointJournal.VERSION:
+            logger.info("No interrupted run to resume, starting from scratch\n")
+            return False
+
+        self.__started = entries[0]["time"]
+        self.__repos = {entry["path"] for entry in entries if entry.get("event") == "repo"}
+        self.__folders = {entry["name"] for entry in entries if entry.get("event") == "folder"}
+        logger.info(
+            f"Resuming run from {time.ctime(entries[0]['time'])}: {len(self.__repos)} repos and "
+            f"{len(self.__folders)} folders completed\n"
+        )
+        return True
+
+    @staticmethod
+    def parse_entry(line: str) -> dict | None:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            logger.verbose(f"Ignoring incomplete checkpoint entry: {line}")
+            return None
+        return entry if isinstance(entry, dict) else None
+
+    def record_repo(self, relative_repo_path: Path) -> None:
+        self.__append({"event": "repo", "path": relative_repo_path.as_posix(), "time": time.time()})
+
+    def record_folder(self, name: str) -> None:
+        self.__append({"event": "folder", "name": name, "time": time.time()})
+
+    def __append(self, entry: dict) -> None:
+        with self.__lock, self.__path.open("a") as journal:
+            journal.write(json.dumps(entry) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def is_repo_done(self, relative_repo_path: Path) -> bool:
+        return relative_repo_path.as_posix() in self.__repos
+
+    def is_folder_done(self, name: str) -> bool:
+        return name in self.__folders
+
+    def clear(self) -> None:
+        """Remove the journal after a run that completed everything."""
+        self.__path.unlink(missing_ok=True)
+        CheckpointJournal.sync_directory(self.__path.parent)
+
+    @staticmethod
+    def sync_directory(path: Path) -> None:
+        """Persist a created, renamed or removed directory entry."""
+        try:
+            descriptor = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            with contextlib.suppress(OSError):  # Not supported by every filesystem
+                os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+
+def open_checkpoint(state_dir: Path, resume: bool, dry_run: bool) -> CheckpointJournal:
+    """Journal continuing the interrupted run if ``resume`` is set and there is one,
+    otherwise a new one. A dry run only reads it."""
+    checkpoint = CheckpointJournal(state_dir)
+    if resume and checkpoint.load():
+        return checkpoint
+    if not dry_run:
+        checkpoint.start()
+    return checkpoint
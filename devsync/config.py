@@ -3,3 +3,8 @@ from pathlib import Path
 NAME = "Dev Sync"
 SCRIPT_DIR = Path(__file__).resolve().parent.parent
 LOGFILE = SCRIPT_DIR / "logs" / "devsync.log"
+DISCOVERY_INDEX = LOGFILE.parent / "discovery.json"
+REF_CACHE = LOGFILE.parent / "refs.json"
+RUN_HISTORY = LOGFILE.parent / "runs.jsonl"
+CHANGE_JOURNAL = LOGFILE.parent / "changes.jsonl"
+HASH_CACHE = LOGFILE.parent / "hashes.json"
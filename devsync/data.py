@@ -2,23 +2,61 @@ import abc
 import datetime
 import os
 import re
+import shutil
 import subprocess
+import time
+import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
-import git
-
+from devsync.bundle import BundleChain
+from devsync.excludes import IGNORE_FILE, Excludes
+from devsync.hg import HG_ENV, HG_STATE_REVSET, HG_STATE_TEMPLATE, HgState, hg_command_server, parse_hg_state
+from devsync.index import DiscoveryIndex
 from devsync.log import logger
+from devsync.runner import Command, command_runner, run_command
+from devsync.staleness import RefState, get_ref_fingerprint, ref_cache
+
+SCP_LIKE_URL = re.compile(r"^(?:[^@/]+@)?(?P<host>[^:/]{2,}):")
+
+
+def get_remote_host(url: str) -> str:
+    """Host part of a clone url or an empty string for local paths."""
+    if "://" in url:
+        split_url = urllib.parse.urlsplit(url)
+        return "" if split_url.scheme == "file" else split_url.hostname or ""
+    scp_like = SCP_LIKE_URL.match(url)
+    return scp_like.group("host") if scp_like else ""
 
 
 class Target:
-    def __init__(self, destination_path: str | Path):
+    STATE_DIR = ".devsync"
+
+    def __init__(self, destination_path: str | Path, mirror: bool = False, bundles: bool = False):
         self.__path = Path(destination_path).absolute()
+        self.__mirror = mirror
+        self.__bundles = bundles
         self.check_destination()
 
     @property
     def path(self) -> Path:
         return self.__path
 
+    @property
+    def mirror(self) -> bool:
+        """Whether repos are stored as mirrors without working copy."""
+        return self.__mirror
+
+    @property
+    def bundles(self) -> bool:
+        """Whether Git repos are stored as chains of incremental bundles."""
+        return self.__bundles
+
+    @property
+    def state_dir(self) -> Path:
+        """Directory on the target where devsync keeps its bookkeeping."""
+        return self.__path / Target.STATE_DIR
+
     def check_destination(self) -> None:
         if not Path(self.path).exists():
             msg = f"Target dir {self.path} does not exist"
@@ -33,6 +71,8 @@ class Target:
 
 
 class Repo:
+    SUPPORTS_BUNDLES = False
+
     def __init__(self, path: str):
         self.__path = Path(path)
 
@@ -40,7 +80,11 @@ class Repo:
     def path(self) -> Path:
         return self.__path
 
-    def is_update_required(self, last_update) -> bool:
+    def is_update_required(self, last_update, recorded_refs: dict[str, str] | None = None) -> bool:
+        """Compare against the refs recorded at the last backup if there are any and fall
+        back to the last update date otherwise."""
+        if recorded_refs is not None:
+            return self.get_refs() != recorded_refs
         return self._get_latest_commit_time > last_update
 
     def __print_update_report(self) -> None:
@@ -49,22 +93,76 @@ class Repo:
             f"{datetime.datetime.fromtimestamp(self._get_latest_commit_time, tz=datetime.timezone.utc)}"
         )
 
+    @property
+    def remote_host(self) -> str:
+        """Host of the origin remote, empty for local paths and repos without one."""
+        try:
+            return get_remote_host(self._get_clone_url())
+        except (subprocess.SubprocessError, OSError):
+            return ""
+
+    def _run(self, command: list[str], cwd: Path | None = None, log_output: bool = True) -> str:
+        """Run a command for this repo, its output is logged with the repo name as prefix."""
+        return run_command(command, cwd, self.path.name, log_output)
+
     def get_repo_target_path(self, root, target: Target) -> Path:
         return target.path / self.path.relative_to(root)
 
-    def update_repo_on_target(self, root: Path, target: Target, report: bool):
+    def update_repo_on_target(self, root: Path, target: Target, report: bool, local_source: bool = False):
+        """Pull or clone the repo on the target.
+
+        With ``local_source`` the data is taken from the working copy at ``path`` instead of
+        the remote, while the remote url is still kept as origin of the target repo. Mirrors
+        are used for a target in mirror mode and for repos already stored as mirror, bundles
+        likewise.
+        """
         self.__print_update_report()
         target_path = self.get_repo_target_path(root, target)
-        if target_path.exists():
+        if self.SUPPORTS_BUNDLES and (target.bundles or BundleChain.is_chain(target_path)):
+            self.__update_bundles_on_target(target_path, report)
+        elif target.mirror or (target_path.exists() and self._is_mirror(target_path)):
+            self.__update_mirror_on_target(target_path, report, local_source)
+        elif target_path.exists() and local_source:
+            logger.debug(f"\tFound on target {target_path} --> pull from {self.path}\n")
+            if not report:
+                self._pull_repo_from_source(target_path)
+        elif target_path.exists():
             logger.debug(f"\tFound on target {target_path} --> pull\n")
             if not report:
                 self._pull_repo(target_path)
+        elif local_source:
+            url = self.__get_clone_url_if_any()
+            logger.debug(f"\tNot Found on target --> clone from {self.path} into {target_path}, origin {url}\n")
+            if not report:
+                self._clone_repo_from_source(url, target_path)
         else:
             url = self._get_clone_url()
             logger.debug(f"\tNot Found on target --> clone from {url} into {target_path}\n")
             if not report:
                 self._clone_repo(url, target_path)
 
+    def __update_bundles_on_target(self, target_path: Path, report: bool) -> None:
+        logger.debug(f"\tBundle chain {target_path} --> bundle new commits of {self.path}\n")
+        if not report:
+            self._update_bundles(self.__get_clone_url_if_any(), target_path)
+
+    def __update_mirror_on_target(self, target_path: Path, report: bool, local_source: bool) -> None:
+        if target_path.exists():
+            logger.debug(f"\tFound on target {target_path} --> update mirror\n")
+            if not report:
+                self._update_mirror(target_path, local_source)
+            return
+        url = self.__get_clone_url_if_any() if local_source else self._get_clone_url()
+        logger.debug(f"\tNot Found on target --> mirror {self.path if local_source else url} into {target_path}\n")
+        if not report:
+            self._clone_mirror(url, target_path, local_source)
+
+    def __get_clone_url_if_any(self) -> str:
+        try:
+            return self._get_clone_url()
+        except subprocess.CalledProcessError:
+            return ""
+
     @property
     @abc.abstractmethod
     def repo_type(self) -> str:
@@ -77,6 +175,11 @@ class Repo:
         msg = "Don't call me, I am abstract"
         raise NotImplementedError(msg)
 
+    @abc.abstractmethod
+    def get_refs(self) -> dict[str, str]:
+        msg = "Don't call me, I am abstract"
+        raise NotImplementedError(msg)
+
     @abc.abstractmethod
     def _pull_repo(self, target_path: Path) -> None:
         msg = "Don't call me, I am abstract"
@@ -87,28 +190,135 @@ class Repo:
         msg = "Don't call me, I am abstract"
         raise NotImplementedError(msg)
 
+    @abc.abstractmethod
+    def _pull_repo_from_source(self, target_path: Path) -> None:
+        msg = "Don't call me, I am abstract"
+        raise NotImplementedError(msg)
+
+    @abc.abstractmethod
+    def _clone_repo_from_source(self, url: str, target_path: Path) -> None:
+        msg = "Don't call me, I am abstract"
+        raise NotImplementedError(msg)
+
     @abc.abstractmethod
     def _get_clone_url(self) -> str:
         msg = "Don't call me, I am abstract"
         raise NotImplementedError(msg)
 
+    @abc.abstractmethod
+    def _is_mirror(self, target_path: Path) -> bool:
+        msg = "Don't call me, I am abstract"
+        raise NotImplementedError(msg)
+
+    @abc.abstractmethod
+    def _clone_mirror(self, url: str, target_path: Path, local_source: bool) -> None:
+        msg = "Don't call me, I am abstract"
+        raise NotImplementedError(msg)
+
+    @abc.abstractmethod
+    def _update_mirror(self, target_path: Path, local_source: bool) -> None:
+        """Update the mirror with a single fetch, a working copy is converted to a mirror
+        first."""
+        msg = "Don't call me, I am abstract"
+        raise NotImplementedError(msg)
+
+    def _update_bundles(self, url: str, target_path: Path) -> None:
+        """Add the new commits of the working copy to the bundle chain at ``target_path``,
+        only for repo types with ``SUPPORTS_BUNDLES``."""
+        msg = f"{self.repo_type} repos can't be stored as bundles"
+        raise NotImplementedError(msg)
+
 
 class GitRepo(Repo):
+    SUPPORTS_BUNDLES = True
+
     def _get_clone_url(self) -> str:
-        output = subprocess.check_output(["git", "remote", "get-url", "origin"], cwd=self.path)
-        return output.decode("utf-8").split("\n", maxsplit=1)[0]
+        output = self._run(["git", "remote", "get-url", "origin"], cwd=self.path, log_output=False)
+        return output.split("\n", maxsplit=1)[0]
 
     def _clone_repo(self, url: str, target_path: Path) -> None:
-        class CloneProgress(git.RemoteProgress):
-            def line_dropped(self, line):
-                print(line)
-
-        git.Repo.clone_from(url, target_path, progress=CloneProgress())
+        self._run(["git", "clone", url, str(target_path)])
 
     def _pull_repo(self, target_path: Path) -> None:
         main_branch = GitRepo.get_default_branch(target_path)
-        subprocess.check_call(["git", "fetch", "--all", "--prune"], cwd=target_path)
-        subprocess.check_call(f"git reset --hard origin/{main_branch}".split(), cwd=target_path)
+        self._run(["git", "fetch", "--all", "--prune"], cwd=target_path)
+        self._run(["git", "reset", "--hard", f"origin/{main_branch}"], cwd=target_path)
+
+    def _clone_repo_from_source(self, url: str, target_path: Path) -> None:
+        # A local clone hardlinks the object files if source and target share a file system
+        self._run(["git", "clone", str(self.path), str(target_path)])
+        if url:
+            self._run(["git", "remote", "set-url", "origin", url], cwd=target_path)
+        else:
+            self._run(["git", "remote", "remove", "origin"], cwd=target_path)
+
+    def _pull_repo_from_source(self, target_path: Path) -> None:
+        self._run(
+            [
+                "git",
+                "fetch",
+                "--prune",
+                str(self.path),
+                "+refs/heads/*:refs/remotes/origin/*",
+                "+refs/tags/*:refs/tags/*",
+            ],
+            cwd=target_path,
+        )
+        current_branch = GitRepo.get_current_branch(target_path)
+        self._run(["git", "reset", "--hard", f"origin/{current_branch}"], cwd=target_path)
+
+    def _is_mirror(self, target_path: Path) -> bool:
+        return (target_path / "HEAD").is_file() and not (target_path / ".git").exists()
+
+    def _clone_mirror(self, url: str, target_path: Path, local_source: bool) -> None:
+        # A bare mirror has all branches and tags and no checked out files
+        self._run(["git", "clone", "--mirror", str(self.path) if local_source else url, str(target_path)])
+        if not local_source:
+            return
+        if url:
+            self._run(["git", "remote", "set-url", "origin", url], cwd=target_path)
+        else:
+            self._run(["git", "remote", "remove", "origin"], cwd=target_path)
+
+    def _update_mirror(self, target_path: Path, local_source: bool) -> None:
+        if (target_path / ".git").is_dir():
+            self.convert_to_mirror(target_path)
+        if local_source:
+            self._run(["git", "fetch", "--prune", str(self.path), "+refs/*:refs/*"], cwd=target_path)
+        else:
+            self._run(["git", "fetch", "--prune", "origin"], cwd=target_path)
+
+    def convert_to_mirror(self, target_path: Path) -> None:
+        """Replace the working copy by its git directory, configured like a mirror clone.
+        The next fetch drops the remote tracking branches and stores all refs directly."""
+        logger.verbose(f"Converting {target_path} into a mirror")
+        temporary_path = target_path.with_name(f".{target_path.name}.devsync-mirror")
+        (target_path / ".git").rename(temporary_path)
+        shutil.rmtree(target_path)
+        temporary_path.rename(target_path)
+        (target_path / "index").unlink(missing_ok=True)
+        self._run(["git", "config", "core.bare", "true"], cwd=target_path)
+        self._run(["git", "config", "--replace-all", "remote.origin.fetch", "+refs/*:refs/*"], cwd=target_path)
+        self._run(["git", "config", "remote.origin.mirror", "true"], cwd=target_path)
+
+    def _update_bundles(self, url: str, target_path: Path) -> None:
+        if target_path.exists() and not BundleChain.is_chain(target_path):
+            self.convert_to_bundles(url, target_path)
+            return
+        current_branch = GitRepo.get_current_branch(self.path)
+        local_refs = {name: commit for name, commit in self.get_refs().items() if not name.startswith("refs/remotes/")}
+        BundleChain(target_path).update(self.path, local_refs, current_branch, url)
+
+    def convert_to_bundles(self, url: str, target_path: Path) -> None:
+        """Replace a clone or mirror on the target by a chain with a full bundle of the
+        working copy."""
+        logger.verbose(f"Converting {target_path} into a bundle chain")
+        temporary_path = target_path.with_name(f".{target_path.name}.devsync-bundles")
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        current_branch = GitRepo.get_current_branch(self.path)
+        BundleChain(temporary_path).update(self.path, self.get_refs(), current_branch, url)
+        shutil.rmtree(target_path)
+        temporary_path.rename(target_path)
 
     @property
     def repo_type(self) -> str:
@@ -116,18 +326,65 @@ class GitRepo(Repo):
 
     @property
     def _get_latest_commit_time(self) -> float:
-        git_repo = git.Repo(self.path)
-        heads_commit_time = [head.commit.committed_date for head in git_repo.heads]
-        return max(heads_commit_time)
+        return self.get_ref_state().commit_time
+
+    def get_refs(self) -> dict[str, str]:
+        return self.get_ref_state().refs
+
+    def get_ref_state(self) -> RefState:
+        fingerprint = get_ref_fingerprint(self.path / ".git")
+        ref_state = ref_cache.get(self.path, fingerprint)
+        if ref_state is None:
+            ref_state = GitRepo.read_ref_state(self.path)
+            ref_cache.put(self.path, fingerprint, ref_state)
+        return ref_state
+
+    @staticmethod
+    def read_ref_state(path: Path) -> RefState:
+        output = run_command(
+            [
+                "git",
+                "for-each-ref",
+                "--format=%(objectname) %(committerdate:unix) %(refname)",
+                "refs/heads",
+                "refs/tags",
+                "refs/remotes/origin",  # The target pulls from origin, not from the local branches
+            ],
+            cwd=path,
+            prefix=path.name,
+            log_output=False,
+        )
+        commit_time = 0.0
+        refs = {}
+        for line in output.splitlines():
+            object_name, committer_date, ref_name = line.split(" ", 2)
+            refs[ref_name] = object_name
+            if ref_name.startswith(("refs/heads/", "refs/remotes/")) and committer_date:
+                commit_time = max(commit_time, float(committer_date))
+        return RefState(commit_time, refs)
+
+    @staticmethod
+    def get_current_branch(target_path: Path) -> str:
+        try:
+            output = run_command(
+                ["git", "symbolic-ref", "--short", "HEAD"], target_path, target_path.name, log_output=False
+            )
+        except subprocess.CalledProcessError:
+            return "master"
+        return output.strip() or "master"
 
     @staticmethod
     def get_default_branch(target_path: Path) -> str:
         try:
-            origin_info = subprocess.check_output(
-                ["git", "remote", "show", "origin"],
-                cwd=target_path,
-                env={"LANG": "en_US.UTF-8"},
-            ).decode("utf-8")
+            origin_info = command_runner.run(
+                Command(
+                    ["git", "remote", "show", "origin"],
+                    target_path,
+                    env={"LANG": "en_US.UTF-8"},
+                    prefix=target_path.name,
+                    log_output=False,
+                )
+            )
         except subprocess.CalledProcessError:
             return "master"
         default_branch = re.search(r"HEAD branch:\s(\w*)", origin_info, re.DOTALL)
@@ -135,28 +392,114 @@ class GitRepo(Repo):
 
 
 class HgRepo(Repo):
+    """Mercurial repository.
+
+    Heads, their commit times and the default path are read with a single templated
+    ``hg log`` through the shared command server, or a separate hg process if that is
+    not available. The parsing of the plain ``hg heads`` and ``hg paths`` output is kept
+    as fallback for hg versions without the template functions.
+    """
+
+    DIRSTATE_V2_MARKER = b"dirstate-v2\n"
+
+    def __init__(self, path: str | Path):
+        super().__init__(path)
+        self.__state: HgState | None = None
+
+    def get_hg_state(self) -> HgState | None:
+        """State of the source repo, read once as the source does not change during a
+        run. None if the templated query is not supported."""
+        if self.__state is None:
+            try:
+                output = self.__query(["log", "-r", HG_STATE_REVSET, "-T", HG_STATE_TEMPLATE])
+                self.__state = parse_hg_state(output)
+            except (subprocess.CalledProcessError, ValueError) as error:
+                logger.debug(f"Templated hg query failed for {self.path}, parsing plain output: {error}")
+                return None
+        return self.__state
+
+    def __query(self, args: list[str]) -> str:
+        try:
+            return hg_command_server.run(["-R", str(self.path), *args])
+        except OSError:
+            return command_runner.run(
+                Command(["hg", *args], self.path, env=HG_ENV, prefix=self.path.name, log_output=False)
+            )
+
     def _get_clone_url(self) -> str:
-        output = subprocess.check_output(["hg", "paths"], cwd=self.path)
-        for item in output.decode("utf-8").split("\n"):
+        state = self.get_hg_state()
+        if state is not None and (state.url or state.refs):
+            return state.url
+        output = self._run(["hg", "paths"], cwd=self.path, log_output=False)
+        for item in output.split("\n"):
             if "default" in item:
                 return self.parse_remote(item)
         return ""
 
     def _clone_repo(self, url: str, target_path: Path) -> None:
-        subprocess.check_call(f"hg clone {url}".split(), cwd=target_path.parent.absolute())
+        self._run(["hg", "clone", url], cwd=target_path.parent.absolute())
 
     def _pull_repo(self, target_path: Path) -> None:
-        subprocess.check_call(["hg", "pull"], cwd=target_path)
-        subprocess.check_call(["hg", "up"], cwd=target_path)
+        self._run(["hg", "pull"], cwd=target_path)
+        self._run(["hg", "up"], cwd=target_path)
+
+    def _clone_repo_from_source(self, url: str, target_path: Path) -> None:
+        # Mercurial hardlinks the store of local clones where possible
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        self._run(["hg", "clone", str(self.path), str(target_path)])
+        hgrc = target_path / ".hg" / "hgrc"
+        hgrc.write_text(f"[paths]\ndefault = {url}\n" if url else "")
+
+    def _pull_repo_from_source(self, target_path: Path) -> None:
+        self._run(["hg", "pull", str(self.path)], cwd=target_path)
+        self._run(["hg", "up"], cwd=target_path)
+
+    def _is_mirror(self, target_path: Path) -> bool:
+        """Whether the working copy is at the null revision, like after ``hg clone -U``."""
+        try:
+            dirstate = (target_path / ".hg" / "dirstate").read_bytes()
+        except FileNotFoundError:
+            return (target_path / ".hg").is_dir()
+        except OSError:
+            return False
+        parents = dirstate.removeprefix(HgRepo.DIRSTATE_V2_MARKER)
+        return parents[:20] == bytes(20)
+
+    def _clone_mirror(self, url: str, target_path: Path, local_source: bool) -> None:
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        self._run(["hg", "clone", "-U", str(self.path) if local_source else url, str(target_path)])
+        if local_source:
+            hgrc = target_path / ".hg" / "hgrc"
+            hgrc.write_text(f"[paths]\ndefault = {url}\n" if url else "")
+
+    def _update_mirror(self, target_path: Path, local_source: bool) -> None:
+        if any(path.name != ".hg" for path in target_path.iterdir()):
+            logger.verbose(f"Removing the working copy of {target_path}")
+            self._run(["hg", "update", "-q", "null"], cwd=target_path)
+        self._run(["hg", "pull", str(self.path)] if local_source else ["hg", "pull"], cwd=target_path)
 
     @property
     def repo_type(self) -> str:
         return "Hg"
 
+    def get_refs(self) -> dict[str, str]:
+        state = self.get_hg_state()
+        if state is not None:
+            return state.refs
+        output = self._run(["hg", "heads", "--template", "{branch} {node}\n"], cwd=self.path, log_output=False)
+        refs = {}
+        for line in output.splitlines():
+            branch, node = line.rsplit(" ", 1)
+            refs[f"{branch}/{node[:12]}"] = node
+        return refs
+
     @property
     def _get_latest_commit_time(self) -> float:
-        output = subprocess.check_output(["hg", "heads"], cwd=self.path)
-        for item in output.decode("utf-8").split("\n"):
+        state = self.get_hg_state()
+        if state is not None:
+            return state.commit_time
+        output = self._run(["hg", "heads"], cwd=self.path, log_output=False)
+        for item in output.split("\n"):
             if "date:" in item:
                 return self.parse_date(item)
         return 0
@@ -172,10 +515,132 @@ class HgRepo(Repo):
         return item[len("default = ") :].lstrip()
 
 
+class RepoScanner:
+    """Find repositories below several roots by scanning subtrees on a worker pool.
+
+    Directories matching the excludes of their root are pruned. Plain directories with an
+    ignore file have the kind ``ignore``, its patterns apply to everything below them.
+    """
+
+    BATCH_SIZE = 64  # Directories a worker scans before handing the rest back for redistribution
+    REPO_MARKERS = ((".git", "git"), (".hg", "hg"), (".svn", "svn"))
+
+    def __init__(self, jobs: int = 1, index: DiscoveryIndex | None = None):
+        self.__jobs = max(jobs, 1)
+        self.__index = index
+
+    def scan(self, roots: list[Path], excludes: dict[Path, Excludes] | None = None) -> dict[Path, list[Repo]]:
+        start = time.perf_counter()
+        found: dict[Path, list[Repo]] = {root: [] for root in roots}
+        excludes = excludes or {}
+        scanned_directories = 0
+        reused_directories = 0
+
+        with ThreadPoolExecutor(max_workers=self.__jobs) as executor:
+            pending = {
+                executor.submit(self.scan_batch, [(str(root), "", excludes.get(root, Excludes()))]): root
+                for root in found
+            }
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    root = pending.pop(future)
+                    repos, remaining, scanned, reused = future.result()
+                    found[root].extend(repos)
+                    scanned_directories += scanned
+                    reused_directories += reused
+                    chunks = min(len(remaining), self.__jobs)
+                    for chunk in range(chunks):
+                        pending[executor.submit(self.scan_batch, remaining[chunk::chunks])] = root
+
+        for repos in found.values():
+            repos.sort(key=lambda repo: repo.path.parts)
+
+        duration = time.perf_counter() - start
+        logger.verbose(
+            f"Scanned {scanned_directories} directories in {duration:.2f}s "
+            f"({scanned_directories / max(duration, 1e-9):.0f} dirs/s, {reused_directories} unchanged)"
+        )
+        if self.__index is not None:
+            self.__index.save(list(found))
+        return found
+
+    def scan_batch(
+        self, directories: list[tuple[str, str, Excludes]]
+    ) -> tuple[list[Repo], list[tuple[str, str, Excludes]], int, int]:
+        """Scan up to ``BATCH_SIZE`` directories, each given with its path relative to the
+        root and the excludes that apply to it."""
+        repos: list[Repo] = []
+        stack = directories[::-1]
+        scanned = 0
+        reused = 0
+        while stack and scanned < RepoScanner.BATCH_SIZE:
+            directory, relative, excludes = stack.pop()
+            scanned += 1
+            kind, subdirectories, cached = self.scan_directory(directory)
+            reused += cached
+            if kind == "git":
+                repos.append(GitRepo(directory))
+            elif kind == "hg":
+                repos.append(HgRepo(directory))
+            elif kind in {"", "ignore"}:
+                if kind == "ignore":
+                    excludes = excludes.with_ignore_file(Path(directory), relative)
+                for name in reversed(subdirectories):
+                    child = f"{relative}/{name}" if relative else name
+                    if not excludes.matches(child, is_dir=True):
+                        stack.append((f"{directory}{os.sep}{name}", child, excludes))
+        return repos, stack[::-1], scanned, reused
+
+    def scan_directory(self, directory: str) -> tuple[str, list[str], bool]:
+        """Kind of the directory, the sorted subdirectories to descend into and whether
+        the result came from the index."""
+        if self.__index is None:
+            return *RepoScanner.list_directory(directory), False
+        try:
+            mtime_ns = Path(directory).stat().st_mtime_ns
+        except OSError:
+            return "", [], False
+        cached = self.__index.lookup(directory, mtime_ns)
+        if cached is not None:
+            return *cached, True
+        kind, subdirectories = RepoScanner.list_directory(directory)
+        self.__index.record(directory, mtime_ns, kind, subdirectories)
+        return kind, subdirectories, False
+
+    @staticmethod
+    def list_directory(directory: str) -> tuple[str, list[str]]:
+        subdirectories, has_ignore_file = RepoScanner.list_subdirectories(directory)
+        for marker, kind in RepoScanner.REPO_MARKERS:
+            if marker in subdirectories:
+                return kind, []
+        names = sorted(name for name, entry in subdirectories.items() if not entry.is_symlink())
+        return "ignore" if has_ignore_file else "", names
+
+    @staticmethod
+    def list_subdirectories(directory: str) -> tuple[dict[str, os.DirEntry], bool]:
+        """Subdirectories and whether there is an ignore file."""
+        try:
+            with os.scandir(directory) as entries:
+                listed = list(entries)
+        except OSError:
+            return {}, False
+        subdirectories = {entry.name: entry for entry in listed if RepoScanner.is_dir(entry)}
+        return subdirectories, any(entry.name == IGNORE_FILE for entry in listed)
+
+    @staticmethod
+    def is_dir(entry: os.DirEntry) -> bool:
+        try:
+            return entry.is_dir()
+        except OSError:
+            return False
+
+
 class BackupFolder:
-    def __init__(self, root: Path, path: str):
+    def __init__(self, root: Path, path: str, excludes: Excludes | None = None):
         self.__path = root / path
         self.__repos: list[Repo] = []
+        self.__excludes = excludes or Excludes()
 
     @property
     def repos(self) -> list[Repo]:
@@ -185,6 +650,11 @@ class BackupFolder:
     def path(self) -> Path:
         return self.__path
 
+    @property
+    def excludes(self) -> Excludes:
+        """Patterns of the config for paths in this folder that are not backed up."""
+        return self.__excludes
+
     @property
     def has_repos(self) -> bool:
         return bool(self.repos)
@@ -192,14 +662,20 @@ class BackupFolder:
     def get_relative_repo_paths(self) -> list[Path]:
         return [repo.path.relative_to(self.path) for repo in self.repos]
 
-    def find_repos_in_path(self) -> None:
-        for root, dirs, _ in os.walk(self.path, topdown=True):
-            dirs.sort()
-            if ".git" in dirs:
-                self.__repos.append(GitRepo(root))
-                dirs[:] = []
-            elif ".hg" in dirs:
-                self.__repos.append(HgRepo(root))
-                dirs[:] = []
-            elif ".svn" in dirs:
-                dirs[:] = []
+    def find_repos_in_path(self, scanner: RepoScanner | None = None) -> None:
+        scanner = scanner or RepoScanner()
+        self.__repos.extend(scanner.scan([self.path], {self.path: self.excludes})[self.path])
+
+
+def find_repos_in_backup_folders(
+    backup_folders: list[BackupFolder],
+    jobs: int = 1,
+    index: DiscoveryIndex | None = None,
+) -> None:
+    """Discover the repositories of all backup folders at the same time."""
+    found = RepoScanner(jobs, index).scan(
+        [backup_folder.path for backup_folder in backup_folders],
+        {backup_folder.path: backup_folder.excludes for backup_folder in backup_folders},
+    )
+    for backup_folder in backup_folders:
+        backup_folder.repos.extend(found[backup_folder.path])
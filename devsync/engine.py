@@ -0,0 +1,323 @@
+import contextlib
+import errno
+import json
+import os
+import shutil
+import stat
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO
+
+from devsync.data import BackupFolder, Target
+from devsync.excludes import IGNORE_FILE, Excludes
+from devsync.log import logger
+
+COPY_CHUNK_SIZE = 1 << 30  # Bytes per copy_file_range or sendfile call
+FALLBACK_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+
+
+def copy_file_data(source: Path, destination: Path) -> None:
+    """Copy the file content in the kernel with copy_file_range, which can reflink on
+    btrfs or xfs, and fall back to sendfile and a userspace copy."""
+    with source.open("rb") as source_file, destination.open("wb") as destination_file:
+        size = os.fstat(source_file.fileno()).st_size
+        if try_copy(copy_with_file_range, source_file, destination_file, size):
+            return
+        if try_copy(copy_with_sendfile, source_file, destination_file, size):
+            return
+        shutil.copyfileobj(source_file, destination_file)
+
+
+def try_copy(
+    copy: Callable[[int, int, int], None], source_file: BinaryIO, destination_file: BinaryIO, size: int
+) -> bool:
+    """Whether the copy function worked or is not supported for these files, in which
+    case the destination is reset."""
+    try:
+        copy(source_file.fileno(), destination_file.fileno(), size)
+    except OSError as error:
+        if error.errno not in FALLBACK_ERRORS:
+            raise
+        source_file.seek(0)
+        destination_file.seek(0)
+        destination_file.truncate()
+        return False
+    return True
+
+
+def copy_with_file_range(source_fd: int, destination_fd: int, size: int) -> None:
+    copied = 0
+    while copied < size:
+        count = os.copy_file_range(source_fd, destination_fd, min(size - copied, COPY_CHUNK_SIZE))
+        if count == 0:
+            break
+        copied += count
+
+
+def copy_with_sendfile(source_fd: int, destination_fd: int, size: int) -> None:
+    copied = 0
+    while copied < size:
+        count = os.sendfile(destination_fd, source_fd, copied, min(size - copied, COPY_CHUNK_SIZE))
+        if count == 0:
+            break
+        copied += count
+
+
+class FileManifest:
+    """Size, mtime and inode of every source file when it was last copied to the
+    target."""
+
+    VERSION = 1
+    FILENAME = "files.json"
+
+    def __init__(self, state_dir: Path):
+        self.__path = state_dir / FileManifest.FILENAME
+        self.__lock = threading.Lock()
+        self.__files: dict[str, list[int]] = self.load(self.__path)
+
+    @staticmethod
+    def load(path: Path) -> dict[str, list[int]]:
+        try:
+            content = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(content, dict) or content.get("version") != FileManifest.VERSION:
+            logger.warning(f"Ignoring file manifest {path} with unknown format")
+            return {}
+        return content["files"]
+
+    @staticmethod
+    def get_key(source_stat: os.stat_result) -> list[int]:
+        return [source_stat.st_size, source_stat.st_mtime_ns, source_stat.st_ino]
+
+    def is_unchanged(self, relative_path: str, source_stat: os.stat_result) -> bool:
+        return self.__files.get(relative_path) == FileManifest.get_key(source_stat)
+
+    def record(self, relative_path: str, source_stat: os.stat_result) -> None:
+        with self.__lock:
+            self.__files[relative_path] = FileManifest.get_key(source_stat)
+
+    def forget(self, relative_path: str) -> None:
+        """Drop the file and everything below it if it is a directory."""
+        prefix = f"{relative_path}/"
+        with self.__lock:
+            for path in [path for path in self.__files if path == relative_path or path.startswith(prefix)]:
+                del self.__files[path]
+
+    def save(self) -> None:
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.__path.with_suffix(".tmp")
+        with self.__lock:
+            temporary_path.write_text(json.dumps({"version": FileManifest.VERSION, "files": self.__files}))
+        temporary_path.replace(self.__path)
+
+
+class CopyEngine:
+    """Native replacement for the rsync call with the same repo excludes and delete
+    semantics.
+
+    Every backup folder is mirrored into a directory of the same name on the target.
+    Files are copied when they are missing on the target or their size, mtime or inode
+    differ from the file manifest. Entries on the target that no longer exist in the
+    source are deleted unless they are excluded repos.
+    """
+
+    def __init__(self, root: Path, backup_folders: list[BackupFolder]):
+        self.__root = root
+        self.__backup_folders = backup_folders
+        self.__lock = threading.Lock()
+        self.__stats: dict[str, int] = {}
+        self.__directory_times: list[tuple[Path, os.stat_result]] = []
+        self.__copies: list[Future] = []
+        self.__executor: ThreadPoolExecutor | None = None
+        self.__manifest: FileManifest | None = None
+        self.__report = False
+
+    def sync(self, target: Target, report: bool, jobs: int = 4) -> dict[str, int]:
+        """Mirror all backup folders and return statistics named like the ones of rsync."""
+        self.__stats = {
+            "Number of files": 0,
+            "Number of regular files transferred": 0,
+            "Total transferred file size": 0,
+            "Number of deleted files": 0,
+            "Number of errors": 0,
+        }
+        self.__directory_times = []
+        self.__copies = []
+        self.__manifest = FileManifest(target.state_dir)
+        self.__report = report
+
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as self.__executor:
+            for element in self.__backup_folders:
+                repo_paths = [path.as_posix() for path in element.get_relative_repo_paths()]
+                logger.verbose(f"{len(repo_paths)} Repos to exclude in {element.path}")
+                excludes = element.excludes.with_paths(repo_paths)
+                self.__sync_directory(element.path, target.path / element.path.name, element.path.name, excludes)
+            for copy in self.__copies:
+                copy.result()
+
+        if not report:
+            for directory, source_stat in reversed(self.__directory_times):
+                with contextlib.suppress(OSError):
+                    os.utime(directory, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+            self.__manifest.save()
+
+        logger.info("\n".join(f"{name}: {value}" for name, value in self.__stats.items()) + "\n")
+        if self.__stats["Number of errors"]:
+            logger.error(f"{self.__stats['Number of errors']} files could not be synced")
+        return self.__stats
+
+    def __sync_directory(self, source: Path, destination: Path, relative: str, excludes: Excludes) -> None:
+        """Mirror a directory, ``relative`` is its path on the target and ``excludes``
+        match paths relative to the backup folder. Excluded entries are neither copied
+        nor deleted on the target, like with rsync. A source directory that can't be read
+        is skipped without deleting anything below it on the target."""
+        try:
+            source_stat = source.stat()
+            source_entries = CopyEngine.list_entries(source)
+        except OSError as error:
+            self.__count_error(f"Can't read {source}, skipping deletions below it: {error}")
+            return
+        try:
+            destination_entries = CopyEngine.list_entries(destination)
+        except (FileNotFoundError, NotADirectoryError):  # Not created yet, or replaced in a dry run
+            destination_entries = {}
+        except OSError as error:
+            self.__count_error(f"Can't read {destination}: {error}")
+            return
+        folder_relative = relative.partition("/")[2]
+        if IGNORE_FILE in source_entries:
+            excludes = excludes.with_ignore_file(source, folder_relative)
+        if excludes:
+            source_entries = CopyEngine.without_excluded(source_entries, folder_relative, excludes)
+            destination_entries = CopyEngine.without_excluded(destination_entries, folder_relative, excludes)
+
+        for name in sorted(set(destination_entries) - set(source_entries)):
+            self.__delete(destination / name, f"{relative}/{name}")
+
+        if not self.__report:
+            destination.mkdir(parents=True, exist_ok=True)
+            with contextlib.suppress(OSError):
+                destination.chmod(stat.S_IMODE(source_stat.st_mode))
+            self.__directory_times.append((destination, source_stat))
+
+        for name, entry in sorted(source_entries.items()):
+            self.__sync_entry(entry, destination / name, f"{relative}/{name}", destination_entries.get(name), excludes)
+
+    def __sync_entry(
+        self,
+        entry: os.DirEntry,
+        destination: Path,
+        relative_path: str,
+        destination_entry: os.DirEntry | None,
+        excludes: Excludes,
+    ) -> None:
+        try:
+            source_stat = entry.stat(follow_symlinks=False)
+        except OSError as error:
+            self.__count_error(f"Can't stat {entry.path}: {error}")
+            return
+
+        if stat.S_ISDIR(source_stat.st_mode):
+            if destination_entry is not None and not destination_entry.is_dir(follow_symlinks=False):
+                self.__delete(destination, relative_path)
+            self.__sync_directory(Path(entry.path), destination, relative_path, excludes)
+        elif stat.S_ISLNK(source_stat.st_mode):
+            self.__sync_symlink(Path(entry.path), destination, destination_entry)
+        elif stat.S_ISREG(source_stat.st_mode):
+            self.__add_stat("Number of files", 1)
+            if destination_entry is not None and self.__manifest.is_unchanged(relative_path, source_stat):
+                return
+            if destination_entry is not None and destination_entry.is_dir(follow_symlinks=False):
+                self.__delete(destination, relative_path)
+            logger.debug(f"{'Would copy' if self.__report else 'Copy'} {relative_path}")
+            if not self.__report:
+                self.__copies.append(
+                    self.__executor.submit(self.__copy_file, Path(entry.path), destination, relative_path, source_stat)
+                )
+        else:
+            logger.debug(f"Skipping special file {entry.path}")
+
+    def __copy_file(
+        self,
+        source: Path,
+        destination: Path,
+        relative_path: str,
+        source_stat: os.stat_result,
+    ) -> None:
+        temporary_path = destination.with_name(f".{destination.name}.devsync-tmp")
+        try:
+            copy_file_data(source, temporary_path)
+            with contextlib.suppress(OSError):
+                temporary_path.chmod(stat.S_IMODE(source_stat.st_mode))
+            os.utime(temporary_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+            temporary_path.replace(destination)
+        except OSError as error:
+            temporary_path.unlink(missing_ok=True)
+            self.__count_error(f"Can't copy {source}: {error}")
+            return
+        self.__manifest.record(relative_path, source_stat)
+        self.__add_stat("Number of regular files transferred", 1)
+        self.__add_stat("Total transferred file size", source_stat.st_size)
+
+    def __sync_symlink(self, source: Path, destination: Path, destination_entry: os.DirEntry | None) -> None:
+        link = source.readlink()
+        if destination_entry is not None and destination_entry.is_symlink() and destination.readlink() == link:
+            return
+        logger.debug(f"{'Would link' if self.__report else 'Link'} {destination} -> {link}")
+        if self.__report:
+            return
+        try:
+            if destination_entry is not None:
+                CopyEngine.remove(destination)
+            destination.symlink_to(link)
+        except OSError as error:
+            self.__count_error(f"Can't create symlink {destination}: {error}")
+
+    def __delete(self, path: Path, relative_path: str) -> None:
+        logger.debug(f"{'Would delete' if self.__report else 'Delete'} {relative_path}")
+        if not self.__report:
+            try:
+                CopyEngine.remove(path)
+            except OSError as error:
+                self.__count_error(f"Can't delete {path}: {error}")
+                return
+            self.__manifest.forget(relative_path)
+        self.__add_stat("Number of deleted files", 1)
+
+    def __add_stat(self, name: str, value: int) -> None:
+        with self.__lock:
+            self.__stats[name] += value
+
+    def __count_error(self, message: str) -> None:
+        logger.error(message)
+        self.__add_stat("Number of errors", 1)
+
+    @staticmethod
+    def remove(path: Path) -> None:
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+
+    @staticmethod
+    def without_excluded(entries: dict[str, os.DirEntry], relative: str, excludes: Excludes) -> dict[str, os.DirEntry]:
+        return {
+            name: entry
+            for name, entry in entries.items()
+            if not excludes.matches(f"{relative}/{name}" if relative else name, CopyEngine.is_dir(entry))
+        }
+
+    @staticmethod
+    def is_dir(entry: os.DirEntry) -> bool:
+        try:
+            return entry.is_dir(follow_symlinks=False)
+        except OSError:
+            return False
+
+    @staticmethod
+    def list_entries(path: Path) -> dict[str, os.DirEntry]:
+        with os.scandir(path) as entries:
+            return {entry.name: entry for entry in entries}
@@ -0,0 +1,123 @@
+import fnmatch
+import re
+from collections.abc import Iterable
+from pathlib import Path
+from typing import NamedTuple
+
+from devsync.log import logger
+
+IGNORE_FILE = ".devsyncignore"
+
+
+class ExcludeRule(NamedTuple):
+    base: tuple[str, ...]  # Directory the rule applies below, relative to the backup folder
+    parts: tuple[re.Pattern, ...]
+    anchored: bool
+    directories_only: bool
+    pattern: str
+
+
+class Excludes:
+    """Glob patterns of paths to leave out of discovery and sync, following the exclude
+    rules of rsync.
+
+    A pattern without a slash matches a name at any depth, like ``node_modules`` or
+    ``*.pyc``. A leading slash anchors it at the directory it was defined for, and a
+    pattern with an inner slash matches the end of the path. A trailing slash limits it to
+    directories. Patterns of an ``.devsyncignore`` file apply below its directory. Exact
+    paths like the ones of repositories are looked up without matching.
+    """
+
+    def __init__(self, rules: tuple[ExcludeRule, ...] = (), paths: frozenset[str] = frozenset()):
+        self.__rules = rules
+        self.__paths = paths
+
+    @staticmethod
+    def from_patterns(patterns: Iterable[str], base: str = "") -> "Excludes":
+        return Excludes().extend(patterns, base)
+
+    @property
+    def patterns(self) -> list[str]:
+        return [rule.pattern for rule in self.__rules]
+
+    def __bool__(self) -> bool:
+        return bool(self.__rules or self.__paths)
+
+    def with_paths(self, paths: Iterable[str]) -> "Excludes":
+        """Excludes that also leave out the given paths relative to the backup folder."""
+        return Excludes(self.__rules, self.__paths | frozenset(paths))
+
+    def extend(self, patterns: Iterable[str], base: str = "") -> "Excludes":
+        """Excludes with additional patterns that apply below ``base``."""
+        base_parts = tuple(part for part in base.split("/") if part)
+        rules = []
+        for line in patterns:
+            pattern = line.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            directories_only = pattern.endswith("/")
+            anchored = pattern.startswith("/")
+            parts = tuple(re.compile(fnmatch.translate(part)) for part in pattern.strip("/").split("/"))
+            rules.append(ExcludeRule(base_parts, parts, anchored, directories_only, pattern))
+        return Excludes(self.__rules + tuple(rules), self.__paths) if rules else self
+
+    def with_ignore_file(self, directory: Path, relative: str) -> "Excludes":
+        """Add the patterns of the ignore file in ``directory``, which is at ``relative``
+        below the backup folder."""
+        try:
+            patterns = (directory / IGNORE_FILE).read_text().splitlines()
+        except FileNotFoundError:
+            return self
+        except (OSError, ValueError) as error:
+            logger.warning(f"Can't read {directory / IGNORE_FILE}: {error}")
+            return self
+        return self.extend(patterns, relative)
+
+    def matches(self, relative_path: str, is_dir: bool) -> bool:
+        """Whether the path relative to the backup folder is excluded."""
+        if relative_path in self.__paths:
+            return True
+        if not self.__rules:
+            return False
+        path_parts = relative_path.split("/")
+        return any(Excludes.match_rule(rule, path_parts, is_dir) for rule in self.__rules)
+
+    @staticmethod
+    def match_rule(rule: ExcludeRule, path_parts: list[str], is_dir: bool) -> bool:
+        if rule.directories_only and not is_dir:
+            return False
+        if tuple(path_parts[: len(rule.base)]) != rule.base:
+            return False
+        parts = path_parts[len(rule.base) :]
+        if len(parts) < len(rule.parts) or (rule.anchored and len(parts) != len(rule.parts)):
+            return False
+        tail = parts[-len(rule.parts) :]
+        return all(part.match(name) for part, name in zip(rule.parts, tail, strict=True))
+
+    def is_excluded(self, folder: Path, relative_path: str) -> bool:
+        """Whether the directory or one of its parents is excluded, including the patterns
+        of the ignore files on the way."""
+        excludes = self.with_ignore_file(folder, "")
+        parts = [part for part in relative_path.split("/") if part]
+        for index in range(len(parts)):
+            relative = "/".join(parts[: index + 1])
+            if excludes.matches(relative, is_dir=True):
+                return True
+            excludes = excludes.with_ignore_file(folder / relative, relative)
+        return False
+
+    def get_rsync_rules(self, prefix: str) -> list[str]:
+        """Exclude rules for rsync with the backup folder at ``prefix`` below the transfer
+        root, e.g. ``/Development`` or empty if the folder is the transfer root. Exact
+        paths are left out, they need escaping and are anchored by the caller."""
+        rules = []
+        for rule in self.__rules:
+            pattern = rule.pattern.strip()
+            base = "".join(f"/{part}" for part in rule.base)
+            if pattern.startswith("/"):
+                rules.append(f"{prefix}{base}{pattern}")
+            elif prefix or base:
+                rules.extend([f"{prefix}{base}/{pattern}", f"{prefix}{base}/**/{pattern}"])
+            else:
+                rules.append(pattern)
+        return rules
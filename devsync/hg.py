@@ -0,0 +1,179 @@
+import math
+import os
+import struct
+import subprocess
+import threading
+from typing import IO, NamedTuple
+
+from devsync.log import logger
+from devsync.runner import command_runner
+
+# Open heads with their unix time and the default path, tab separated as branch names
+# may contain spaces
+HG_STATE_REVSET = "head() and not closed()"
+HG_STATE_TEMPLATE = "{node}\\t{date|hgdate}\\t{branch}\\t{get(peerurls, 'default')}\\n"
+HG_ENV = {"HGPLAIN": "1", "HGENCODING": "UTF-8"}  # Untranslated output without user aliases
+
+
+class HgState(NamedTuple):
+    commit_time: float
+    refs: dict[str, str]
+    url: str
+
+
+def parse_hg_state(output: str) -> HgState:
+    """Parse the output of ``hg log`` with ``HG_STATE_TEMPLATE``."""
+    commit_time = 0.0
+    refs = {}
+    url = ""
+    for line in output.splitlines():
+        node, hg_date, branch, url = line.split("\t", 3)
+        refs[f"{branch}/{node[:12]}"] = node
+        commit_time = max(commit_time, float(hg_date.split(" ", 1)[0]))
+    return HgState(commit_time, refs, url)
+
+
+class HgCommandServer:
+    """A single ``hg serve --cmdserver pipe`` process that runs hg commands for all repos.
+
+    Every hg process spends a good part of its runtime on starting Python and loading
+    extensions. The command server pays that once and then runs the queries of all repos,
+    one at a time. If it can't be started, ``run`` raises ``OSError`` and callers fall
+    back to separate hg processes. A command that takes longer than the timeout of the
+    command runner kills the server, it is started again for the next command.
+    """
+
+    COMMAND = ("hg", "serve", "--cmdserver", "pipe", "--config", "ui.interactive=False")
+    HEADER = struct.Struct(">cI")  # Channel and length of a message
+
+    def __init__(self, command: tuple[str, ...] = COMMAND):
+        self.__command = command
+        self.__lock = threading.Lock()
+        self.__process: subprocess.Popen | None = None
+        self.__failed = False
+
+    def run(self, args: list[str]) -> str:
+        """Run an hg command like ``["-R", path, "log"]`` and return its output.
+
+        Raises ``CalledProcessError`` if the command fails.
+        """
+        with self.__lock:
+            process = self.__get_process()
+            expired = threading.Event()
+            watchdog = HgCommandServer.start_watchdog(process, expired)
+            try:
+                output, error, return_code = self.__run_command(process, args)
+            except (OSError, struct.error, ValueError) as exception:
+                # A hung command, e.g. waiting on a repo lock, says nothing about the server
+                self.__stop(failed=not expired.is_set())
+                reason = f"timed out after {command_runner.timeout}s" if expired.is_set() else exception
+                msg = f"hg command server stopped: {reason}"
+                raise OSError(msg) from exception
+            finally:
+                if watchdog is not None:
+                    watchdog.cancel()
+            if expired.is_set():
+                self.__stop(failed=False)  # Killed right after the command finished
+        if error:
+            logger.debug(error.rstrip())
+        if return_code:
+            raise subprocess.CalledProcessError(return_code, ["hg", *args], output, error)
+        return output
+
+    @staticmethod
+    def start_watchdog(process: subprocess.Popen, expired: threading.Event) -> threading.Timer | None:
+        """Kill the server once the timeout of the command runner passed, which ends the
+        blocking reads of its output."""
+        timeout = command_runner.timeout
+        if timeout is None or math.isinf(timeout):
+            return None
+
+        def expire() -> None:
+            expired.set()
+            process.kill()
+
+        watchdog = threading.Timer(timeout, expire)
+        watchdog.daemon = True
+        watchdog.start()
+        return watchdog
+
+    def close(self) -> None:
+        with self.__lock:
+            self.__stop(failed=False)
+
+    def __get_process(self) -> subprocess.Popen:
+        if self.__failed:
+            msg = "hg command server is not available"
+            raise OSError(msg)
+        if self.__process is None:
+            try:
+                self.__process = subprocess.Popen(
+                    self.__command,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    env={**os.environ, **HG_ENV},
+                )
+                self.read_hello(self.__process.stdout)
+            except (OSError, struct.error, ValueError) as exception:
+                self.__stop(failed=True)
+                logger.verbose(f"Can't start hg command server, running hg for each command: {exception}")
+                raise OSError(str(exception)) from exception
+            logger.debug("Started hg command server")
+        return self.__process
+
+    def __run_command(self, process: subprocess.Popen, args: list[str]) -> tuple[str, str, int]:
+        data = "\0".join(args).encode("utf-8")
+        process.stdin.write(b"runcommand\n" + struct.pack(">I", len(data)) + data)
+        process.stdin.flush()
+        output = bytearray()
+        error = bytearray()
+        while True:
+            channel, message = self.read_message(process.stdout)
+            if channel == b"o":
+                output += message
+            elif channel == b"e":
+                error += message
+            elif channel == b"r":
+                return_code = struct.unpack(">i", message)[0]
+                return output.decode("utf-8", errors="replace"), error.decode("utf-8", errors="replace"), return_code
+            elif channel in b"IL":
+                # hg asks for input, answer with end of file
+                process.stdin.write(struct.pack(">I", 0))
+                process.stdin.flush()
+            elif channel.isupper():
+                msg = f"unsupported required channel {channel!r}"
+                raise ValueError(msg)
+
+    @staticmethod
+    def read_hello(stream: IO[bytes]) -> None:
+        channel, hello = HgCommandServer.read_message(stream)
+        if channel != b"o" or b"runcommand" not in hello:
+            msg = f"unexpected hello from hg command server: {hello!r}"
+            raise ValueError(msg)
+
+    @staticmethod
+    def read_message(stream: IO[bytes]) -> tuple[bytes, bytes]:
+        channel, length = HgCommandServer.HEADER.unpack(stream.read(HgCommandServer.HEADER.size))
+        if channel in b"IL":
+            return channel, b""  # Input requests carry the requested size but no data
+        message = stream.read(length)
+        if len(message) != length:
+            msg = "hg command server closed the connection"
+            raise ValueError(msg)
+        return channel, message
+
+    def __stop(self, failed: bool) -> None:
+        self.__failed = self.__failed or failed
+        if self.__process is None:
+            return
+        process, self.__process = self.__process, None
+        process.stdin.close()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+hg_command_server = HgCommandServer()
@@ -0,0 +1,73 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from devsync.log import logger
+
+
+class DiscoveryIndex:
+    """On-disk record of every directory visited during repository discovery.
+
+    Each directory is stored with its mtime, its kind (``git``, ``hg``, ``svn``, ``ignore``
+    for plain directories with an ignore file or empty for other plain directories) and
+    the names of the subdirectories to descend into. A directory whose mtime is unchanged
+    since the last run can be reused without listing it again.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: Path):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__visited: set[str] = set()
+        self.__directories: dict[str, tuple[int, str, list[str]]] = self.load(path)
+
+    @property
+    def path(self) -> Path:
+        return self.__path
+
+    @staticmethod
+    def load(path: Path) -> dict[str, tuple[int, str, list[str]]]:
+        try:
+            content = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(content, dict) or content.get("version") != DiscoveryIndex.VERSION:
+            logger.verbose(f"Ignoring discovery index {path} with unknown format")
+            return {}
+        return {directory: tuple(entry) for directory, entry in content["directories"].items()}
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__directories.clear()
+
+    def lookup(self, directory: str, mtime_ns: int) -> tuple[str, list[str]] | None:
+        entry = self.__directories.get(directory)
+        if entry is None or entry[0] != mtime_ns:
+            return None
+        with self.__lock:
+            self.__visited.add(directory)
+        return entry[1], entry[2]
+
+    def record(self, directory: str, mtime_ns: int, kind: str, subdirectories: list[str]) -> None:
+        with self.__lock:
+            self.__directories[directory] = (mtime_ns, kind, subdirectories)
+            self.__visited.add(directory)
+
+    def save(self, roots: list[Path]) -> None:
+        """Write the index, dropping directories below ``roots`` that were not visited."""
+        scanned_roots = tuple(str(root) for root in roots)
+        directories = {
+            directory: entry
+            for directory, entry in self.__directories.items()
+            if directory in self.__visited or not DiscoveryIndex.is_below(directory, scanned_roots)
+        }
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.__path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps({"version": DiscoveryIndex.VERSION, "directories": directories}))
+        temporary_path.replace(self.__path)
+
+    @staticmethod
+    def is_below(directory: str, roots: tuple[str, ...]) -> bool:
+        return any(directory == root or directory.startswith(root.rstrip(os.sep) + os.sep) for root in roots)
@@ -1,26 +1,93 @@
+import contextlib
+import contextvars
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import threading
+from collections.abc import Iterator
 from pathlib import Path
 
-import coloredlogs
 from verboselogs import VerboseLogger
 
 from devsync.config import LOGFILE, NAME
 
 
-def init_logging(logfile: Path) -> VerboseLogger:
+class OutputGroups(logging.Filter):
+    """Hold back the records of grouped threads and release them as one block.
+
+    The group lives in a context variable, so records logged on behalf of the thread,
+    like the output of its commands streamed by the command runner, join its group.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.__lock = threading.Lock()
+        self.__release_lock = threading.Lock()
+        self.__group: contextvars.ContextVar[list[logging.LogRecord] | None] = contextvars.ContextVar(
+            "output_group", default=None
+        )
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        group = self.__group.get()
+        if group is None:
+            return True
+        with self.__lock:
+            group.append(record)
+        return False
+
+    @contextlib.contextmanager
+    def group(self, dev_sync_logger: logging.Logger) -> Iterator[None]:
+        token = self.__group.set([])
+        try:
+            yield
+        finally:
+            with self.__lock:
+                records = list(self.__group.get())
+            self.__group.reset(token)
+            with self.__release_lock:
+                for record in records:
+                    dev_sync_logger.handle(record)
+
+
+output_groups = OutputGroups()
+
+
+def create_logger() -> VerboseLogger:
+    """Logger without handlers, so importing devsync has no side effects. Records only
+    reach the terminal and the logfile after init_logging was called."""
     dev_sync_logger = VerboseLogger(NAME)
+    dev_sync_logger.setLevel(logging.DEBUG)
+    dev_sync_logger.addFilter(output_groups)
+    return dev_sync_logger
+
+
+logger = create_logger()
+
+
+def init_logging(logfile: Path = LOGFILE) -> VerboseLogger:
+    """Log to the terminal and to the logfile, replacing the handlers of an earlier call.
+
+    coloredlogs and the rotating file handler are imported here, as they are only needed
+    for an actual run and are slow to import.
+    """
+    from logging.handlers import TimedRotatingFileHandler
+
+    import coloredlogs
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
 
     logfile.parent.mkdir(exist_ok=True, parents=True)
 
-    coloredlogs.install(level="DEBUG", milliseconds=True, logger=dev_sync_logger)
-    dev_sync_logger.setLevel(logging.DEBUG)
+    coloredlogs.install(level="DEBUG", milliseconds=True, logger=logger)
+    logger.setLevel(logging.DEBUG)
 
     file_handler = TimedRotatingFileHandler(logfile, when="MIDNIGHT")
     file_handler.setFormatter(logging.Formatter(coloredlogs.DEFAULT_LOG_FORMAT))
-    dev_sync_logger.addHandler(file_handler)
+    logger.addHandler(file_handler)
 
-    return dev_sync_logger
+    return logger
 
 
-logger = init_logging(LOGFILE)
+def grouped_output() -> contextlib.AbstractContextManager[None]:
+    """Keep everything the current thread logs together until the block is left."""
+    return output_groups.group(logger)
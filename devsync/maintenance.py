@@ -0,0 +1,143 @@
+import dataclasses
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from devsync.log import logger
+from devsync.report import RunReport
+from devsync.runner import NO_TIMEOUT, Command, command_runner
+
+LOOSE_SAMPLE_DIRECTORY = "17"  # Fan-out directory git gc --auto counts to estimate all loose objects
+FAN_OUT_DIRECTORIES = 256
+LOOSE_OBJECT_NAME_LENGTH = 38  # Hex digits of a SHA-1 after the fan-out directory
+IDLE_IO_PRIORITY = ["ionice", "-c", "3"]
+
+
+@dataclasses.dataclass(frozen=True)
+class MaintenancePolicy:
+    """Thresholds from which a repo on the target is repacked, by default the ones of
+    ``git gc --auto``."""
+
+    loose_objects: int = 6700
+    packs: int = 50
+    prune_expire: str = "2.weeks.ago"  # Unreachable objects younger than this are kept
+
+
+@dataclasses.dataclass(frozen=True)
+class PackStats:
+    loose_objects: int  # Estimated like git gc --auto
+    packs: int
+    pack_bytes: int
+    commit_graph: bool
+    multi_pack_index: bool
+
+    @staticmethod
+    def read(git_dir: Path) -> "PackStats":
+        objects = git_dir / "objects"
+        try:
+            with os.scandir(objects / LOOSE_SAMPLE_DIRECTORY) as entries:
+                sample = sum(len(entry.name) == LOOSE_OBJECT_NAME_LENGTH for entry in entries)
+        except OSError:
+            sample = 0
+        packs = list((objects / "pack").glob("*.pack"))
+        return PackStats(
+            sample * FAN_OUT_DIRECTORIES,
+            len(packs),
+            sum(pack.stat().st_size for pack in packs),
+            (objects / "info" / "commit-graph").exists() or (objects / "info" / "commit-graphs").is_dir(),
+            (objects / "pack" / "multi-pack-index").exists(),
+        )
+
+
+def get_git_dir(repo_path: Path) -> Path | None:
+    """Object store of a working copy or mirror, None for Mercurial repos and bundles."""
+    if (repo_path / ".git" / "objects").is_dir():
+        return repo_path / ".git"
+    if (repo_path / "objects").is_dir() and (repo_path / "HEAD").is_file():
+        return repo_path
+    return None
+
+
+class RepoMaintenance:
+    """Keep the Git repos on the target fast to fetch into.
+
+    Fetches leave loose objects and a new pack behind every time. A repo past the
+    thresholds of the policy is repacked, all packs into one if there are too many,
+    unreachable objects are pruned and the commit-graph and multi-pack-index are
+    rewritten. Up to ``jobs`` repos are maintained at once with idle I/O priority, so the
+    backup of the next target or the desktop stays responsive.
+    """
+
+    def __init__(self, policy: MaintenancePolicy | None = None, jobs: int = 1):
+        self.__policy = policy or MaintenancePolicy()
+        self.__jobs = max(jobs, 1)
+        self.__io_priority = IDLE_IO_PRIORITY if shutil.which(IDLE_IO_PRIORITY[0]) else []
+
+    def is_due(self, stats: PackStats) -> bool:
+        return stats.loose_objects > self.__policy.loose_objects or stats.packs > self.__policy.packs
+
+    def get_commands(self, stats: PackStats) -> list[list[str]]:
+        repack = ["repack", "-d", "-l", *(["-a"] if stats.packs > self.__policy.packs else [])]
+        return [
+            repack,
+            ["prune", f"--expire={self.__policy.prune_expire}"],
+            ["commit-graph", "write", "--reachable"],
+            ["multi-pack-index", "write"],
+        ]
+
+    def maintain_repos(
+        self,
+        target_root: Path,
+        relative_repo_paths: list[Path],
+        report: bool,
+        run_report: RunReport | None = None,
+    ) -> None:
+        """Maintain the repos at the relative paths on the target that are past the
+        thresholds, their pack statistics before and after are added to the run report."""
+        run_report = run_report or RunReport()
+        due = []
+        for relative in relative_repo_paths:
+            git_dir = get_git_dir(target_root / relative)
+            stats = PackStats.read(git_dir) if git_dir is not None else None
+            if stats is not None and self.is_due(stats):
+                due.append((relative, git_dir, stats))
+        if not due:
+            logger.verbose(f"None of the {len(relative_repo_paths)} updated repos needs maintenance")
+            return
+        logger.info(f"Maintaining {len(due)} Git repos on the target...\n")
+        if report:
+            for relative, _, stats in due:
+                logger.info(f"\tWould repack {relative}: {stats.loose_objects} loose objects, {stats.packs} packs\n")
+            return
+
+        def maintain(item: tuple[Path, Path, PackStats]) -> None:
+            relative, git_dir, before = item
+            start = time.perf_counter()
+            error = self.maintain(git_dir, before)
+            after = PackStats.read(git_dir)
+            duration = time.perf_counter() - start
+            run_report.add_maintenance(relative, dataclasses.asdict(before), dataclasses.asdict(after), duration, error)
+
+        with ThreadPoolExecutor(max_workers=self.__jobs) as executor:
+            list(executor.map(maintain, due))
+
+    def maintain(self, git_dir: Path, stats: PackStats) -> str:
+        """Run the maintenance commands on the repo, returns the error if one failed."""
+        name = git_dir.parent.name if git_dir.name == ".git" else git_dir.name
+        try:
+            for command in self.get_commands(stats):
+                command_runner.run(
+                    Command(
+                        [*self.__io_priority, "git", f"--git-dir={git_dir}", *command],
+                        git_dir,
+                        prefix=name,
+                        timeout=NO_TIMEOUT,
+                    )
+                )
+        except (subprocess.SubprocessError, OSError) as error:
+            logger.warning(f"\tMaintenance of {git_dir} failed: {error}\n")
+            return str(error)
+        return ""
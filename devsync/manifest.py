@@ -0,0 +1,46 @@
+import json
+import threading
+from pathlib import Path
+
+from devsync.log import logger
+
+
+class SyncManifest:
+    """Refs of every repository at its last successful update, stored on the target."""
+
+    VERSION = 1
+    FILENAME = "manifest.json"
+
+    def __init__(self, state_dir: Path):
+        self.__path = state_dir / SyncManifest.FILENAME
+        self.__lock = threading.Lock()
+        self.__repos: dict[str, dict[str, str]] = self.load(self.__path)
+
+    @property
+    def path(self) -> Path:
+        return self.__path
+
+    @staticmethod
+    def load(path: Path) -> dict[str, dict[str, str]]:
+        try:
+            content = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(content, dict) or content.get("version") != SyncManifest.VERSION:
+            logger.warning(f"Ignoring sync manifest {path} with unknown format")
+            return {}
+        return content["repos"]
+
+    def get(self, relative_repo_path: Path) -> dict[str, str] | None:
+        return self.__repos.get(str(relative_repo_path))
+
+    def record(self, relative_repo_path: Path, refs: dict[str, str]) -> None:
+        with self.__lock:
+            self.__repos[str(relative_repo_path)] = refs
+
+    def save(self) -> None:
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.__path.with_suffix(".tmp")
+        with self.__lock:
+            temporary_path.write_text(json.dumps({"version": SyncManifest.VERSION, "repos": self.__repos}, indent=1))
+        temporary_path.replace(self.__path)
@@ -1,8 +1,11 @@
+import dataclasses
 from pathlib import Path
 
-import yaml
-
 from devsync.data import BackupFolder
+from devsync.excludes import Excludes
+from devsync.maintenance import MaintenancePolicy
+from devsync.profiles import PROFILES, TargetProfile
+from devsync.snapshots import RetentionPolicy
 
 
 class YMLConfigParser:
@@ -11,11 +14,62 @@ class YMLConfigParser:
 
     @staticmethod
     def get_yaml_content(filename: Path):
+        import yaml
+
         return yaml.load(filename.read_bytes(), Loader=yaml.FullLoader)
 
     def parse_backup_folder(self) -> list[BackupFolder]:
+        """Backup folders with the global exclude patterns followed by their own."""
         backup_folders = self.__content["backupFolder"]
-        return [BackupFolder(self.parse_home(), element["path"]) for element in backup_folders]
+        excludes = Excludes.from_patterns(self.__content.get("exclude", []))
+        return [
+            BackupFolder(self.parse_home(), element["path"], excludes.extend(element.get("exclude", [])))
+            for element in backup_folders
+        ]
 
     def parse_home(self) -> Path:
         return Path(self.__content["home"])
+
+    def parse_target_profile(self) -> str:
+        return self.__content.get("targetProfile", "")
+
+    def parse_profiles(self) -> dict[str, TargetProfile]:
+        """Built-in target profiles together with the ones defined in the config."""
+        profiles = dict(PROFILES)
+        for name, settings in self.__content.get("profiles", {}).items():
+            if "base" in settings and settings["base"] not in profiles:
+                msg = f"Unknown base {settings['base']} of profile {name}, choose from {', '.join(profiles)}"
+                raise ValueError(msg)
+            base = profiles[settings["base"]] if "base" in settings else TargetProfile(name)
+            profiles[name] = dataclasses.replace(
+                base,
+                name=name,
+                whole_file=settings.get("wholeFile", base.whole_file),
+                compress=settings.get("compress", base.compress),
+                inplace=settings.get("inplace", base.inplace),
+                checksum=settings.get("checksum", base.checksum),
+                modify_window=settings.get("modifyWindow", base.modify_window),
+                output=settings.get("output", base.output),
+            )
+            if profiles[name].output not in TargetProfile.OUTPUTS:
+                msg = f"Invalid output {profiles[name].output} of profile {name}, choose from {TargetProfile.OUTPUTS}"
+                raise ValueError(msg)
+        return profiles
+
+    def parse_maintenance(self) -> MaintenancePolicy:
+        maintenance = self.__content.get("maintenance", {})
+        default = MaintenancePolicy()
+        return MaintenancePolicy(
+            loose_objects=maintenance.get("looseObjects", default.loose_objects),
+            packs=maintenance.get("packs", default.packs),
+            prune_expire=maintenance.get("pruneExpire", default.prune_expire),
+        )
+
+    def parse_snapshot_retention(self) -> RetentionPolicy:
+        retention = self.__content.get("snapshotRetention", {})
+        default = RetentionPolicy()
+        return RetentionPolicy(
+            daily=retention.get("daily", default.daily),
+            weekly=retention.get("weekly", default.weekly),
+            monthly=retention.get("monthly", default.monthly),
+        )
@@ -0,0 +1,202 @@
+import dataclasses
+import os
+from pathlib import Path
+
+from devsync.changes import ChangeJournal, SyncStamp
+from devsync.config import CHANGE_JOURNAL, DISCOVERY_INDEX, REF_CACHE, RUN_HISTORY
+from devsync.data import BackupFolder, GitRepo, Repo, Target, find_repos_in_backup_folders
+from devsync.index import DiscoveryIndex
+from devsync.log import logger
+from devsync.manifest import SyncManifest
+from devsync.parser import YMLConfigParser
+from devsync.schedule import CostModel
+from devsync.snapshots import SnapshotStore
+from devsync.staleness import get_ref_fingerprint, ref_cache
+
+
+@dataclasses.dataclass(frozen=True)
+class PlannedRepo:
+    path: str  # Relative to the home folder
+    action: str  # clone, pull or check, i.e. ask git or hg whether it changed
+    reason: str
+    seconds: float
+
+
+@dataclasses.dataclass(frozen=True)
+class PlannedFolder:
+    name: str
+    action: str  # sync or skip
+    reason: str
+    bytes: int
+    seconds: float
+
+
+@dataclasses.dataclass
+class BackupPlan:
+    """What a backup would do, with sizes and durations estimated from earlier runs."""
+
+    repos: list[PlannedRepo]
+    folders: list[PlannedFolder]
+    unchanged_repos: int = 0
+    jobs: int = 1
+
+    @property
+    def bytes(self) -> int:
+        return sum(folder.bytes for folder in self.folders)
+
+    @property
+    def seconds(self) -> float:
+        """Repos are updated by ``jobs`` workers, the folders synced after them."""
+        repo_seconds = sum(repo.seconds for repo in self.repos) / max(self.jobs, 1)
+        return repo_seconds + sum(folder.seconds for folder in self.folders)
+
+    def to_dict(self) -> dict:
+        return {
+            "repos": [dataclasses.asdict(repo) for repo in self.repos],
+            "unchanged_repos": self.unchanged_repos,
+            "folders": [dataclasses.asdict(folder) for folder in self.folders],
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 1),
+        }
+
+    def format_table(self) -> str:
+        lines = [f"Repos: {len(self.repos)} to update, {self.unchanged_repos} unchanged"]
+        if self.repos:
+            lines.append(f"  {'ACTION':<7} {'TIME':>8}  {'PATH':<40} REASON")
+            lines.extend(
+                f"  {repo.action:<7} {format_duration(repo.seconds):>8}  {repo.path:<40} {repo.reason}"
+                for repo in self.repos
+            )
+        lines.append(f"Folders: {sum(folder.action == 'sync' for folder in self.folders)} to sync")
+        if self.folders:
+            lines.append(f"  {'ACTION':<7} {'TIME':>8}  {'SIZE':>10}  {'NAME':<28} REASON")
+            lines.extend(
+                f"  {folder.action:<7} {format_duration(folder.seconds):>8}  {format_size(folder.bytes):>10}  "
+                f"{folder.name:<28} {folder.reason}"
+                for folder in self.folders
+            )
+        lines.append(f"Total: {format_size(self.bytes)} in about {format_duration(self.seconds)}")
+        return "\n".join(lines)
+
+
+def format_size(size: float) -> str:
+    return f"{size / 1e6:.1f} MB"
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
+class Planner:
+    """Plan a backup from the state earlier runs left behind, without running git, hg or
+    rsync.
+
+    A Git repo is pulled if its refs in the ref cache differ from the ones recorded in the
+    sync manifest on the target, and cloned if it is missing there. Repos whose refs were
+    modified since the ref cache was written and Mercurial repos are listed as ``check``,
+    the backup asks git or hg whether they changed. Changed folders and their size come
+    from the change journal of the watcher, without one every folder is scanned and its
+    size is the mean of its recent transfers.
+    """
+
+    def __init__(self, home: Path, backup_folders: list[BackupFolder], target: Target, model: CostModel):
+        self.__home = home
+        self.__backup_folders = backup_folders
+        self.__target = target
+        self.__model = model
+
+    def plan(self, jobs: int = 1) -> BackupPlan:
+        manifest = SyncManifest(self.__target.state_dir)
+        repos = [repo for element in self.__backup_folders for repo in element.repos]
+        planned = [self.plan_repo(repo, manifest) for repo in repos]
+        changed = [repo for repo in planned if repo is not None]
+        changed.sort(key=lambda repo: (repo.action, repo.path))
+        return BackupPlan(changed, self.plan_folders(), len(repos) - len(changed), jobs)
+
+    def plan_repo(self, repo: Repo, manifest: SyncManifest) -> PlannedRepo | None:
+        """What the backup would do with the repo, None if it is up to date."""
+        relative = repo.path.relative_to(self.__home)
+        estimate = self.__model.repo(relative.as_posix())
+        recorded_refs = manifest.get(relative)
+        if recorded_refs is None and not repo.get_repo_target_path(self.__home, self.__target).exists():
+            return PlannedRepo(relative.as_posix(), "clone", "not on the target", estimate.cost)
+        refs = Planner.get_cached_refs(repo)
+        if refs is None or recorded_refs is None:
+            reason = "no recorded refs" if recorded_refs is None else f"{repo.repo_type} refs not cached"
+            return PlannedRepo(relative.as_posix(), "check", reason, estimate.cost * estimate.churn)
+        if refs == recorded_refs:
+            return None
+        changed = {name for name in refs.keys() | recorded_refs.keys() if refs.get(name) != recorded_refs.get(name)}
+        return PlannedRepo(relative.as_posix(), "pull", f"{len(changed)} refs changed", estimate.cost)
+
+    @staticmethod
+    def get_cached_refs(repo: Repo) -> dict[str, str] | None:
+        """Refs of a Git repo from the ref cache, None if they changed since it was written."""
+        if not isinstance(repo, GitRepo):
+            return None
+        ref_state = ref_cache.get(repo.path, get_ref_fingerprint(repo.path / ".git"))
+        return None if ref_state is None else ref_state.refs
+
+    def plan_folders(self) -> list[PlannedFolder]:
+        dirty = self.get_dirty()
+        if dirty is None:
+            return [
+                PlannedFolder(
+                    element.path.name,
+                    "sync",
+                    "full scan",
+                    round(self.__model.transferred_bytes(element.path.name)),
+                    self.__model.folder(element.path.name).cost,
+                )
+                for element in self.__backup_folders
+            ]
+        last_sync, directories = dirty
+        return [self.plan_changed_folder(element, directories, last_sync) for element in self.__backup_folders]
+
+    def get_dirty(self) -> tuple[float, list[Path]] | None:
+        """Time of the last sync and the directories changed since, None if everything is
+        scanned."""
+        if (self.__target.path / SnapshotStore.DIRECTORY).exists():
+            logger.verbose("Snapshots are always scanned completely")
+            return None
+        last_sync = SyncStamp(self.__target.state_dir).load()
+        if last_sync is None:
+            return None
+        roots = [element.path for element in self.__backup_folders]
+        directories = ChangeJournal(CHANGE_JOURNAL).get_dirty(roots, last_sync)
+        return None if directories is None else (last_sync, directories)
+
+    def plan_changed_folder(self, element: BackupFolder, directories: list[Path], last_sync: float) -> PlannedFolder:
+        estimate = self.__model.folder(element.path.name)
+        changed = [
+            directory
+            for directory in directories
+            if directory.is_relative_to(element.path)
+            and not any(directory.is_relative_to(repo.path) for repo in element.repos)
+        ]
+        if not changed:
+            return PlannedFolder(element.path.name, "skip", "no changes recorded by the watcher", 0, 0.0)
+        size = sum(Planner.get_changed_size(directory, last_sync) for directory in changed)
+        return PlannedFolder(element.path.name, "sync", f"{len(changed)} changed directories", size, estimate.cost)
+
+    @staticmethod
+    def get_changed_size(directory: Path, since: float) -> int:
+        """Size of the files directly in the directory modified since the given time."""
+        since_ns = int((since - ChangeJournal.SAFETY_MARGIN) * 1e9)
+        try:
+            with os.scandir(directory) as entries:
+                stats = [entry.stat(follow_symlinks=False) for entry in entries if entry.is_file(follow_symlinks=False)]
+        except OSError:
+            return 0  # Deleted since
+        return sum(entry_stat.st_size for entry_stat in stats if entry_stat.st_mtime_ns >= since_ns)
+
+
+def create_plan(parser: YMLConfigParser, target: Target, jobs: int) -> BackupPlan:
+    """Plan a backup of the config to the target from the discovery index, the ref cache,
+    the manifests on the target and the run history."""
+    home = parser.parse_home()
+    backup_folders = parser.parse_backup_folder()
+    find_repos_in_backup_folders(backup_folders, jobs, DiscoveryIndex(DISCOVERY_INDEX))
+    ref_cache.load(REF_CACHE)
+    return Planner(home, backup_folders, target, CostModel.load(RUN_HISTORY)).plan(jobs)
@@ -0,0 +1,92 @@
+import dataclasses
+from pathlib import Path
+
+PROC_MOUNTS = Path("/proc/mounts")
+FAT_FILESYSTEMS = {"vfat", "msdos", "exfat", "fat"}
+NETWORK_FILESYSTEMS = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "sshfs", "9p"}
+MOUNT_FIELDS = 3  # Device, mount point and filesystem type at the start of each /proc/mounts line
+
+
+@dataclasses.dataclass(frozen=True)
+class TargetProfile:
+    """Rsync transfer strategy for a kind of target."""
+
+    name: str
+    whole_file: bool = True  # Copy whole files instead of using the delta algorithm
+    compress: bool = False  # Compress file data during the transfer
+    inplace: bool = False  # Update files in place instead of writing a temporary copy
+    checksum: bool = False  # Compare checksums instead of size and modification time
+    modify_window: int = 0  # Seconds modification times may differ and still be equal
+    output: str = "verbose"  # verbose: every file with progress, summary: overall progress, quiet: stats only
+
+    OUTPUTS = ("verbose", "summary", "quiet")
+
+    def get_options(self) -> list[str]:
+        options = ["--whole-file" if self.whole_file else "--no-whole-file"]
+        if self.compress:
+            options.append("--compress")
+        if self.inplace:
+            options.append("--inplace")
+        if self.checksum:
+            options.append("--checksum")
+        if self.modify_window:
+            options.append(f"--modify-window={self.modify_window}")
+        if self.output == "verbose":
+            options.extend(["-v", "--progress"])
+        elif self.output == "summary":
+            options.append("--info=progress2")
+        return options
+
+
+PROFILES = {
+    # FAT has a 2 second resolution for timestamps and slow random writes
+    "usb-fat": TargetProfile("usb-fat", whole_file=True, modify_window=2, output="verbose"),
+    # Local copies are cheapest without the delta algorithm, writing in place saves the temporary copy
+    "local-ext4": TargetProfile("local-ext4", whole_file=True, inplace=True, output="summary"),
+    # On a mounted network share both ends are local to rsync, the delta algorithm would read every changed
+    # file back over the network and compression only costs CPU
+    "network-mount": TargetProfile("network-mount", whole_file=True, output="summary"),
+    # Only an rsync on the remote host reads the basis files locally, there delta transfer and compression
+    # save most of the bandwidth
+    "remote-ssh": TargetProfile("remote-ssh", whole_file=False, compress=True, output="summary"),
+}
+DEFAULT_PROFILE = PROFILES["usb-fat"]
+
+
+def get_filesystem_type(path: Path) -> str:
+    """Filesystem type of the mount that contains the path or empty if unknown."""
+    try:
+        mounts = PROC_MOUNTS.read_text().splitlines()
+    except OSError:
+        return ""
+    resolved_path = path.resolve()
+    best_match = (-1, "")
+    for mount in mounts:
+        fields = mount.split()
+        if len(fields) < MOUNT_FIELDS:
+            continue
+        mount_point = Path(fields[1].replace("\\040", " "))
+        if resolved_path.is_relative_to(mount_point) and len(mount_point.parts) > best_match[0]:
+            best_match = (len(mount_point.parts), fields[2])
+    return best_match[1]
+
+
+def detect_profile(path: Path) -> TargetProfile:
+    filesystem_type = get_filesystem_type(path)
+    if filesystem_type in FAT_FILESYSTEMS:
+        return PROFILES["usb-fat"]
+    if filesystem_type in NETWORK_FILESYSTEMS:
+        return PROFILES["network-mount"]
+    if filesystem_type:
+        return PROFILES["local-ext4"]
+    return DEFAULT_PROFILE
+
+
+def select_profile(name: str, profiles: dict[str, TargetProfile], target_path: Path) -> TargetProfile:
+    """Profile with the given name or the one detected from the target filesystem."""
+    if name:
+        if name not in profiles:
+            msg = f"Unknown target profile {name}, choose from {', '.join(profiles)}"
+            raise ValueError(msg)
+        return profiles[name]
+    return detect_profile(target_path)
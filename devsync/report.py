@@ -0,0 +1,174 @@
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+
+from devsync.log import logger
+
+
+def get_speedup(stats: dict[str, int]) -> float:
+    """Total file size divided by the bytes on the wire, like the one rsync reports."""
+    traffic = stats.get("Total bytes sent", 0) + stats.get("Total bytes received", 0)
+    return round(stats.get("Total file size", 0) / traffic, 2) if traffic else 0.0
+
+
+class RunReport:
+    """Machine readable performance report of a backup run.
+
+    Holds the wall time of each phase, the transfer statistics and duration per backup
+    folder, the update duration of each repo, the items skipped by a time budget and the
+    pack statistics of the repos maintained on the target.
+    Reports are appended as JSON lines to a history file to compare runs and estimate
+    the cost of the next one.
+    """
+
+    VERSION = 1
+    HISTORY_BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, target: Path | None = None, dry_run: bool = False):
+        self.__lock = threading.Lock()
+        self.__started = datetime.datetime.now(tz=datetime.timezone.utc)
+        self.__start = time.perf_counter()
+        self.__target = target
+        self.__dry_run = dry_run
+        self.__phases: dict[str, float] = {}
+        self.__transfers: dict[str, dict[str, int]] = {}
+        self.__transfer_durations: dict[str, float] = {}
+        self.__repos: dict[str, dict[str, float | str]] = {}
+        self.__skipped: list[str] = []
+        self.__maintenance: dict[str, dict] = {}
+
+    @property
+    def phases(self) -> dict[str, float]:
+        return self.__phases
+
+    @property
+    def transfers(self) -> dict[str, dict[str, int]]:
+        return self.__transfers
+
+    @property
+    def transfer_durations(self) -> dict[str, float]:
+        return self.__transfer_durations
+
+    @property
+    def repos(self) -> dict[str, dict[str, float | str]]:
+        return self.__repos
+
+    @property
+    def skipped(self) -> list[str]:
+        return self.__skipped
+
+    @property
+    def maintenance(self) -> dict[str, dict]:
+        return self.__maintenance
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Measure the wall time of a phase, repeated phases add up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.__phases[name] = self.__phases.get(name, 0.0) + time.perf_counter() - start
+
+    def add_transfer(self, folder: str, stats: dict[str, int], duration: float | None = None) -> None:
+        """Add the statistics of a transfer, several shards of one folder add up."""
+        with self.__lock:
+            totals = self.__transfers.setdefault(folder, {})
+            for name, value in stats.items():
+                totals[name] = totals.get(name, 0) + value
+            if duration is not None:
+                self.__transfer_durations[folder] = self.__transfer_durations.get(folder, 0.0) + duration
+
+    def add_repo(self, path: Path, duration: float, error: str = "") -> None:
+        with self.__lock:
+            self.__repos[path.as_posix()] = {"duration": round(duration, 3), "error": error}
+
+    def add_skipped(self, name: str) -> None:
+        """Record a repo or folder left for the next run by the time budget."""
+        with self.__lock:
+            self.__skipped.append(name)
+
+    def add_maintenance(
+        self,
+        path: Path,
+        before: dict[str, int],
+        after: dict[str, int],
+        duration: float,
+        error: str = "",
+    ) -> None:
+        """Record the pack statistics of a repo on the target before and after its maintenance."""
+        with self.__lock:
+            self.__maintenance[path.as_posix()] = {
+                "before": before,
+                "after": after,
+                "duration": round(duration, 3),
+                "error": error,
+            }
+
+    def to_dict(self) -> dict:
+        return {
+            "version": RunReport.VERSION,
+            "started": self.__started.isoformat(timespec="seconds"),
+            "target": str(self.__target) if self.__target is not None else None,
+            "dry_run": self.__dry_run,
+            "duration": round(time.perf_counter() - self.__start, 3),
+            "phases": {name: round(duration, 3) for name, duration in self.__phases.items()},
+            "transfers": {
+                folder: {**stats, "speedup": get_speedup(stats), **self.__get_transfer_duration(folder)}
+                for folder, stats in self.__transfers.items()
+            },
+            "repos": self.__repos,
+            "skipped": self.__skipped,
+            "maintenance": self.__maintenance,
+        }
+
+    def __get_transfer_duration(self, folder: str) -> dict[str, float]:
+        duration = self.__transfer_durations.get(folder)
+        return {} if duration is None else {"duration": round(duration, 3)}
+
+    def append_to(self, history: Path) -> None:
+        """Append the report as a single JSON line to the history file."""
+        report = self.to_dict()
+        logger.verbose(
+            "Phase durations: " + ", ".join(f"{name} {duration:.2f}s" for name, duration in report["phases"].items())
+        )
+        try:
+            history.parent.mkdir(parents=True, exist_ok=True)
+            with history.open("a") as history_file:
+                history_file.write(json.dumps(report, sort_keys=True) + "\n")
+        except OSError as error:
+            logger.warning(f"Can't write run report to {history}: {error}")
+            return
+        logger.debug(f"Run report appended to {history}")
+
+    @staticmethod
+    def read_history(history: Path, limit: int) -> list[dict]:
+        """The last ``limit`` reports of the history file, oldest first. Only the end of the
+        file is read, it grows with every run."""
+        try:
+            with history.open("rb") as history_file:
+                position = history_file.seek(0, os.SEEK_END)
+                data = b""
+                while position > 0 and data.count(b"\n") <= limit:
+                    size = min(RunReport.HISTORY_BLOCK_SIZE, position)
+                    position -= size
+                    history_file.seek(position)
+                    data = history_file.read(size) + data
+        except OSError:
+            return []
+        lines = data.splitlines()[1:] if position > 0 else data.splitlines()  # The first one may be cut
+        reports = []
+        for line in lines[-limit:]:
+            try:
+                report = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(report, dict) and report.get("version") == RunReport.VERSION:
+                reports.append(report)
+        return reports
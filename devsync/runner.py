@@ -0,0 +1,187 @@
+import asyncio
+import codecs
+import concurrent.futures
+import contextvars
+import dataclasses
+import logging
+import math
+import os
+import re
+import subprocess
+import threading
+from collections.abc import Coroutine
+from pathlib import Path
+
+from devsync.log import logger
+
+NO_TIMEOUT = math.inf
+READ_CHUNK_SIZE = 64 * 1024
+LINE_END = re.compile(r"\r\n|\r|\n")  # Progress output of rsync ends with a bare carriage return
+
+
+@dataclasses.dataclass(frozen=True)
+class Command:
+    """A command with the settings it runs with.
+
+    Output lines are logged with ``prefix`` at ``level``, stdout is left out with
+    ``log_output=False`` for queries whose output is only parsed. Without a timeout the
+    default timeout of the runner applies, ``NO_TIMEOUT`` disables it.
+    """
+
+    args: list[str]
+    cwd: Path | None = None
+    env: dict[str, str] | None = None
+    prefix: str = ""
+    timeout: float | None = None
+    log_output: bool = True
+    level: int = logging.DEBUG
+
+
+class CommandRunner:
+    """Run commands as asyncio subprocesses on an event loop in a background thread.
+
+    Output is streamed into the logger line by line while the command runs. Commands
+    started from different threads share the one event loop, so any number of them can
+    run at once without a thread waiting on the pipes of each. Coroutines started with
+    ``run_async`` on the loop can use it directly.
+    """
+
+    def __init__(self, timeout: float | None = None):
+        self.__lock = threading.Lock()
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.timeout = timeout
+
+    def run(self, command: Command) -> str:
+        """Run the command and return its stdout, blocking the calling thread.
+
+        Raises ``CalledProcessError`` if it fails and ``TimeoutExpired`` if it takes too
+        long. If the calling thread is interrupted the command is killed.
+        """
+        future = self.__submit(self.run_async(command))
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def run_async(self, command: Command) -> str:
+        timeout = self.timeout if command.timeout is None else command.timeout
+        env = {**os.environ, **command.env} if command.env else None
+        process = await asyncio.create_subprocess_exec(
+            *command.args,
+            cwd=command.cwd,
+            env=env,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout: list[str] = []
+        stderr: list[str] = []
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    CommandRunner.read_lines(process.stdout, stdout, command, command.log_output),
+                    CommandRunner.read_lines(process.stderr, stderr, command, True),
+                    process.wait(),
+                ),
+                None if timeout is None or math.isinf(timeout) else timeout,
+            )
+        except asyncio.TimeoutError:
+            await CommandRunner.kill(process)
+            raise subprocess.TimeoutExpired(command.args, timeout, "".join(stdout), "".join(stderr)) from None
+        except BaseException:
+            await CommandRunner.kill(process)  # Don't leave the command running after a cancel or a read error
+            raise
+
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command.args, "".join(stdout), "".join(stderr))
+        return "".join(stdout)
+
+    @staticmethod
+    async def read_lines(stream: asyncio.StreamReader, lines: list[str], command: Command, log: bool) -> None:
+        """Collect the output split into lines ending with a newline or a carriage return,
+        read in chunks, so progress output without newlines can't exceed a line limit."""
+        prefix = f"[{command.prefix}] " if command.prefix else ""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        while chunk := await stream.read(READ_CHUNK_SIZE):
+            searched = max(len(pending) - 1, 0)  # Left over without line end but a trailing \r
+            pending += decoder.decode(chunk)
+            start = 0
+            for match in LINE_END.finditer(pending, searched):
+                if match.end() == len(pending) and match.group() == "\r":
+                    break  # May be followed by the newline of the next chunk
+                CommandRunner.add_line(pending[start : match.end()], lines, log, command.level, prefix)
+                start = match.end()
+            pending = pending[start:]
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            CommandRunner.add_line(pending, lines, log, command.level, prefix)
+
+    @staticmethod
+    def add_line(text: str, lines: list[str], log: bool, level: int, prefix: str) -> None:
+        lines.append(text)
+        if log and text.strip():
+            logger.log(level, f"{prefix}{text.rstrip()}")
+
+    @staticmethod
+    async def kill(process: asyncio.subprocess.Process) -> None:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    def cancel_all(self) -> None:
+        """Kill all running commands, their callers get a ``CancelledError``."""
+        with self.__lock:
+            loop = self.__loop
+        if loop is not None:
+            loop.call_soon_threadsafe(lambda: [task.cancel() for task in asyncio.all_tasks(loop)])
+
+    def __submit(self, coroutine: Coroutine) -> concurrent.futures.Future:
+        """Start the coroutine on the loop in the context of the calling thread, so
+        grouped output of the caller stays together."""
+        loop = self.__get_loop()
+        context = contextvars.copy_context()
+        future: concurrent.futures.Future = concurrent.futures.Future()
+
+        def start() -> None:
+            if future.cancelled():
+                coroutine.close()
+                return
+            task = context.run(loop.create_task, coroutine)
+            task.add_done_callback(lambda done: CommandRunner.copy_state(done, future))
+            future.add_done_callback(lambda cancelled: loop.call_soon_threadsafe(task.cancel))
+
+        loop.call_soon_threadsafe(start)
+        return future
+
+    @staticmethod
+    def copy_state(task: asyncio.Task, future: concurrent.futures.Future) -> None:
+        if future.done():
+            return
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def __get_loop(self) -> asyncio.AbstractEventLoop:
+        with self.__lock:
+            if self.__loop is None:
+                self.__loop = asyncio.new_event_loop()
+                threading.Thread(target=self.__loop.run_forever, name="devsync-commands", daemon=True).start()
+            return self.__loop
+
+
+command_runner = CommandRunner()
+
+
+def run_command(
+    command: list[str],
+    cwd: Path | None = None,
+    prefix: str = "",
+    log_output: bool = True,
+) -> str:
+    """Run a command with the shared runner and return its stdout."""
+    return command_runner.run(Command(command, cwd, prefix=prefix, log_output=log_output))
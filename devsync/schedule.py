@@ -0,0 +1,148 @@
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import NamedTuple, TypeVar
+
+from devsync.log import logger
+from devsync.report import RunReport
+
+T = TypeVar("T")
+
+
+class Estimate(NamedTuple):
+    cost: float  # Expected seconds
+    churn: float  # Share of recent runs in which the item had changes
+
+    @property
+    def value(self) -> float:
+        """Churn per second of work, the items losing the most when deferred come first."""
+        return self.churn / max(self.cost, CostModel.MIN_COST)
+
+
+class CostModel:
+    """Cost of updating a repo or transferring a backup folder, estimated from the run
+    history.
+
+    The cost of an item is the mean duration of its recent updates or transfers, its churn
+    the share of recent runs in which it changed, i.e. a repo was updated or a folder
+    transferred or deleted files. Items without history get the mean cost of the known
+    ones and full churn, they were likely never backed up. Dry runs are left out, their
+    durations say nothing about real transfers.
+    """
+
+    RUNS = 20  # Recent runs taken into account
+    MIN_COST = 0.1
+    DEFAULT_REPO_COST = 5.0
+    DEFAULT_FOLDER_COST = 60.0
+
+    def __init__(self, reports: list[dict] | None = None):
+        reports = reports or []
+        self.__runs = len(reports)
+        self.__repo_durations: dict[str, list[float]] = {}
+        self.__repo_changes: dict[str, int] = {}
+        self.__folder_durations: dict[str, list[float]] = {}
+        self.__folder_changes: dict[str, int] = {}
+        self.__folder_bytes: dict[str, list[float]] = {}
+        for report in reports:
+            for path, entry in report.get("repos", {}).items():
+                self.__repo_changes[path] = self.__repo_changes.get(path, 0) + 1
+                if not entry.get("error"):
+                    self.__repo_durations.setdefault(path, []).append(entry["duration"])
+            for key, stats in report.get("transfers", {}).items():
+                names = key.split(",")  # Several folders synced by one rsync call share its duration
+                for name in names:
+                    if "duration" in stats:
+                        self.__folder_durations.setdefault(name, []).append(stats["duration"] / len(names))
+                    transferred = stats.get("Total transferred file size", 0) / len(names)
+                    self.__folder_bytes.setdefault(name, []).append(transferred)
+                    if stats.get("Number of regular files transferred") or stats.get("Number of deleted files"):
+                        self.__folder_changes[name] = self.__folder_changes.get(name, 0) + 1
+
+    @staticmethod
+    def load(history: Path) -> "CostModel":
+        reports = [report for report in RunReport.read_history(history, CostModel.RUNS) if not report["dry_run"]]
+        logger.verbose(f"Estimating costs from {len(reports)} runs in {history}")
+        return CostModel(reports)
+
+    @property
+    def runs(self) -> int:
+        return self.__runs
+
+    def repo(self, path: str) -> Estimate:
+        """Estimate for the repo at ``path`` relative to the home folder."""
+        return self.__estimate(self.__repo_durations, self.__repo_changes, path, CostModel.DEFAULT_REPO_COST)
+
+    def folder(self, name: str) -> Estimate:
+        return self.__estimate(self.__folder_durations, self.__folder_changes, name, CostModel.DEFAULT_FOLDER_COST)
+
+    def transferred_bytes(self, name: str) -> float:
+        """Mean bytes transferred per run for the folder, 0 without history."""
+        transferred = self.__folder_bytes.get(name)
+        return CostModel.mean(transferred) if transferred else 0.0
+
+    def __estimate(
+        self,
+        durations: dict[str, list[float]],
+        changes: dict[str, int],
+        key: str,
+        default: float,
+    ) -> Estimate:
+        churn = changes[key] / self.__runs if key in changes else 1.0
+        if key in durations:
+            return Estimate(CostModel.mean(durations[key]), churn)
+        known = [CostModel.mean(values) for values in durations.values()]
+        return Estimate(CostModel.mean(known) if known else default, churn)
+
+    @staticmethod
+    def mean(values: list[float]) -> float:
+        return sum(values) / len(values)
+
+
+class Scheduler:
+    """Order repo updates and rsync shards by their estimated cost and keep to a time
+    budget.
+
+    Without a budget the most expensive items go first, so parallel workers don't end
+    waiting for a single long item started last. With a budget the items with the most
+    churn per second go first and an item only starts if its estimate fits into the
+    remaining time. Running items are never interrupted, the skipped ones are left for the
+    next run.
+    """
+
+    def __init__(self, model: CostModel | None = None, budget: float = 0):
+        self.__model = model or CostModel()
+        self.__deadline = time.monotonic() + budget if budget > 0 else None
+
+    def configure(self, model: CostModel, budget: float = 0) -> None:
+        """Use the model and start the budget of ``budget`` seconds, 0 disables it."""
+        self.__model = model
+        self.__deadline = time.monotonic() + budget if budget > 0 else None
+
+    @property
+    def model(self) -> CostModel:
+        return self.__model
+
+    @property
+    def has_budget(self) -> bool:
+        return self.__deadline is not None
+
+    def remaining(self) -> float:
+        """Seconds left of the budget, infinite without one."""
+        return float("inf") if self.__deadline is None else self.__deadline - time.monotonic()
+
+    def order(self, items: list[T], estimate: Callable[[T], Estimate]) -> list[T]:
+        """Items in the order to start them, items with the same estimate keep their order."""
+        if self.has_budget:
+            return sorted(items, key=lambda item: -estimate(item).value)
+        return sorted(items, key=lambda item: -estimate(item).cost)
+
+    def admit(self, name: str, estimate: Estimate) -> bool:
+        """Whether the item can start, i.e. its estimate fits into the remaining budget."""
+        remaining = self.remaining()
+        if estimate.cost <= remaining:
+            return True
+        logger.notice(f"Skipping {name}, it takes about {estimate.cost:.0f}s and {max(remaining, 0):.0f}s are left\n")
+        return False
+
+
+scheduler = Scheduler()
@@ -0,0 +1,123 @@
+import dataclasses
+import datetime
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from devsync.log import logger
+
+
+@dataclasses.dataclass(frozen=True)
+class RetentionPolicy:
+    """Number of days, weeks and months for which the newest snapshot is kept.
+
+    Like ``--keep-daily`` of restic or borg, only periods that have snapshots count, so a
+    drive that is plugged in once a month still keeps ``daily`` snapshots. The latest
+    snapshot is always kept.
+    """
+
+    daily: int = 7
+    weekly: int = 4
+    monthly: int = 0
+
+    def select(self, snapshots: list[datetime.datetime]) -> set[datetime.datetime]:
+        """Times of the snapshots to keep."""
+        newest_first = sorted(snapshots, reverse=True)
+        keep = set(newest_first[:1])
+        for count, period in (
+            (self.daily, lambda moment: moment.date()),
+            (self.weekly, lambda moment: moment.isocalendar()[:2]),
+            (self.monthly, lambda moment: (moment.year, moment.month)),
+        ):
+            periods = set()
+            for snapshot in newest_first:
+                if len(periods) >= count:
+                    break
+                if period(snapshot) not in periods:
+                    periods.add(period(snapshot))
+                    keep.add(snapshot)
+        return keep
+
+
+class SnapshotStore:
+    """Snapshots of the backup folders in timestamped directories below ``path``.
+
+    A run writes into ``in-progress``, which is renamed to the start time of the run once
+    the transfer succeeded. An interrupted run leaves it behind and the next run continues
+    in it. Expired snapshots are renamed before they are deleted, so a partly deleted one
+    is never mistaken for a snapshot.
+    """
+
+    DIRECTORY = "snapshots"
+    IN_PROGRESS = "in-progress"
+    PRUNE_SUFFIX = ".prune"
+    TIME_FORMAT = "%Y-%m-%dT%H%M%S"  # No colons, they are invalid on FAT
+    NAME = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{6}$")
+
+    def __init__(self, path: Path):
+        self.__path = path
+
+    @property
+    def path(self) -> Path:
+        return self.__path
+
+    @property
+    def in_progress(self) -> Path:
+        return self.__path / SnapshotStore.IN_PROGRESS
+
+    def snapshots(self) -> list[Path]:
+        """Completed snapshots, oldest first."""
+        try:
+            return sorted(
+                path for path in self.__path.iterdir() if SnapshotStore.NAME.match(path.name) and path.is_dir()
+            )
+        except FileNotFoundError:
+            return []
+
+    def latest(self) -> Path | None:
+        snapshots = self.snapshots()
+        return snapshots[-1] if snapshots else None
+
+    def commit(self, start: datetime.datetime) -> Path:
+        """Turn the snapshot in progress into the snapshot taken at ``start``, named in
+        local time."""
+        snapshot = self.__path / start.strftime(SnapshotStore.TIME_FORMAT)
+        self.in_progress.rename(snapshot)
+        logger.info(f"Created snapshot {snapshot}")
+        return snapshot
+
+    def get_expired(self, policy: RetentionPolicy) -> list[Path]:
+        snapshots = {
+            datetime.datetime.strptime(path.name, SnapshotStore.TIME_FORMAT).astimezone(): path
+            for path in self.snapshots()
+        }
+        keep = policy.select(list(snapshots))
+        return [path for snapshot_time, path in sorted(snapshots.items()) if snapshot_time not in keep]
+
+    def prune(self, policy: RetentionPolicy) -> list[Path]:
+        """Delete the snapshots the policy does not keep and leftovers of earlier prunes."""
+        start = time.perf_counter()
+        expired = self.get_expired(policy)
+        for snapshot in expired:
+            snapshot.rename(snapshot.with_name(snapshot.name + SnapshotStore.PRUNE_SUFFIX))
+        for leftover in self.__path.glob(f"*{SnapshotStore.PRUNE_SUFFIX}"):
+            shutil.rmtree(leftover, ignore_errors=True)
+        if expired:
+            names = ", ".join(snapshot.name for snapshot in expired)
+            logger.verbose(f"Pruned {len(expired)} snapshots in {time.perf_counter() - start:.1f}s: {names}")
+        return expired
+
+    def prune_in_background(self, policy: RetentionPolicy) -> threading.Thread:
+        """Prune in a thread while the next snapshot is written, the latest snapshot is
+        always kept, so the one the new snapshot links to stays in place."""
+        thread = threading.Thread(target=self.__prune_logged, args=(policy,), name="devsync-prune")
+        thread.start()
+        return thread
+
+    def __prune_logged(self, policy: RetentionPolicy) -> None:
+        try:
+            self.prune(policy)
+        except OSError as error:
+            logger.error(f"Pruning snapshots in {self.__path} failed: {error}")
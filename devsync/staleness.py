@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import NamedTuple
+
+from devsync.log import logger
+
+# The target pulls from origin, so its remote-tracking branches count as well
+REF_LOCATIONS = ("HEAD", "packed-refs", "refs/heads", "refs/tags", "refs/remotes/origin", "reftable")
+
+
+class RefState(NamedTuple):
+    commit_time: float  # Newest commit time of all branches
+    refs: dict[str, str]  # Ref name to commit id
+
+
+def get_ref_fingerprint(git_dir: Path) -> str:
+    """Digest over path, mtime and size of every file git stores local branches, tags and
+    the branches of origin in."""
+    digest = hashlib.blake2b(digest_size=16)
+    for location in REF_LOCATIONS:
+        stack = [str(git_dir / location)]
+        while stack:
+            path = stack.pop()
+            try:
+                stat = Path(path).stat()
+            except OSError:
+                continue
+            digest.update(f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode())
+            if Path(path).is_dir():
+                with os.scandir(path) as entries:
+                    stack.extend(sorted((entry.path for entry in entries), reverse=True))
+    return digest.hexdigest()
+
+
+class RefCache:
+    """Ref state per repository, valid as long as its ref fingerprint matches."""
+
+    VERSION = 3
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__path: Path | None = None
+        self.__entries: dict[str, tuple[str, float, dict[str, str]]] = {}
+
+    def load(self, path: Path) -> None:
+        self.__path = path
+        try:
+            content = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return
+        if not isinstance(content, dict) or content.get("version") != RefCache.VERSION:
+            logger.verbose(f"Ignoring ref cache {path} with unknown format")
+            return
+        with self.__lock:
+            self.__entries = {repo: tuple(entry) for repo, entry in content["repos"].items()}
+
+    def save(self) -> None:
+        if self.__path is None:
+            return
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.__path.with_suffix(".tmp")
+        with self.__lock:
+            temporary_path.write_text(json.dumps({"version": RefCache.VERSION, "repos": self.__entries}))
+        temporary_path.replace(self.__path)
+
+    def get(self, repo_path: Path, fingerprint: str) -> RefState | None:
+        entry = self.__entries.get(str(repo_path))
+        if entry is None or entry[0] != fingerprint:
+            return None
+        return RefState(*entry[1:])
+
+    def put(self, repo_path: Path, fingerprint: str, ref_state: RefState) -> None:
+        with self.__lock:
+            self.__entries[str(repo_path)] = (fingerprint, *ref_state)
+
+
+ref_cache = RefCache()
@@ -1,92 +1,760 @@
+import collections
+import contextlib
+import dataclasses
+import datetime
+import logging
+import os
+import re
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from devsync.config import LOGFILE
-from devsync.data import BackupFolder, Repo, Target
-from devsync.log import logger
+from devsync.changes import ChangeJournal, SyncStamp
+from devsync.checkpoint import CheckpointJournal, open_checkpoint
+from devsync.config import CHANGE_JOURNAL, DISCOVERY_INDEX, LOGFILE, REF_CACHE, RUN_HISTORY
+from devsync.data import BackupFolder, Repo, Target, find_repos_in_backup_folders
+from devsync.engine import CopyEngine
+from devsync.excludes import IGNORE_FILE
+from devsync.hg import hg_command_server
+from devsync.index import DiscoveryIndex
+from devsync.log import grouped_output, logger
+from devsync.maintenance import RepoMaintenance
+from devsync.manifest import SyncManifest
 from devsync.parser import YMLConfigParser
+from devsync.profiles import DEFAULT_PROFILE, FAT_FILESYSTEMS, TargetProfile, get_filesystem_type, select_profile
+from devsync.report import RunReport
+from devsync.runner import NO_TIMEOUT, Command, command_runner
+from devsync.schedule import CostModel, Estimate, scheduler
+from devsync.snapshots import RetentionPolicy, SnapshotStore
+from devsync.staleness import ref_cache
 
 
-def run_backup(parser: YMLConfigParser, target: Target, last_update: int, report: bool):
-    home = parser.parse_home()
+@dataclasses.dataclass(frozen=True)
+class BackupOptions:
+    last_update: float = 0
+    report: bool = False
+    jobs: int = 1
+    jobs_per_host: int = 4
+    rescan: bool = False
+    local_source: bool = False
+    rsync_jobs: int = 1
+    rsync_jobs_per_device: int = 2
+    shard_by: str = "folder"
+    profile: str = ""
+    engine: str = "rsync"
+    copy_jobs: int = 4
+    command_timeout: float = 0
+    snapshots: bool = False
+    time_budget: float = 0
+    resume: bool = False
+    maintenance_jobs: int = 1
 
-    backup_folders = parser.parse_backup_folder()
-    for backup_folder in backup_folders:
-        backup_folder.find_repos_in_path()
+
+def run_backup(
+    parser: YMLConfigParser,
+    target: Target,
+    options: BackupOptions,
+    run_report: RunReport | None = None,
+):
+    run_report = run_report or RunReport()
+    command_runner.timeout = options.command_timeout or None
+    with run_report.phase("config"):
+        home = parser.parse_home()
+        backup_folders = parser.parse_backup_folder()
+        scheduler.configure(CostModel.load(RUN_HISTORY), options.time_budget)
+
+    with run_report.phase("discovery"):
+        discovery_index = DiscoveryIndex(DISCOVERY_INDEX)
+        if options.rescan:
+            discovery_index.clear()
+        find_repos_in_backup_folders(backup_folders, options.jobs, discovery_index)
 
     if target.is_relative_to(home):
         logger.notice("Target is relative to root. Updating local repos only.")
         target = Target(home)
 
+    failures, checkpoint = update_repos(home, backup_folders, target, options, run_report)
+    if checkpoint is None:
+        logger.info("Target is relative to root. Updated only the local repos")
+        return
+    maintain_repos(parser, target, options, run_report)
+
+    remaining_folders = get_remaining_folders(backup_folders, checkpoint, target, options)
+    if options.engine == "native" or shutil.which("rsync") is None:
+        complete = sync_native(home, remaining_folders, target, options, run_report)
+        if complete and not options.report:
+            for element in remaining_folders:
+                checkpoint.record_folder(element.path.name)
+    else:
+        logger.info("Sync data with rsync...\n")
+        with run_report.phase("config"):
+            rsync = create_rsync(parser, remaining_folders, target, options, checkpoint)
+        with run_report.phase("sync"):
+            changed = get_changed_directories(remaining_folders, SyncStamp(target.state_dir), options)
+            if changed is None:
+                complete = rsync.sync(target, options, run_report)
+            else:
+                complete = rsync.sync_changed(target, changed, options.report, run_report)
+    if complete and not options.report:
+        # Folders synced by an interrupted run that is resumed may have changed since it started
+        SyncStamp(target.state_dir).save(checkpoint.started)
+        ChangeJournal(CHANGE_JOURNAL).compact()
+        if not failures and not run_report.skipped:
+            checkpoint.clear()
+
+
+def update_repos(
+    home: Path,
+    backup_folders: list[BackupFolder],
+    target: Target,
+    options: BackupOptions,
+    run_report: RunReport,
+) -> tuple[dict[Path, str], CheckpointJournal | None]:
+    """Update the repos on the target, returns the failed ones and the checkpoint journal
+    of the run, which is None if the target is the home folder."""
     logger.info("Updating Repos...\n")
-    repo_sync = RepoSync(home, backup_folders)
-    repo_sync.update_repos(target, last_update, report)
+    ref_cache.load(REF_CACHE)
+    local_only = target.path == home
+    manifest = None if local_only else SyncManifest(target.state_dir)
+    checkpoint = None if local_only else open_checkpoint(target.state_dir, options.resume, options.report)
+    try:
+        failures = RepoSync(home, backup_folders, checkpoint).update_repos(target, options, manifest, run_report)
+    finally:
+        hg_command_server.close()
+        ref_cache.save()
+        if manifest is not None and not options.report:
+            manifest.save()
+    return failures, checkpoint
 
-    if target.path == home:
-        logger.info("Target is relative to root. Updated only the local repos")
+
+def maintain_repos(parser: YMLConfigParser, target: Target, options: BackupOptions, run_report: RunReport) -> None:
+    """Repack the Git repos updated by this run that are past the maintenance thresholds."""
+    if not options.maintenance_jobs:
         return
+    updated = [Path(path) for path, entry in run_report.repos.items() if not entry["error"]]
+    maintenance = RepoMaintenance(parser.parse_maintenance(), options.maintenance_jobs)
+    with run_report.phase("maintenance"):
+        maintenance.maintain_repos(target.path, updated, options.report, run_report)
+
+
+def get_remaining_folders(
+    backup_folders: list[BackupFolder],
+    checkpoint: CheckpointJournal,
+    target: Target,
+    options: BackupOptions,
+) -> list[BackupFolder]:
+    """Backup folders that were not synced by the interrupted run that is resumed."""
+    if not checkpoint.folders:
+        return backup_folders
+    if options.snapshots and not SnapshotStore(target.path / SnapshotStore.DIRECTORY).in_progress.exists():
+        logger.info("The interrupted run left no snapshot in progress, syncing all folders again\n")
+        return backup_folders
+    remaining = [element for element in backup_folders if not checkpoint.is_folder_done(element.path.name)]
+    logger.info(f"Skipping {len(backup_folders) - len(remaining)} folders synced by the interrupted run\n")
+    return remaining
+
+
+def sync_native(
+    home: Path,
+    backup_folders: list[BackupFolder],
+    target: Target,
+    options: BackupOptions,
+    run_report: RunReport,
+) -> bool:
+    """Sync all backup folders with the native copy engine, returns False if the time
+    budget is used up."""
+    if not backup_folders:
+        return True
+    if options.snapshots:
+        logger.warning("Snapshots need rsync, the native copy engine keeps a single copy\n")
+    folder = ",".join(element.path.name for element in backup_folders)
+    estimate = Estimate(sum(scheduler.model.folder(element.path.name).cost for element in backup_folders), 1.0)
+    if not scheduler.admit(folder, estimate):
+        run_report.add_skipped(folder)
+        return False
+    logger.info("Sync data with the native copy engine...\n")
+    start = time.perf_counter()
+    with run_report.phase("sync"):
+        stats = CopyEngine(home, backup_folders).sync(target, options.report, options.copy_jobs)
+    run_report.add_transfer(folder, stats, time.perf_counter() - start)
+    return True
+
+
+def create_rsync(
+    parser: YMLConfigParser,
+    backup_folders: list[BackupFolder],
+    target: Target,
+    options: BackupOptions,
+    checkpoint: CheckpointJournal | None = None,
+) -> "RSync":
+    profile_name = options.profile or parser.parse_target_profile()
+    profile = select_profile(profile_name, parser.parse_profiles(), target.path)
+    logger.verbose(f"Using target profile {profile.name}")
+    retention = parser.parse_snapshot_retention() if options.snapshots else None
+    return RSync(parser.parse_home(), backup_folders, profile, retention, checkpoint)
+
+
+def get_changed_directories(
+    backup_folders: list[BackupFolder],
+    sync_stamp: SyncStamp,
+    options: BackupOptions,
+) -> list[Path] | None:
+    """Directories changed since the last sync according to the change journal, or None
+    if everything has to be scanned."""
+    if options.rescan or options.snapshots:
+        return None
+    last_sync = sync_stamp.load()
+    if last_sync is None:
+        logger.verbose("No complete sync recorded on the target, scanning everything")
+        return None
+    return ChangeJournal(CHANGE_JOURNAL).get_dirty([element.path for element in backup_folders], last_sync)
+
+
+class SlotLimiter:
+    """Bound the number of concurrent jobs sharing a resource like a remote host or a
+    block device."""
+
+    def __init__(self, jobs_per_key: int):
+        self.__jobs_per_key = jobs_per_key
+        self.__lock = threading.Lock()
+        self.__semaphores: dict[str, threading.BoundedSemaphore] = {}
+
+    def slot(self, key: str) -> threading.BoundedSemaphore:
+        with self.__lock:
+            if key not in self.__semaphores:
+                self.__semaphores[key] = threading.BoundedSemaphore(self.__jobs_per_key)
+            return self.__semaphores[key]
+
+    @contextlib.contextmanager
+    def slots(self, keys: list[str]) -> Iterator[None]:
+        """Hold a slot for each distinct key, acquired in sorted order to avoid
+        deadlocks."""
+        with contextlib.ExitStack() as stack:
+            for key in sorted(set(keys)):
+                stack.enter_context(self.slot(key))
+            yield
+
+
+RSYNC_STATS_LINE = re.compile(r"^(?P<name>[A-Z][^:\n]*):\s+(?P<value>[\d,]+)(?:\s|$)", re.MULTILINE)
+
+
+def parse_rsync_stats(output: str) -> dict[str, int]:
+    """Numeric values of the ``--stats`` summary like ``Total transferred file size``."""
+    return {match["name"]: int(match["value"].replace(",", "")) for match in RSYNC_STATS_LINE.finditer(output)}
+
+
+class Shard:
+    """Sources that are synced into a destination by one rsync call."""
+
+    def __init__(
+        self,
+        backup_folders: list[BackupFolder],
+        destination: Path,
+        excludes: list[str],
+        subdirectory: str = "",
+        link_dest: Path | None = None,
+    ):
+        self.__sources = [element.path / subdirectory if subdirectory else element.path for element in backup_folders]
+        self.__destination = destination
+        self.__excludes = excludes
+        self.__link_dest = link_dest
+        self.__folder = ",".join(element.path.name for element in backup_folders)
+
+    @property
+    def folder(self) -> str:
+        """Name of the backup folder, or the comma separated names if there are several."""
+        return self.__folder
+
+    @property
+    def sources(self) -> list[Path]:
+        return self.__sources
+
+    @property
+    def destination(self) -> Path:
+        return self.__destination
+
+    @property
+    def excludes(self) -> list[str]:
+        return self.__excludes
+
+    @property
+    def link_dest(self) -> Path | None:
+        """Same directory in the previous snapshot, unchanged files are hardlinked from it."""
+        return self.__link_dest
+
+    @property
+    def devices(self) -> list[str]:
+        """Block devices of all sources and the destination."""
+        return [f"dev{get_device(path)}" for path in [*self.sources, self.destination]]
+
 
-    logger.info("Sync data with rsync...\n")
-    rsync = RSync(home, backup_folders)
-    rsync.sync(target, report)
+def get_device(path: Path) -> int:
+    """Device id of the path or its closest existing parent."""
+    existing = next((candidate for candidate in [path, *path.parents] if candidate.exists()), path)
+    return existing.stat().st_dev
 
 
 class RSync:
     OPTIONS = (
         "-a",  # Make 1 to 1 copy
-        "-v",  # Verbose
-        "--whole-file",  # Copy whole file without delta algorithm
         "--delete",  # Delete if not existing in root
         "--stats",  # Show file transfer stats
-        "--progress",  # Show Progress
-        "--modify-window=2",  # Allowing times to differ by up to 2 seconds. Related to FAT 2 second
-        # resolution for timestamps
+        f"--filter=:- {IGNORE_FILE}",  # Exclude the patterns of ignore files below their directory
         f"--log-file={LOGFILE}",  # Log to LOGFILE
     )
 
-    def __init__(self, root: Path, backup_folders: list[BackupFolder]):
+    def __init__(
+        self,
+        root: Path,
+        backup_folders: list[BackupFolder],
+        profile: TargetProfile = DEFAULT_PROFILE,
+        retention: RetentionPolicy | None = None,
+        checkpoint: CheckpointJournal | None = None,
+    ):
         self.__root = root
         self.__backup_folders = backup_folders
+        self.__profile = profile
+        self.__retention = retention
+        self.__checkpoint = checkpoint
+        self.__lock = threading.Lock()
+        self.__pending_shards: collections.Counter[str] = collections.Counter()
 
     @staticmethod
-    def get_options(report: bool, excludes: list[Path]) -> str:
-        options = list(RSync.OPTIONS)
+    def get_options(
+        report: bool,
+        exclude_file: Path | None = None,
+        profile: TargetProfile = DEFAULT_PROFILE,
+    ) -> list[str]:
+        options = [*RSync.OPTIONS, *profile.get_options()]
         if report:
             options.append("-n")  # Rsync Dry Run
 
-        options.extend([f'--exclude="{path}"' for path in excludes])
+        if exclude_file is not None:
+            options.append(f"--exclude-from={exclude_file}")
 
-        return " ".join(options)
+        return options
 
-    def sync(self, target: Target, report: bool) -> None:
+    @staticmethod
+    def get_exclude_patterns(backup_folders: list[BackupFolder]) -> list[str]:
+        """Repo and config excludes of all folders, anchored at the transfer root of a
+        single rsync call which sees every folder under its own name."""
+        patterns = []
+        for element in backup_folders:
+            patterns.extend(element.excludes.get_rsync_rules(f"/{RSync.escape_pattern(element.path.name)}"))
+            for path in element.get_relative_repo_paths():
+                pattern = RSync.escape_pattern(f"/{element.path.name}/{path.as_posix()}/")
+                if "\n" in pattern:
+                    logger.warning(f"Can't exclude repo with line break in its name: {element.path / path}")
+                    continue
+                patterns.append(pattern)
+        return patterns
+
+    @staticmethod
+    def escape_pattern(pattern: str) -> str:
+        """Rsync only treats backslashes as escape characters in patterns with wildcards."""
+        if not any(char in pattern for char in "*?["):
+            return pattern
+        return "".join(f"\\{char}" if char in "\\*?[" else char for char in pattern)
+
+    def get_shards(self, destination: Path, shard_by: str, previous: Path | None = None) -> list[Shard]:
+        """Split the transfer into independent rsync calls.
+
+        ``none`` syncs everything at once, ``folder`` syncs each backup folder on its own and
+        ``subdir`` additionally syncs each top-level subdirectory of a folder on its own. In
+        that case a top shard per folder takes care of the files and deleted directories at
+        the top level and excludes the subdirectories handled by the other shards. With a
+        ``previous`` snapshot, each shard links against its directory in there.
+        """
+        if shard_by == "none":
+            excludes = self.get_exclude_patterns(self.__backup_folders)
+            return [Shard(self.__backup_folders, destination, excludes, link_dest=previous)]
+        if shard_by == "folder":
+            return [
+                Shard([element], destination, self.get_exclude_patterns([element]), link_dest=previous)
+                for element in self.__backup_folders
+            ]
+
+        shards = []
         for element in self.__backup_folders:
-            excludes = element.get_relative_repo_paths()
-            options = self.get_options(report, excludes)
-
-            logger.verbose(f"{len(excludes)} Repos to exclude in {element.path}")
-            logger.debug(f"Running Rsync\n\tSource: {element.path}\n\tTarget: {target.path}\n\tOptions: {options}\n")
-            subprocess.check_call(
-                f"rsync {options} {element.path} {target.path}",
-                shell=True,
-                cwd=self.__root,
+            repo_paths = element.get_relative_repo_paths()
+            subdirectories = [
+                name
+                for name in RSync.list_subdirectories(element.path)
+                if Path(name) not in repo_paths and not element.excludes.is_excluded(element.path, name)
+            ]
+            top_excludes = element.excludes.get_rsync_rules(f"/{RSync.escape_pattern(element.path.name)}")
+            top_excludes.extend(RSync.escape_pattern(f"/{element.path.name}/{name}/") for name in subdirectories)
+            top_excludes.extend(
+                RSync.escape_pattern(f"/{element.path.name}/{path.as_posix()}/")
+                for path in repo_paths
+                if path.parts[0] not in subdirectories
+            )
+            shards.append(Shard([element], destination, top_excludes, link_dest=previous))
+            link_dest = previous / element.path.name if previous else None
+            # The ignore file of the folder is above the subdirectories rsync reads them from
+            folder_rules = element.excludes.with_ignore_file(element.path, "").get_rsync_rules("")
+            for name in subdirectories:
+                excludes = [
+                    *folder_rules,
+                    *(RSync.escape_pattern(f"/{path.as_posix()}/") for path in repo_paths if path.parts[0] == name),
+                ]
+                shards.append(Shard([element], destination / element.path.name, excludes, name, link_dest))
+        return shards
+
+    @staticmethod
+    def list_subdirectories(path: Path) -> list[str]:
+        try:
+            with os.scandir(path) as entries:
+                return sorted(entry.name for entry in entries if entry.is_dir(follow_symlinks=False))
+        except OSError:
+            return []
+
+    def sync(self, target: Target, options: BackupOptions, run_report: RunReport | None = None) -> bool:
+        """Sync the backup folders, returns whether none was skipped by the time budget."""
+        if not self.__backup_folders:
+            return True
+        if self.__retention is None:
+            return self.sync_into(target.path, options, run_report)
+
+        store = SnapshotStore(target.path / SnapshotStore.DIRECTORY)
+        previous = store.latest()
+        if get_filesystem_type(target.path) in FAT_FILESYSTEMS:
+            logger.warning("FAT has no hardlinks, every snapshot is a full copy\n")
+        if options.report:
+            expired = ", ".join(snapshot.name for snapshot in store.get_expired(self.__retention))
+            logger.info(f"Would link against snapshot {previous} and prune: {expired or 'nothing'}\n")
+            return self.sync_into(store.in_progress, options, run_report, previous)
+
+        start = datetime.datetime.now(tz=datetime.timezone.utc).astimezone()
+        logger.info(f"Writing snapshot into {store.in_progress}, linking unchanged files to {previous}\n")
+        pruning = store.prune_in_background(self.__retention)
+        try:
+            complete = self.sync_into(store.in_progress, options, run_report, previous)
+            if complete:
+                store.commit(start)
+            else:
+                logger.notice(f"Keeping incomplete snapshot in {store.in_progress} for the next run\n")
+        finally:
+            pruning.join()
+        return complete
+
+    def sync_changed(
+        self,
+        target: Target,
+        directories: list[Path],
+        report: bool,
+        run_report: RunReport | None = None,
+    ) -> bool:
+        """Sync only the given directories and everything below them with a single rsync
+        call that reads them with ``--files-from``. Returns False if the time budget is
+        used up."""
+        if not self.__backup_folders:
+            return True
+        run_report = run_report or RunReport()
+        relative_paths = self.get_changed_paths(directories)
+        folder = ",".join(element.path.name for element in self.__backup_folders)
+        if not relative_paths:
+            logger.info("No changes in the backup folders since the last sync\n")
+            run_report.add_transfer(folder, {})
+            return True
+        if not scheduler.admit(folder, Estimate(0.0, 1.0)):
+            run_report.add_skipped(folder)
+            return False
+
+        logger.info(f"Syncing {len(relative_paths)} changed directories recorded by the watcher\n")
+        with (
+            tempfile.NamedTemporaryFile("w", prefix="devsync-", suffix=".exclude") as exclude_file,
+            tempfile.NamedTemporaryFile("w", prefix="devsync-", suffix=".files") as files_from,
+        ):
+            exclude_file.write("".join(f"{pattern}\n" for pattern in self.get_exclude_patterns(self.__backup_folders)))
+            exclude_file.flush()
+            files_from.write("".join(f"{path.as_posix()}\n" for path in relative_paths))
+            files_from.flush()
+            start = time.perf_counter()
+            options = [*self.get_options(report, Path(exclude_file.name), self.__profile)]
+            # --files-from turns off the recursion of -a
+            options.extend(["--recursive", f"--files-from={files_from.name}"])
+            logger.debug(f"Running Rsync\n\tChanged: {len(relative_paths)}\n\tOptions: {' '.join(options)}\n")
+            command = Command(
+                ["rsync", *options, f"{self.__root}/", str(target.path)],
+                self.__root,
+                prefix=folder,
+                timeout=NO_TIMEOUT,
+                level=logging.INFO,
+            )
+            run_report.add_transfer(folder, parse_rsync_stats(command_runner.run(command)), time.perf_counter() - start)
+        self.__pending_shards = collections.Counter([folder])
+        self.record_synced(folder, report)
+        return True
+
+    def get_changed_paths(self, directories: list[Path]) -> list[Path]:
+        """Changed directories relative to the root, without the excluded ones, the ones
+        inside repositories or below another changed directory. Deleted directories are
+        replaced by their closest existing parent, which makes rsync delete them on the
+        target."""
+        repos = {repo.path for element in self.__backup_folders for repo in element.repos}
+        paths = set()
+        for directory in directories:
+            folders = [element for element in self.__backup_folders if directory.is_relative_to(element.path)]
+            if not folders or any(directory.is_relative_to(repo) for repo in repos):
+                continue
+            folder = folders[0]
+            existing = directory
+            while existing != folder.path and not existing.is_dir():
+                existing = existing.parent
+            relative = existing.relative_to(folder.path)
+            if relative.parts and folder.excludes.is_excluded(folder.path, relative.as_posix()):
+                continue
+            paths.add(existing.relative_to(self.__root))
+        return [path for path in sorted(paths) if not any(parent in paths for parent in path.parents)]
+
+    def sync_into(
+        self,
+        destination: Path,
+        options: BackupOptions,
+        run_report: RunReport | None = None,
+        previous: Path | None = None,
+    ) -> bool:
+        """Sync the backup folders into the destination, hardlinking files that did not
+        change since the ``previous`` snapshot. Returns False if shards were skipped by
+        the time budget."""
+        run_report = run_report or RunReport()
+        if options.rsync_jobs <= 1 and not scheduler.has_budget:
+            shard = self.get_shards(destination, "none", previous)[0]
+            self.__pending_shards = collections.Counter([shard.folder])
+            start = time.perf_counter()
+            stats = self.run_shard(shard, options.report, grouped=False)
+            run_report.add_transfer(shard.folder, stats, time.perf_counter() - start)
+            self.record_synced(shard.folder, options.report)
+            return True
+
+        # Shards per folder let the time budget skip folders even without parallel rsyncs
+        shards = self.get_shards(destination, options.shard_by if options.rsync_jobs > 1 else "folder", previous)
+        shards_per_folder = collections.Counter(shard.folder for shard in shards)
+        self.__pending_shards = shards_per_folder.copy()
+        estimates = {}
+        for shard in shards:
+            estimate = scheduler.model.folder(shard.folder)
+            estimates[shard] = estimate._replace(cost=estimate.cost / shards_per_folder[shard.folder])
+        shards = scheduler.order(shards, estimates.__getitem__)
+        jobs = max(options.rsync_jobs, 1)
+        logger.verbose(f"Running {len(shards)} rsync shards with up to {jobs} in parallel")
+        device_limiter = SlotLimiter(options.rsync_jobs_per_device)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(
+                executor.map(
+                    lambda shard: self.__run_scheduled(shard, estimates[shard], options.report, device_limiter, jobs),
+                    shards,
+                )
             )
-            # TODO: Remove shell=True but check rsync excludes work
+        duration = time.perf_counter() - start
+        for shard, result in zip(shards, results, strict=True):
+            if result is None:
+                run_report.add_skipped(self.get_shard_name(shard))
+            else:
+                run_report.add_transfer(shard.folder, *result)
+
+        transferred = sum(result[0].get("Total transferred file size", 0) for result in results if result)
+        logger.info(
+            f"Transferred {transferred / 1e6:.1f} MB in {duration:.1f}s with {len(shards)} shards "
+            f"({transferred / 1e6 / max(duration, 1e-9):.1f} MB/s)\n"
+        )
+        return None not in results
+
+    def __run_scheduled(
+        self,
+        shard: Shard,
+        estimate: Estimate,
+        report: bool,
+        device_limiter: SlotLimiter,
+        jobs: int,
+    ) -> tuple[dict[str, int], float] | None:
+        """Run a shard if it fits into the time budget, returns its statistics and duration."""
+        if not scheduler.admit(self.get_shard_name(shard), estimate):
+            return None
+        start = time.perf_counter()
+        with device_limiter.slots(shard.devices):
+            stats = self.run_shard(shard, report, grouped=jobs > 1)
+        duration = time.perf_counter() - start
+        self.record_synced(shard.folder, report)
+        return stats, duration
+
+    def record_synced(self, folder: str, report: bool) -> None:
+        """Record the backup folders of a finished shard in the checkpoint journal once all
+        of their shards are done."""
+        if self.__checkpoint is None or report:
+            return
+        with self.__lock:
+            self.__pending_shards[folder] -= 1
+            if self.__pending_shards[folder] > 0:
+                return
+        for name in folder.split(","):
+            self.__checkpoint.record_folder(name)
+
+    def get_shard_name(self, shard: Shard) -> str:
+        return ",".join(source.relative_to(self.__root).as_posix() for source in shard.sources)
+
+    def get_shard_profile(self, shard: Shard) -> TargetProfile:
+        """Profile of the shard without ``inplace`` for snapshots, a resumed snapshot holds
+        hardlinks into the previous one and writing them in place would change it too."""
+        if not self.__profile.inplace or (shard.link_dest is None and self.__retention is None):
+            return self.__profile
+        logger.verbose(f"Not updating files in place in {shard.destination}, they may be hardlinked to snapshots")
+        return dataclasses.replace(self.__profile, inplace=False)
+
+    def run_shard(self, shard: Shard, report: bool, grouped: bool) -> dict[str, int]:
+        """Run rsync for a shard and return its parsed statistics.
+
+        The output is logged line by line while rsync is running, grouped output is held
+        back and logged as one block after rsync finished.
+        """
+        if not report:
+            shard.destination.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", prefix="devsync-", suffix=".exclude") as exclude_file:
+            exclude_file.write("".join(f"{pattern}\n" for pattern in shard.excludes))
+            exclude_file.flush()
+            options = self.get_options(report, Path(exclude_file.name), self.get_shard_profile(shard))
+            if shard.link_dest is not None:
+                options.append(f"--link-dest={shard.link_dest}")
+            sources = [str(source) for source in shard.sources]
+
+            with grouped_output() if grouped else contextlib.nullcontext():
+                logger.verbose(f"{len(shard.excludes)} Excludes for {len(sources)} sources")
+                logger.debug(
+                    f"Running Rsync\n\tSources: {' '.join(sources)}\n\tTarget: {shard.destination}\n"
+                    f"\tOptions: {' '.join(options)}\n"
+                )
+                # Transfers can take hours, so the timeout for repo commands does not apply
+                command = Command(
+                    ["rsync", *options, *sources, str(shard.destination)],
+                    self.__root,
+                    prefix=shard.folder,
+                    timeout=NO_TIMEOUT,
+                    level=logging.INFO,
+                )
+                return parse_rsync_stats(command_runner.run(command))
 
 
 class RepoSync:
-    def __init__(self, root: Path, backup_folders: list[BackupFolder]):
+    def __init__(self, root: Path, backup_folders: list[BackupFolder], checkpoint: CheckpointJournal | None = None):
         self.__root = root
         self.__backup_folders = backup_folders
+        self.__checkpoint = checkpoint
 
-    def update_repos(self, target: Target, last_update: int, report: bool):
+    def update_repos(
+        self,
+        target: Target,
+        options: BackupOptions,
+        manifest: SyncManifest | None = None,
+        run_report: RunReport | None = None,
+    ) -> dict[Path, str]:
+        run_report = run_report or RunReport()
         all_repos = self.get_all_repos()
         logger.verbose(f"{len(all_repos)} repos found in all paths")
+        if self.__checkpoint is not None and self.__checkpoint.repos:
+            remaining = [repo for repo in all_repos if not self.__checkpoint.is_repo_done(self.relative(repo))]
+            logger.info(f"Skipping {len(all_repos) - len(remaining)} repos updated by the interrupted run\n")
+            all_repos = remaining
 
-        all_repos = [repo for repo in all_repos if repo.is_update_required(last_update)]
+        with run_report.phase("staleness"), ThreadPoolExecutor(max_workers=options.jobs) as executor:
+            update_required = list(
+                executor.map(lambda repo: self.is_update_required(repo, target, options, manifest), all_repos)
+            )
+        all_repos = [repo for repo, required in zip(all_repos, update_required, strict=True) if required]
         logger.verbose(f"{len(all_repos)} repos to update on target {target.path}\n")
+        estimates = {
+            repo.path: scheduler.model.repo(repo.path.relative_to(self.__root).as_posix()) for repo in all_repos
+        }
+        all_repos = scheduler.order(all_repos, lambda repo: estimates[repo.path])
 
-        for repo in all_repos:
-            repo.update_repo_on_target(self.__root, target, report)
+        limit_hosts = options.jobs > options.jobs_per_host and not options.local_source
+        host_limiter = SlotLimiter(options.jobs_per_host) if limit_hosts else None
+
+        def update_repo(repo: Repo) -> str:
+            if not scheduler.admit(str(repo.path), estimates[repo.path]):
+                run_report.add_skipped(repo.path.relative_to(self.__root).as_posix())
+                return ""
+            start = time.perf_counter()
+            error = self.__update_repo(repo, target, options, host_limiter, manifest)
+            run_report.add_repo(repo.path.relative_to(self.__root), time.perf_counter() - start, error)
+            return error
+
+        with run_report.phase("repo_updates"), ThreadPoolExecutor(max_workers=options.jobs) as executor:
+            errors = executor.map(update_repo, all_repos)
+            failures = {repo.path: error for repo, error in zip(all_repos, errors, strict=True) if error}
+
+        RepoSync.report_failures(failures)
+        return failures
+
+    def is_update_required(
+        self,
+        repo: Repo,
+        target: Target,
+        options: BackupOptions,
+        manifest: SyncManifest | None,
+    ) -> bool:
+        """Whether the repo changed since its last update. A repo whose refs can't be read
+        is updated, so its failure is reported with the other updates."""
+        try:
+            return self.__is_update_required(repo, target, options, manifest)
+        except (subprocess.SubprocessError, OSError, ValueError) as error:
+            logger.warning(f"\tChecking {repo.path} for changes failed: {error}\n")
+            return True
+
+    def __is_update_required(
+        self,
+        repo: Repo,
+        target: Target,
+        options: BackupOptions,
+        manifest: SyncManifest | None,
+    ) -> bool:
+        if manifest is None:
+            return repo.is_update_required(options.last_update)
+        recorded_refs = manifest.get(repo.path.relative_to(self.__root))
+        if recorded_refs is None and not repo.get_repo_target_path(self.__root, target).exists():
+            return True
+        return repo.is_update_required(options.last_update, recorded_refs)
+
+    def __update_repo(
+        self,
+        repo: Repo,
+        target: Target,
+        options: BackupOptions,
+        host_limiter: SlotLimiter | None,
+        manifest: SyncManifest | None,
+    ) -> str:
+        with grouped_output() if options.jobs > 1 else contextlib.nullcontext():
+            try:
+                refs = repo.get_refs() if manifest is not None else {}
+                if host_limiter is None:
+                    repo.update_repo_on_target(self.__root, target, options.report, options.local_source)
+                else:
+                    with host_limiter.slot(repo.remote_host):
+                        repo.update_repo_on_target(self.__root, target, options.report, options.local_source)
+            except (subprocess.SubprocessError, OSError) as error:
+                logger.error(f"\tUpdating {repo.path} failed: {error}\n")
+                return str(error)
+        if manifest is not None and not options.report:
+            manifest.record(repo.path.relative_to(self.__root), refs)
+        if self.__checkpoint is not None and not options.report:
+            self.__checkpoint.record_repo(self.relative(repo))
+        return ""
+
+    def relative(self, repo: Repo) -> Path:
+        return repo.path.relative_to(self.__root)
+
+    @staticmethod
+    def report_failures(failures: dict[Path, str]) -> None:
+        if not failures:
+            return
+        summary = "\n".join(f"\t{path}: {error}" for path, error in failures.items())
+        logger.error(f"{len(failures)} repos failed to update:\n{summary}\n")
 
     def get_all_repos(self) -> list[Repo]:
         all_repos = []
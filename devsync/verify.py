@@ -0,0 +1,318 @@
+import collections
+import dataclasses
+import hashlib
+import json
+import os
+import stat
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from devsync.config import DISCOVERY_INDEX, HASH_CACHE
+from devsync.data import BackupFolder, Target, find_repos_in_backup_folders
+from devsync.excludes import IGNORE_FILE, Excludes
+from devsync.index import DiscoveryIndex
+from devsync.log import logger
+from devsync.parser import YMLConfigParser
+from devsync.profiles import select_profile
+from devsync.snapshots import SnapshotStore
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def hash_file(path: Path) -> str:
+    """BLAKE2b digest of the file content, hashlib releases the GIL while hashing."""
+    digest = hashlib.blake2b(digest_size=16)
+    with path.open("rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SourceHashCache:
+    """Digests of source files keyed on device and inode, valid while size and mtime are
+    unchanged. Renamed files keep their digest. Only the entries of files seen by a
+    verification are saved."""
+
+    VERSION = 1
+
+    def __init__(self, path: Path):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__entries: dict[str, list] = self.load(path)
+        self.__seen: dict[str, list] = {}
+
+    @staticmethod
+    def load(path: Path) -> dict[str, list]:
+        try:
+            content = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(content, dict) or content.get("version") != SourceHashCache.VERSION:
+            logger.verbose(f"Ignoring hash cache {path} with unknown format")
+            return {}
+        return content["files"]
+
+    @staticmethod
+    def get_key(source_stat: os.stat_result) -> str:
+        return f"{source_stat.st_dev}:{source_stat.st_ino}"
+
+    def get(self, source_stat: os.stat_result) -> str | None:
+        entry = self.__entries.get(SourceHashCache.get_key(source_stat))
+        if entry is None or entry[:2] != [source_stat.st_size, source_stat.st_mtime_ns]:
+            return None
+        return entry[2]
+
+    def put(self, source_stat: os.stat_result, digest: str) -> None:
+        with self.__lock:
+            self.__seen[SourceHashCache.get_key(source_stat)] = [source_stat.st_size, source_stat.st_mtime_ns, digest]
+
+    def save(self) -> None:
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.__path.with_suffix(".tmp")
+        with self.__lock:
+            temporary_path.write_text(json.dumps({"version": SourceHashCache.VERSION, "files": self.__seen}))
+        temporary_path.replace(self.__path)
+
+
+class TargetHashManifest:
+    """Digests of the files on the target by their path, valid while size and mtime are
+    unchanged, and the number of verifications so far which selects the rotating sample."""
+
+    VERSION = 1
+    FILENAME = "hashes.json"
+
+    def __init__(self, state_dir: Path):
+        self.__path = state_dir / TargetHashManifest.FILENAME
+        self.__lock = threading.Lock()
+        self.__round, self.__entries = self.load(self.__path)
+        self.__seen: dict[str, list] = {}
+
+    @property
+    def path(self) -> Path:
+        return self.__path
+
+    @property
+    def round(self) -> int:
+        return self.__round
+
+    @staticmethod
+    def load(path: Path) -> tuple[int, dict[str, list]]:
+        try:
+            content = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return 0, {}
+        if not isinstance(content, dict) or content.get("version") != TargetHashManifest.VERSION:
+            logger.warning(f"Ignoring target hash manifest {path} with unknown format")
+            return 0, {}
+        return content["round"], content["files"]
+
+    def get(self, relative_path: str, target_stat: os.stat_result) -> str | None:
+        entry = self.__entries.get(relative_path)
+        if entry is None or entry[:2] != [target_stat.st_size, target_stat.st_mtime_ns]:
+            return None
+        return entry[2]
+
+    def put(self, relative_path: str, target_stat: os.stat_result, digest: str) -> None:
+        with self.__lock:
+            self.__seen[relative_path] = [target_stat.st_size, target_stat.st_mtime_ns, digest]
+
+    def save(self) -> None:
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.__path.with_suffix(".tmp")
+        with self.__lock:
+            content = {"version": TargetHashManifest.VERSION, "round": self.__round + 1, "files": self.__seen}
+            temporary_path.write_text(json.dumps(content))
+        temporary_path.replace(self.__path)
+
+
+@dataclasses.dataclass
+class VerifyResult:
+    """Outcome of a verification, problems are listed by their path on the target."""
+
+    files: int = 0
+    hashed_source: int = 0
+    hashed_target: int = 0
+    hashed_bytes: int = 0
+    outdated: list[str] = dataclasses.field(default_factory=list)  # Changed after the last backup
+    missing: list[str] = dataclasses.field(default_factory=list)
+    mismatched: list[str] = dataclasses.field(default_factory=list)
+    unreadable: list[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not (self.missing or self.mismatched or self.unreadable)
+
+
+class Verifier:
+    """Compare the content of the backup folders with their copy on the target.
+
+    Files are hashed on the source and the target in parallel. Files whose size or mtime
+    differ on the target changed after the last backup and are not hashed. The others are
+    only rehashed if they changed since the last verification, or if they are in the
+    rotating sample, ``sample_percent`` of the files per run, which rereads every file
+    after a number of runs to catch bit rot.
+    """
+
+    PENDING_PER_JOB = 16  # Hash tasks queued per worker
+
+    def __init__(
+        self,
+        backup_folders: list[BackupFolder],
+        target_root: Path,
+        jobs: int = 4,
+        sample_percent: float = 5,
+        modify_window: int = 0,
+    ):
+        self.__backup_folders = backup_folders
+        self.__target_root = target_root
+        self.__jobs = max(jobs, 1)
+        self.__buckets = round(100 / sample_percent) if sample_percent > 0 else 0
+        self.__modify_window_ns = modify_window * 1_000_000_000
+        self.__lock = threading.Lock()
+        self.__result = VerifyResult()
+
+    def verify(self, source_cache: SourceHashCache, target_manifest: TargetHashManifest) -> VerifyResult:
+        self.__result = VerifyResult()
+        start = time.perf_counter()
+        pending: collections.deque[Future] = collections.deque()
+        with ThreadPoolExecutor(max_workers=self.__jobs) as executor:
+            for source, relative_path in self.iter_files():
+                while len(pending) >= self.__jobs * Verifier.PENDING_PER_JOB:
+                    pending.popleft().result()
+                sampled = self.is_sampled(relative_path, target_manifest.round)
+                pending.append(
+                    executor.submit(self.verify_file, source, relative_path, sampled, source_cache, target_manifest)
+                )
+            for future in pending:
+                future.result()
+        source_cache.save()
+        target_manifest.save()
+        self.__log_result(time.perf_counter() - start)
+        return self.__result
+
+    def iter_files(self) -> Iterator[tuple[Path, str]]:
+        """Regular files of all backup folders with their path on the target, without
+        repos and excluded paths like the sync."""
+        for element in self.__backup_folders:
+            excludes = element.excludes.with_paths(path.as_posix() for path in element.get_relative_repo_paths())
+            stack: list[tuple[Path, str, Excludes]] = [(element.path, "", excludes)]
+            while stack:
+                directory, relative, excludes = stack.pop()
+                try:
+                    with os.scandir(directory) as scanned:
+                        entries = sorted(scanned, key=lambda entry: entry.name)
+                except OSError as error:
+                    logger.error(f"Can't list {directory}: {error}")
+                    continue
+                if any(entry.name == IGNORE_FILE for entry in entries):
+                    excludes = excludes.with_ignore_file(directory, relative)
+                for entry in entries:
+                    relative_path = f"{relative}/{entry.name}" if relative else entry.name
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if excludes.matches(relative_path, is_dir):
+                        continue
+                    if is_dir:
+                        stack.append((Path(entry.path), relative_path, excludes))
+                    elif entry.is_file(follow_symlinks=False):
+                        yield Path(entry.path), f"{element.path.name}/{relative_path}"
+
+    def is_sampled(self, relative_path: str, verify_round: int) -> bool:
+        """Whether the file is in the sample of this round, every file is once per
+        ``100 / sample_percent`` rounds."""
+        if not self.__buckets:
+            return False
+        bucket = int.from_bytes(hashlib.blake2b(relative_path.encode(), digest_size=4).digest(), "big")
+        return bucket % self.__buckets == verify_round % self.__buckets
+
+    def verify_file(
+        self,
+        source: Path,
+        relative_path: str,
+        sampled: bool,
+        source_cache: SourceHashCache,
+        target_manifest: TargetHashManifest,
+    ) -> None:
+        target = self.__target_root / relative_path
+        try:
+            source_stat = source.stat()
+            target_stat = target.stat()
+        except FileNotFoundError:
+            problems = self.__result.missing if source.exists() else None  # Or deleted while verifying
+            self.__add(problems, relative_path)
+            return
+        except OSError as error:
+            logger.error(f"Can't stat {relative_path}: {error}")
+            self.__add(self.__result.unreadable, relative_path)
+            return
+        if not stat.S_ISREG(target_stat.st_mode) or not self.is_same_version(source_stat, target_stat):
+            self.__add(self.__result.outdated, relative_path)
+            return
+
+        source_digest = None if sampled else source_cache.get(source_stat)
+        target_digest = None if sampled else target_manifest.get(relative_path, target_stat)
+        try:
+            if source_digest is None:
+                source_digest = hash_file(source)
+                self.__count_hashed(source_stat.st_size, source=True)
+            if target_digest is None:
+                target_digest = hash_file(target)
+                self.__count_hashed(target_stat.st_size, source=False)
+        except OSError as error:
+            logger.error(f"Can't read {relative_path}: {error}")
+            self.__add(self.__result.unreadable, relative_path)
+            return
+        source_cache.put(source_stat, source_digest)
+        target_manifest.put(relative_path, target_stat, target_digest)
+        self.__add(None if source_digest == target_digest else self.__result.mismatched, relative_path)
+
+    def is_same_version(self, source_stat: os.stat_result, target_stat: os.stat_result) -> bool:
+        """Whether the target file is a copy of the current source file by size and mtime,
+        like rsync decides whether to transfer it."""
+        return (
+            source_stat.st_size == target_stat.st_size
+            and abs(source_stat.st_mtime_ns - target_stat.st_mtime_ns) <= self.__modify_window_ns
+        )
+
+    def __add(self, problems: list[str] | None, relative_path: str) -> None:
+        with self.__lock:
+            self.__result.files += 1
+            if problems is not None:
+                problems.append(relative_path)
+
+    def __count_hashed(self, size: int, source: bool) -> None:
+        with self.__lock:
+            self.__result.hashed_bytes += size
+            if source:
+                self.__result.hashed_source += 1
+            else:
+                self.__result.hashed_target += 1
+
+    def __log_result(self, duration: float) -> None:
+        result = self.__result
+        for name, problems, log in (
+            ("Missing on the target", result.missing, logger.warning),
+            ("Content differs", result.mismatched, logger.error),
+            ("Unreadable", result.unreadable, logger.error),
+        ):
+            if problems:
+                log(f"{name}:\n" + "\n".join(f"\t{path}" for path in sorted(problems)) + "\n")
+        logger.info(
+            f"Verified {result.files} files in {duration:.1f}s, hashed {result.hashed_source} on the source and "
+            f"{result.hashed_target} on the target ({result.hashed_bytes / 1e6:.1f} MB). {len(result.outdated)} "
+            f"changed since the backup, {len(result.missing)} missing, {len(result.mismatched)} differ, "
+            f"{len(result.unreadable)} unreadable\n"
+        )
+
+
+def run_verify(parser: YMLConfigParser, target: Target, jobs: int, sample_percent: float) -> VerifyResult:
+    """Verify the backup folders against the target, or its latest snapshot if there is one."""
+    backup_folders = parser.parse_backup_folder()
+    find_repos_in_backup_folders(backup_folders, jobs, DiscoveryIndex(DISCOVERY_INDEX))
+    profile = select_profile(parser.parse_target_profile(), parser.parse_profiles(), target.path)
+    target_root = SnapshotStore(target.path / SnapshotStore.DIRECTORY).latest() or target.path
+    logger.notice(f"Verifying {target_root}\n")
+    verifier = Verifier(backup_folders, target_root, jobs, sample_percent, profile.modify_window)
+    return verifier.verify(SourceHashCache(HASH_CACHE), TargetHashManifest(target.state_dir))
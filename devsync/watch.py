@@ -0,0 +1,192 @@
+import ctypes
+import errno
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+
+from devsync.changes import ChangeJournal
+from devsync.log import logger
+
+# Event flags from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+
+class Inotify:
+    """Minimal binding of the Linux inotify API through the C library."""
+
+    EVENT = struct.Struct("iIII")  # Watch descriptor, mask, cookie and length of the name
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self):
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            msg = "inotify is only available on Linux"
+            raise OSError(msg)
+        self.__libc = libc
+        self.__fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.__fd < 0:
+            Inotify.raise_error("inotify_init1")
+
+    def add_watch(self, path: Path, mask: int) -> int:
+        descriptor = self.__libc.inotify_add_watch(self.__fd, os.fsencode(path), mask)
+        if descriptor < 0:
+            Inotify.raise_error(str(path))
+        return descriptor
+
+    def read(self, timeout: float) -> list[tuple[int, int, str]]:
+        """Events as watch descriptor, mask and name, waiting at most ``timeout`` seconds."""
+        ready, _, _ = select.select([self.__fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.__fd, Inotify.BUFFER_SIZE)
+        except BlockingIOError:
+            return []
+        return Inotify.parse_events(data)
+
+    @staticmethod
+    def parse_events(data: bytes) -> list[tuple[int, int, str]]:
+        events = []
+        offset = 0
+        while offset + Inotify.EVENT.size <= len(data):
+            descriptor, mask, _, length = Inotify.EVENT.unpack_from(data, offset)
+            offset += Inotify.EVENT.size
+            events.append((descriptor, mask, os.fsdecode(data[offset : offset + length].rstrip(b"\0"))))
+            offset += length
+        return events
+
+    @staticmethod
+    def raise_error(name: str) -> None:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), name)
+
+    def close(self) -> None:
+        os.close(self.__fd)
+
+
+class Watcher:
+    """Record the directories changed below the backup folders in a change journal.
+
+    Every directory gets an inotify watch, except the internals of repositories, which
+    are backed up by their own updates. Changes are collected in memory and written once
+    per ``FLUSH_INTERVAL``. If events are lost, an overflow is recorded and the next backup
+    scans everything. If a directory can't be watched, e.g. because
+    ``fs.inotify.max_user_watches`` is exhausted, every backup scans everything until the
+    watcher is restarted.
+    """
+
+    MASK = (
+        IN_ATTRIB
+        | IN_CLOSE_WRITE
+        | IN_MOVED_FROM
+        | IN_MOVED_TO
+        | IN_CREATE
+        | IN_DELETE
+        | IN_DELETE_SELF
+        | IN_ONLYDIR
+        | IN_DONT_FOLLOW
+        | IN_EXCL_UNLINK
+    )
+    SKIPPED = frozenset((".git", ".hg", ".svn"))
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, roots: list[Path], journal: ChangeJournal, inotify: Inotify | None = None):
+        self.__roots = roots
+        self.__journal = journal
+        self.__inotify = inotify or Inotify()
+        self.__watches: dict[int, str] = {}
+        self.__dirty: set[str] = set()
+        self.__changed_at = 0.0
+
+    @property
+    def watches(self) -> int:
+        return len(self.__watches)
+
+    def run(self, stop: threading.Event | None = None) -> None:
+        """Watch until ``stop`` is set or the process is interrupted."""
+        stop = stop or threading.Event()
+        self.__journal.start(self.__roots)
+        start = time.perf_counter()
+        for root in self.__roots:
+            self.add_tree(root)
+        logger.info(f"Watching {self.watches} directories, set up in {time.perf_counter() - start:.1f}s\n")
+        flushed_at = time.monotonic()
+        try:
+            while not stop.is_set():
+                for descriptor, mask, name in self.__inotify.read(Watcher.FLUSH_INTERVAL):
+                    self.handle(descriptor, mask, name)
+                if time.monotonic() - flushed_at >= Watcher.FLUSH_INTERVAL:
+                    self.flush()
+                    flushed_at = time.monotonic()
+        finally:
+            self.flush()
+            self.__journal.record_stop()
+            self.__inotify.close()
+
+    def add_tree(self, directory: Path) -> None:
+        try:
+            descriptor = self.__inotify.add_watch(directory, Watcher.MASK)
+        except OSError as error:
+            self.unwatched(directory, error)
+            return
+        # Registered before scanning, so events of a directory whose subdirectories can't be listed still count
+        self.__watches[descriptor] = str(directory)
+        try:
+            with os.scandir(directory) as entries:
+                subdirectories = [
+                    entry.name
+                    for entry in entries
+                    if entry.is_dir(follow_symlinks=False) and entry.name not in Watcher.SKIPPED
+                ]
+        except OSError as error:
+            self.unwatched(directory, error)
+            return
+        for name in subdirectories:
+            self.add_tree(directory / name)
+
+    def unwatched(self, directory: Path, error: OSError) -> None:
+        if error.errno in {errno.ENOENT, errno.ENOTDIR}:
+            return  # Removed again before it was watched, the parent is dirty anyway
+        logger.error(f"Can't watch {directory}, backups scan everything until the watcher restarts: {error}")
+        self.__journal.record_unwatched(str(directory))
+
+    def handle(self, descriptor: int, mask: int, name: str) -> None:
+        if mask & IN_Q_OVERFLOW:
+            logger.error("inotify event queue overflowed, the next backup scans everything")
+            self.__journal.record_overflow()
+            return
+        directory = self.__watches.get(descriptor)
+        if directory is None:
+            return
+        if mask & IN_IGNORED:
+            del self.__watches[descriptor]
+            return
+        if name in Watcher.SKIPPED:
+            return
+        if not self.__dirty:
+            self.__changed_at = time.time()
+        self.__dirty.add(directory)
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            self.add_tree(Path(directory) / name)
+
+    def flush(self) -> None:
+        if not self.__dirty:
+            return
+        logger.debug(f"{len(self.__dirty)} directories changed")
+        self.__journal.record_dirty(self.__dirty, self.__changed_at)
+        self.__dirty.clear()
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from benchmarks.tree import TreeGenerator, TreeSpec
+from devsync.data import BackupFolder, GitRepo, find_repos_in_backup_folders
+
+
+def test_generate_tree_repos_found_with_local_remotes(tmp_path: Path) -> None:
+    spec = TreeSpec(folders=2, git_repos=3, depth=1, directories=2, files=2, file_sizes=((10, 1),))
+
+    tree = TreeGenerator(spec).generate(tmp_path)
+
+    backup_folders = [BackupFolder(tree.home, folder) for folder in tree.folders]
+    find_repos_in_backup_folders(backup_folders)
+    repos = [repo for element in backup_folders for repo in element.repos]
+    assert sorted(repo.path for repo in repos) == sorted(tree.repos)
+    assert all(isinstance(repo, GitRepo) for repo in repos)
+    assert not any(repo.remote_host for repo in repos)
+    assert len(list(tree.remotes.glob("*.git"))) == len(repos)
+
+
+def test_generate_tree_same_seed_same_layout(tmp_path: Path) -> None:
+    spec = TreeSpec(folders=1, git_repos=0, depth=2, directories=2, files=3)
+
+    first = TreeGenerator(spec).generate(tmp_path / "first")
+    second = TreeGenerator(spec).generate(tmp_path / "second")
+
+    assert first.size == second.size
+    assert first.files == second.files
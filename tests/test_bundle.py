@@ -0,0 +1,106 @@
+from pathlib import Path
+
+import pytest
+
+from devsync.bundle import BundleChain
+from devsync.data import GitRepo, Target
+from tests.test_mirror import create_source, get_refs, git
+
+
+def update(tmp_path: Path, source: Path) -> BundleChain:
+    (tmp_path / "target").mkdir(exist_ok=True)
+    GitRepo(source).update_repo_on_target(tmp_path / "home", Target(tmp_path / "target", bundles=True), False)
+    return BundleChain(tmp_path / "target" / "repo")
+
+
+def test_update_repo_on_target_bundles_first_bundle_is_full(tmp_path: Path) -> None:
+    chain = update(tmp_path, create_source(tmp_path))
+
+    assert [bundle.name for bundle in chain.bundles] == ["0001-full.bundle"]
+    assert sorted(chain.refs) == ["refs/heads/feature", "refs/heads/main", "refs/tags/v1"]
+    assert chain.head == "main"
+    assert chain.url == str(tmp_path / "remote.git")
+
+
+def test_update_repo_on_target_bundles_new_commit_adds_incremental_bundle(tmp_path: Path) -> None:
+    source = create_source(tmp_path)
+    update(tmp_path, source)
+    git("commit", "-q", "--allow-empty", "-m", "change", cwd=source)
+
+    chain = update(tmp_path, source)
+
+    assert [bundle.name for bundle in chain.bundles] == ["0001-full.bundle", "0002.bundle"]
+    prerequisites = git("bundle", "verify", str(chain.bundles[1]), cwd=source)
+    assert "requires this ref" in prerequisites
+
+
+def test_update_repo_on_target_bundles_unchanged_writes_no_bundle(tmp_path: Path) -> None:
+    source = create_source(tmp_path)
+    update(tmp_path, source)
+
+    chain = update(tmp_path, source)
+
+    assert len(chain.bundles) == 1
+
+
+def test_update_repo_on_target_bundles_deleted_branch_only_recorded(tmp_path: Path) -> None:
+    source = create_source(tmp_path)
+    update(tmp_path, source)
+    git("branch", "-D", "feature", cwd=source)
+
+    chain = update(tmp_path, source)
+
+    assert len(chain.bundles) == 1
+    assert "refs/heads/feature" not in chain.refs
+
+
+def test_update_repo_on_target_bundles_long_chain_consolidated(tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.setattr(BundleChain, "MAX_LENGTH", 3)
+    source = create_source(tmp_path)
+    for _ in range(3):
+        update(tmp_path, source)
+        git("commit", "-q", "--allow-empty", "-m", "change", cwd=source)
+
+    chain = update(tmp_path, source)
+
+    assert [bundle.name for bundle in chain.bundles] == ["0004-full.bundle"]
+    assert sorted(path.name for path in chain.path.glob("*.bundle")) == ["0004-full.bundle"]
+
+
+def test_update_repo_on_target_clone_converted_to_bundles(tmp_path: Path) -> None:
+    source = create_source(tmp_path)
+    (tmp_path / "target").mkdir()
+    GitRepo(source).update_repo_on_target(tmp_path / "home", Target(tmp_path / "target"), False)
+
+    chain = update(tmp_path, source)
+
+    assert not (chain.path / ".git").exists()
+    assert [bundle.name for bundle in chain.bundles] == ["0001-full.bundle"]
+
+
+def test_restore_rebuilds_refs_and_working_copy_from_chain(tmp_path: Path) -> None:
+    source = create_source(tmp_path)
+    update(tmp_path, source)
+    git("commit", "-q", "--allow-empty", "-m", "change", cwd=source)
+    git("tag", "-a", "v2", "-m", "release", "HEAD~1", cwd=source)
+    update(tmp_path, source)
+    git("branch", "-D", "feature", cwd=source)
+    git("branch", "old", "HEAD~1", cwd=source)
+    chain = update(tmp_path, source)
+
+    chain.restore(tmp_path / "restored")
+
+    restored = tmp_path / "restored"
+    assert get_refs(restored) == ["refs/heads/main", "refs/heads/old", "refs/tags/v1", "refs/tags/v2"]
+    assert git("rev-parse", "main", cwd=restored) == git("rev-parse", "main", cwd=source)
+    assert (restored / "file").read_text() == "content"
+    assert git("remote", "get-url", "origin", cwd=restored).strip() == str(tmp_path / "remote.git")
+
+
+def test_restore_not_empty_destination_should_raise(tmp_path: Path) -> None:
+    chain = update(tmp_path, create_source(tmp_path))
+    (tmp_path / "restored").mkdir()
+    (tmp_path / "restored" / "file").touch()
+
+    with pytest.raises(FileExistsError):
+        chain.restore(tmp_path / "restored")
@@ -0,0 +1,127 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from devsync.changes import ChangeJournal, SyncStamp
+
+
+@pytest.fixture
+def journal(tmp_path: Path) -> ChangeJournal:
+    journal = ChangeJournal(tmp_path / "changes.jsonl")
+    journal.start([Path("/home/Dev"), Path("/home/Docs")])
+    return journal
+
+
+def started_at(journal: ChangeJournal) -> float:
+    return json.loads(journal.path.read_text().splitlines()[0])["time"]
+
+
+def test_get_dirty_changes_since_last_sync(journal: ChangeJournal) -> None:
+    since = started_at(journal) + 1000
+    journal.record_dirty(["/home/Dev/old"], since - 2 * ChangeJournal.SAFETY_MARGIN)
+    journal.record_dirty(["/home/Dev/b", "/home/Dev/a"], since - 1)
+    journal.record_dirty(["/home/Dev/a"], since + 1)
+
+    assert journal.get_dirty([Path("/home/Dev")], since) == [Path("/home/Dev/a"), Path("/home/Dev/b")]
+
+
+def test_get_dirty_no_changes_empty(journal: ChangeJournal) -> None:
+    assert journal.get_dirty([Path("/home/Dev")], started_at(journal)) == []
+
+
+def test_get_dirty_missing_journal_none(tmp_path: Path) -> None:
+    assert ChangeJournal(tmp_path / "missing.jsonl").get_dirty([Path("/home/Dev")], 0) is None
+
+
+def test_get_dirty_started_after_last_sync_none(journal: ChangeJournal) -> None:
+    assert journal.get_dirty([Path("/home/Dev")], started_at(journal) - 1) is None
+
+
+def test_get_dirty_folder_not_watched_none(journal: ChangeJournal) -> None:
+    assert journal.get_dirty([Path("/home/Pictures")], started_at(journal)) is None
+
+
+def test_get_dirty_overflow_none(journal: ChangeJournal) -> None:
+    journal.record_overflow()
+    assert journal.get_dirty([Path("/home/Dev")], started_at(journal)) is None
+
+
+def test_get_dirty_overflow_before_last_sync_ignored(journal: ChangeJournal) -> None:
+    journal.record_overflow()
+    journal.record_dirty(["/home/Dev/a"], started_at(journal) + 1000)
+
+    assert journal.get_dirty([Path("/home/Dev")], started_at(journal) + 1000) == [Path("/home/Dev/a")]
+
+
+def test_compact_keeps_latest_entries(journal: ChangeJournal) -> None:
+    since = started_at(journal) + 1000
+    for offset in range(100):
+        journal.record_dirty(["/home/Dev/a", "/home/Dev/b"], since - 100 + offset)
+    journal.record_overflow()
+    journal.record_overflow()
+
+    journal.compact()
+
+    expected_entries = 4  # Start, the latest overflow and the latest change of each directory
+    assert len(journal.path.read_text().splitlines()) == expected_entries
+    assert journal.get_dirty([Path("/home/Dev")], since) == [Path("/home/Dev/a"), Path("/home/Dev/b")]
+    assert journal.get_dirty([Path("/home/Dev")], started_at(journal)) is None
+
+
+def test_compact_drops_expired_entries(journal: ChangeJournal, monkeypatch: pytest.MonkeyPatch) -> None:
+    since = started_at(journal)
+    journal.record_dirty(["/home/Dev/a"], since - 1)
+    monkeypatch.setattr(ChangeJournal, "RETENTION", 0.0)
+
+    journal.compact()
+
+    assert "/home/Dev/a" not in journal.path.read_text()
+    assert journal.get_dirty([Path("/home/Dev")], since) is None
+    assert journal.get_dirty([Path("/home/Dev")], since + 1000) == []
+
+
+def test_compact_keeps_unwatched_directories(journal: ChangeJournal, monkeypatch: pytest.MonkeyPatch) -> None:
+    journal.record_unwatched("/home/Dev/a")
+    journal.record_dirty(["/home/Dev/a"], started_at(journal) + 1)
+    monkeypatch.setattr(ChangeJournal, "RETENTION", -1000.0)
+
+    journal.compact()
+
+    assert "unwatched" in journal.path.read_text()
+    assert journal.get_dirty([Path("/home/Dev")], started_at(journal) + 2000) is None
+
+
+def test_compact_missing_journal(tmp_path: Path) -> None:
+    ChangeJournal(tmp_path / "changes.jsonl").compact()
+
+    assert not (tmp_path / "changes.jsonl").exists()
+
+
+def test_get_dirty_watcher_stopped_none(journal: ChangeJournal) -> None:
+    journal.record_stop()
+    assert journal.get_dirty([Path("/home/Dev")], started_at(journal)) is None
+
+
+def test_get_dirty_watcher_not_running_none(journal: ChangeJournal) -> None:
+    lines = journal.path.read_text().splitlines()
+    start = json.loads(lines[0])
+    start["pid"] = 2**22 + 1  # Above the maximum pid of Linux
+    journal.path.write_text(json.dumps(start) + "\n")
+
+    assert journal.get_dirty([Path("/home/Dev")], start["time"]) is None
+
+
+def test_is_running_own_process() -> None:
+    assert ChangeJournal.is_running(os.getpid())
+
+
+def test_sync_stamp_save_and_load(tmp_path: Path) -> None:
+    stamp = SyncStamp(tmp_path / ".devsync")
+    assert stamp.load() is None
+
+    expected_time = 1234.5
+    stamp.save(expected_time)
+
+    assert SyncStamp(tmp_path / ".devsync").load() == expected_time
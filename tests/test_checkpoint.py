@@ -0,0 +1,74 @@
+from pathlib import Path
+
+from devsync.checkpoint import CheckpointJournal, open_checkpoint
+
+
+def test_load_completed_repos_and_folders_of_interrupted_run(tmp_path: Path) -> None:
+    checkpoint = CheckpointJournal(tmp_path)
+    checkpoint.start()
+    checkpoint.record_repo(Path("dev/repo"))
+    checkpoint.record_folder("dev")
+
+    resumed = CheckpointJournal(tmp_path)
+
+    assert resumed.load()
+    assert resumed.is_repo_done(Path("dev/repo"))
+    assert not resumed.is_repo_done(Path("dev/other"))
+    assert resumed.is_folder_done("dev")
+    assert resumed.started == checkpoint.started
+
+
+def test_load_line_cut_off_by_crash_ignored(tmp_path: Path) -> None:
+    checkpoint = CheckpointJournal(tmp_path)
+    checkpoint.start()
+    checkpoint.record_repo(Path("dev/repo"))
+    with checkpoint.path.open("a") as journal:
+        journal.write('{"event": "repo", "path": "dev/ot')
+
+    resumed = CheckpointJournal(tmp_path)
+
+    assert resumed.load()
+    assert resumed.repos == {"dev/repo"}
+
+
+def test_load_no_journal_nothing_to_resume(tmp_path: Path) -> None:
+    assert not CheckpointJournal(tmp_path).load()
+
+
+def test_start_drops_entries_of_earlier_run(tmp_path: Path) -> None:
+    checkpoint = CheckpointJournal(tmp_path)
+    checkpoint.start()
+    checkpoint.record_folder("dev")
+
+    checkpoint.start()
+
+    resumed = CheckpointJournal(tmp_path)
+    assert resumed.load()
+    assert not resumed.folders
+
+
+def test_clear_removes_journal(tmp_path: Path) -> None:
+    checkpoint = CheckpointJournal(tmp_path)
+    checkpoint.start()
+
+    checkpoint.clear()
+
+    assert not checkpoint.path.exists()
+
+
+def test_open_checkpoint_without_resume_starts_new_journal(tmp_path: Path) -> None:
+    checkpoint = CheckpointJournal(tmp_path)
+    checkpoint.start()
+    checkpoint.record_repo(Path("dev/repo"))
+
+    reopened = open_checkpoint(tmp_path, resume=False, dry_run=False)
+
+    assert not reopened.repos
+    assert CheckpointJournal(tmp_path).load()
+    assert not CheckpointJournal(tmp_path).repos
+
+
+def test_open_checkpoint_dry_run_writes_nothing(tmp_path: Path) -> None:
+    open_checkpoint(tmp_path / ".devsync", resume=True, dry_run=True)
+
+    assert not (tmp_path / ".devsync").exists()
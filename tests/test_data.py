@@ -4,7 +4,31 @@ from unittest.mock import MagicMock, patch
 
 from pyfakefs.fake_filesystem_unittest import TestCase
 
-from devsync.data import BackupFolder, GitRepo, HgRepo, Repo, Target
+from devsync.data import (
+    BackupFolder,
+    GitRepo,
+    HgRepo,
+    Repo,
+    Target,
+    find_repos_in_backup_folders,
+    get_remote_host,
+)
+from devsync.excludes import IGNORE_FILE, Excludes
+
+
+class RemoteHostTest(TestCase):
+    def test_get_remote_host_https_url(self):
+        self.assertEqual("github.com", get_remote_host("https://github.com/foo/bar.git"))
+
+    def test_get_remote_host_ssh_url_with_port(self):
+        self.assertEqual("server.com", get_remote_host("ssh://git@server.com:2222/foo/bar.git"))
+
+    def test_get_remote_host_scp_like_url(self):
+        self.assertEqual("github.com", get_remote_host("git@github.com:foo/bar.git"))
+
+    def test_get_remote_host_local_path_should_be_empty(self):
+        self.assertEqual("", get_remote_host("/home/user/repo"))
+        self.assertEqual("", get_remote_host("file:///home/user/repo"))
 
 
 class TargetTest(TestCase):
@@ -85,14 +109,56 @@ class BackupFolderTest(TestCase):
         self.assertEqual(Path("/home/user/test/repo_in"), backup_folder.repos[0].path)
         self.assertTrue(backup_folder.has_repos)
 
+    def test_find_repos_in_path_nested_and_svn_repos_should_be_pruned(self):
+        self.create_git_repo_in_path(Path("/home/user/test/repo"))
+        self.create_git_repo_in_path(Path("/home/user/test/repo/nested"))
+        self.fs.create_dir("/home/user/test/svn/.svn")
+        self.create_git_repo_in_path(Path("/home/user/test/svn/inner"))
+        self.fs.create_dir("/home/user/test/hg/.hg")
+        backup_folder = BackupFolder(Path("/home/user"), "test")
+
+        backup_folder.find_repos_in_path()
+
+        self.assertListEqual([Path("hg"), Path("repo")], backup_folder.get_relative_repo_paths())
+        self.assertListEqual(["Hg", "Git"], [repo.repo_type for repo in backup_folder.repos])
+
+    def test_find_repos_in_path_excluded_directories_should_be_pruned(self):
+        self.create_git_repo_in_path(Path("/home/user/test/repo"))
+        self.create_git_repo_in_path(Path("/home/user/test/web/node_modules/pkg"))
+        self.create_git_repo_in_path(Path("/home/user/test/web/vendor/lib"))
+        self.fs.create_file(f"/home/user/test/web/{IGNORE_FILE}", contents="/vendor\n")
+        backup_folder = BackupFolder(Path("/home/user"), "test", Excludes.from_patterns(["node_modules"]))
+
+        backup_folder.find_repos_in_path()
+
+        self.assertListEqual([Path("repo")], backup_folder.get_relative_repo_paths())
+
+    def test_find_repos_in_backup_folders_parallel_should_be_sorted_per_folder(self):
+        names = ["b", "a/z", "a/b/c", "c", "a-b"]
+        for name in names:
+            self.create_git_repo_in_path(Path("/home/user/test") / name)
+            self.create_git_repo_in_path(Path("/home/user/other") / name)
+        backup_folders = [BackupFolder(Path("/home/user"), "test"), BackupFolder(Path("/home/user"), "other")]
+
+        find_repos_in_backup_folders(backup_folders, jobs=4)
+
+        expected = [Path("a/b/c"), Path("a/z"), Path("a-b"), Path("b"), Path("c")]
+        for backup_folder in backup_folders:
+            self.assertListEqual(expected, backup_folder.get_relative_repo_paths())
+
 
 class RepoTest(TestCase):
     class TestRepo(Repo):
-        def __init__(self, path: str, last_update=0):
+        def __init__(self, path: str, last_update=0, is_mirror=False):
             super().__init__(path)
             self.__last_update = last_update
+            self.__is_mirror = is_mirror
             self.pull_called = False
             self.clone_called = False
+            self.pull_from_source_called = False
+            self.clone_from_source_called = False
+            self.update_mirror_called = False
+            self.clone_mirror_called = False
 
         @property
         def repo_type(self) -> str:
@@ -108,16 +174,31 @@ class RepoTest(TestCase):
         def _clone_repo(self, url: str, target_path: Path):
             self.clone_called = True
 
+        def _pull_repo_from_source(self, target_path: Path):
+            self.pull_from_source_called = True
+
+        def _clone_repo_from_source(self, url: str, target_path: Path):
+            self.clone_from_source_called = True
+
         def _get_clone_url(self):
             return ""
 
-    def __create_target(self, root: Path, path: Path) -> Target:
+        def _is_mirror(self, target_path: Path) -> bool:
+            return self.__is_mirror
+
+        def _clone_mirror(self, url: str, target_path: Path, local_source: bool):
+            self.clone_mirror_called = True
+
+        def _update_mirror(self, target_path: Path, local_source: bool):
+            self.update_mirror_called = True
+
+    def __create_target(self, root: Path, path: Path, mirror: bool = False) -> Target:
         self.fs.create_dir(path)
-        return Target(root)
+        return Target(root, mirror)
 
-    def __create_target_root_only(self, path: Path) -> Target:
+    def __create_target_root_only(self, path: Path, mirror: bool = False) -> Target:
         self.fs.create_dir(path)
-        return Target(path)
+        return Target(path, mirror)
 
     def setUp(self) -> None:
         self.setUpPyfakefs()
@@ -174,6 +255,53 @@ class RepoTest(TestCase):
         unit.update_repo_on_target(Path("/bar"), target, True)
         self.assertFalse(unit.clone_called)
 
+    def test_update_repo_on_target_when_exists_and_local_source_should_have_pulled_from_source(self):
+        target = self.__create_target(Path("/foo"), Path("/foo/repo"))
+        unit = self.TestRepo("/bar/repo")
+
+        unit.update_repo_on_target(Path("/bar"), target, False, local_source=True)
+        self.assertTrue(unit.pull_from_source_called)
+        self.assertFalse(unit.pull_called)
+
+    def test_update_repo_on_target_when_not_exists_and_local_source_should_have_cloned_from_source(self):
+        target = self.__create_target_root_only(Path("/foo"))
+        unit = self.TestRepo("/bar/repo")
+
+        unit.update_repo_on_target(Path("/bar"), target, False, local_source=True)
+        self.assertTrue(unit.clone_from_source_called)
+        self.assertFalse(unit.clone_called)
+
+    def test_update_repo_on_target_when_not_exists_and_mirror_should_have_cloned_mirror(self):
+        target = self.__create_target_root_only(Path("/foo"), mirror=True)
+        unit = self.TestRepo("/bar/repo")
+
+        unit.update_repo_on_target(Path("/bar"), target, False)
+        self.assertTrue(unit.clone_mirror_called)
+        self.assertFalse(unit.clone_called)
+
+    def test_update_repo_on_target_when_exists_and_mirror_should_have_updated_mirror(self):
+        target = self.__create_target(Path("/foo"), Path("/foo/repo"), mirror=True)
+        unit = self.TestRepo("/bar/repo")
+
+        unit.update_repo_on_target(Path("/bar"), target, False)
+        self.assertTrue(unit.update_mirror_called)
+        self.assertFalse(unit.pull_called)
+
+    def test_update_repo_on_target_when_stored_as_mirror_should_stay_mirror(self):
+        target = self.__create_target(Path("/foo"), Path("/foo/repo"))
+        unit = self.TestRepo("/bar/repo", is_mirror=True)
+
+        unit.update_repo_on_target(Path("/bar"), target, False)
+        self.assertTrue(unit.update_mirror_called)
+        self.assertFalse(unit.pull_called)
+
+    def test_update_repo_on_target_when_bundles_not_supported_should_have_called_clone(self):
+        self.fs.create_dir("/foo")
+        unit = self.TestRepo("/bar/repo")
+
+        unit.update_repo_on_target(Path("/bar"), Target("/foo", bundles=True), False)
+        self.assertTrue(unit.clone_called)
+
 
 class HgRepoTest(TestCase):
     HG_HEADS_DATE_LINE = "date:        Mon Nov 19 10:37:51 2018 +0100"
@@ -195,18 +323,22 @@ class HgRepoTest(TestCase):
         repo = HgRepo("")
         self.assertEqual("Hg", repo.repo_type)
 
+    @patch("devsync.data.hg_command_server.run", MagicMock(side_effect=CalledProcessError(255, "")))
+    @patch("devsync.runner.CommandRunner.run", MagicMock(return_value="default 1234567890ab" + "c" * 28 + "\n"))
+    def test_get_refs_one_head(self):
+        self.assertDictEqual({"default/1234567890ab": "1234567890ab" + "c" * 28}, HgRepo("").get_refs())
+
 
 class GitRepoTest(TestCase):
     @staticmethod
-    def create_test_output(default_branch: str) -> bytes:
-        test_output = (
+    def create_test_output(default_branch: str) -> str:
+        return (
             "  Fetch URL: https://github.com/foo/bar.git\n"
             "  Push  URL: https://github.com/foo/bar.git\n"
             f"  HEAD branch: {default_branch}\n"
             "  Remote branch:\n"
             "    master tracked\n"
         )
-        return test_output.encode("utf-8")
 
     def setUp(self) -> None:
         self.setUpPyfakefs()
@@ -217,22 +349,22 @@ class GitRepoTest(TestCase):
 
     def test_get_default_branch_with_master_should_return_master(self):
         with patch(
-            "subprocess.check_output",
+            "devsync.runner.CommandRunner.run",
             MagicMock(return_value=GitRepoTest.create_test_output("master")),
         ):
             self.assertEqual("master", GitRepo.get_default_branch(Path()))
 
     def test_get_default_branch_with_main_should_return_main(self):
         with patch(
-            "subprocess.check_output",
+            "devsync.runner.CommandRunner.run",
             MagicMock(return_value=GitRepoTest.create_test_output("main")),
         ):
             self.assertEqual("main", GitRepo.get_default_branch(Path()))
 
-    @patch("subprocess.check_output", MagicMock(side_effect=CalledProcessError(2, "")))
+    @patch("devsync.runner.CommandRunner.run", MagicMock(side_effect=CalledProcessError(2, "")))
     def test_get_default_branch_with_exception_should_return_master(self):
         self.assertEqual("master", GitRepo.get_default_branch(Path()))
 
-    @patch("subprocess.check_output", MagicMock(return_value=b"foo bar"))
+    @patch("devsync.runner.CommandRunner.run", MagicMock(return_value="foo bar"))
     def test_get_default_branch_with_invalid_output_should_return_master(self):
         self.assertEqual("master", GitRepo.get_default_branch(Path()))
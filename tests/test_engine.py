@@ -0,0 +1,191 @@
+import os
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from devsync.data import BackupFolder, Repo, Target
+from devsync.engine import CopyEngine, FileManifest, copy_file_data
+from devsync.excludes import IGNORE_FILE, Excludes
+
+
+def create_source(root: Path) -> BackupFolder:
+    (root / "Dev" / "sub").mkdir(parents=True)
+    (root / "Dev" / "a.txt").write_text("a")
+    (root / "Dev" / "sub" / "b.txt").write_text("b")
+    (root / "Dev" / "repo" / ".git").mkdir(parents=True)
+    (root / "Dev" / "repo" / "file").write_text("repo")
+    backup_folder = BackupFolder(root, "Dev")
+    backup_folder.repos.append(Repo(root / "Dev" / "repo"))
+    return backup_folder
+
+
+def create_target(path: Path) -> Target:
+    path.mkdir()
+    return Target(path)
+
+
+def test_copy_file_data(tmp_path: Path) -> None:
+    source = tmp_path / "source"
+    source.write_bytes(os.urandom(1 << 16))
+
+    copy_file_data(source, tmp_path / "destination")
+
+    assert (tmp_path / "destination").read_bytes() == source.read_bytes()
+
+
+def test_sync_copies_files_without_repos(tmp_path: Path) -> None:
+    backup_folder = create_source(tmp_path / "home")
+    target = create_target(tmp_path / "target")
+
+    stats = CopyEngine(tmp_path / "home", [backup_folder]).sync(target, False)
+
+    expected_transferred = 2
+    assert (target.path / "Dev" / "a.txt").read_text() == "a"
+    assert (target.path / "Dev" / "sub" / "b.txt").read_text() == "b"
+    assert not (target.path / "Dev" / "repo").exists()
+    assert stats["Number of regular files transferred"] == expected_transferred
+
+
+def test_sync_preserves_mtime(tmp_path: Path) -> None:
+    backup_folder = create_source(tmp_path / "home")
+    expected_mtime = 1_000_000_000
+    os.utime(tmp_path / "home" / "Dev" / "a.txt", ns=(1, expected_mtime))
+    target = create_target(tmp_path / "target")
+
+    CopyEngine(tmp_path / "home", [backup_folder]).sync(target, False)
+
+    assert (target.path / "Dev" / "a.txt").stat().st_mtime_ns == expected_mtime
+
+
+def test_sync_skips_unchanged_files(tmp_path: Path) -> None:
+    backup_folder = create_source(tmp_path / "home")
+    target = create_target(tmp_path / "target")
+    CopyEngine(tmp_path / "home", [backup_folder]).sync(target, False)
+    (tmp_path / "home" / "Dev" / "a.txt").write_text("changed")
+
+    stats = CopyEngine(tmp_path / "home", [backup_folder]).sync(target, False)
+
+    assert stats["Number of regular files transferred"] == 1
+    assert (target.path / "Dev" / "a.txt").read_text() == "changed"
+
+
+def test_sync_deletes_removed_files_but_keeps_repos(tmp_path: Path) -> None:
+    backup_folder = create_source(tmp_path / "home")
+    target = create_target(tmp_path / "target")
+    (target.path / "Dev" / "repo").mkdir(parents=True)
+    (target.path / "Dev" / "old").mkdir()
+    (target.path / "Dev" / "old" / "c.txt").write_text("c")
+
+    stats = CopyEngine(tmp_path / "home", [backup_folder]).sync(target, False)
+
+    assert not (target.path / "Dev" / "old").exists()
+    assert (target.path / "Dev" / "repo").exists()
+    assert stats["Number of deleted files"] == 1
+
+
+def test_sync_dry_run_changes_nothing(tmp_path: Path) -> None:
+    backup_folder = create_source(tmp_path / "home")
+    target = create_target(tmp_path / "target")
+    (target.path / "Dev").mkdir()
+    (target.path / "Dev" / "old").write_text("old")
+
+    stats = CopyEngine(tmp_path / "home", [backup_folder]).sync(target, True)
+
+    assert sorted(path.name for path in target.path.rglob("*")) == ["Dev", "old"]
+    assert stats["Number of deleted files"] == 1
+    assert stats["Number of regular files transferred"] == 0
+
+
+def test_sync_copies_symlinks(tmp_path: Path) -> None:
+    backup_folder = create_source(tmp_path / "home")
+    (tmp_path / "home" / "Dev" / "link").symlink_to("a.txt")
+    target = create_target(tmp_path / "target")
+
+    CopyEngine(tmp_path / "home", [backup_folder]).sync(target, False)
+
+    assert (target.path / "Dev" / "link").readlink() == Path("a.txt")
+
+
+def test_sync_skips_and_keeps_excluded_entries(tmp_path: Path) -> None:
+    create_source(tmp_path / "home")
+    (tmp_path / "home" / "Dev" / "sub" / "debug.log").write_text("log")
+    (tmp_path / "home" / "Dev" / "sub" / "build").mkdir()
+    (tmp_path / "home" / "Dev" / "sub" / "build" / "out").write_text("out")
+    (tmp_path / "home" / "Dev" / "sub" / IGNORE_FILE).write_text("/build\n")
+    backup_folder = BackupFolder(tmp_path / "home", "Dev", Excludes.from_patterns(["*.log"]))
+    target = create_target(tmp_path / "target")
+    (target.path / "Dev").mkdir()
+    (target.path / "Dev" / "old.log").write_text("old")
+
+    CopyEngine(tmp_path / "home", [backup_folder]).sync(target, False)
+
+    assert (target.path / "Dev" / "sub" / "b.txt").exists()
+    assert not (target.path / "Dev" / "sub" / "debug.log").exists()
+    assert not (target.path / "Dev" / "sub" / "build").exists()
+    assert (target.path / "Dev" / "old.log").exists()
+
+
+def test_file_manifest_forget_directory(tmp_path: Path) -> None:
+    manifest = FileManifest(tmp_path)
+    source_stat = tmp_path.stat()
+    manifest.record("Dev/sub/a", source_stat)
+    manifest.record("Dev/subway", source_stat)
+    manifest.forget("Dev/sub")
+    manifest.save()
+
+    reloaded = FileManifest(tmp_path)
+
+    assert not reloaded.is_unchanged("Dev/sub/a", source_stat)
+    assert reloaded.is_unchanged("Dev/subway", source_stat)
+
+
+def test_sync_missing_source_folder_keeps_target(tmp_path: Path) -> None:
+    target = create_target(tmp_path / "target")
+    (target.path / "Dev").mkdir()
+    (target.path / "Dev" / "a.txt").write_text("a")
+
+    stats = CopyEngine(tmp_path / "home", [BackupFolder(tmp_path / "home", "Dev")]).sync(target, False)
+
+    assert (target.path / "Dev" / "a.txt").exists()
+    assert stats["Number of errors"] == 1
+    assert stats["Number of deleted files"] == 0
+
+
+def test_sync_unreadable_source_directory_skips_deletions(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    backup_folder = create_source(tmp_path / "home")
+    target = create_target(tmp_path / "target")
+    CopyEngine(tmp_path / "home", [backup_folder]).sync(target, False)
+    unreadable = tmp_path / "home" / "Dev" / "sub"
+    scandir = os.scandir
+
+    def failing_scandir(path: Path) -> Iterator[os.DirEntry]:
+        if Path(path) == unreadable:
+            raise PermissionError(13, "Permission denied", str(path))
+        return scandir(path)
+
+    monkeypatch.setattr("devsync.engine.os.scandir", failing_scandir)
+
+    stats = CopyEngine(tmp_path / "home", [backup_folder]).sync(target, False)
+
+    assert (target.path / "Dev" / "sub" / "b.txt").exists()
+    assert stats["Number of errors"] == 1
+    assert stats["Number of deleted files"] == 0
+
+
+def test_sync_failed_delete_counted_as_error(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    backup_folder = create_source(tmp_path / "home")
+    target = create_target(tmp_path / "target")
+    (target.path / "Dev").mkdir()
+    (target.path / "Dev" / "old").write_text("old")
+
+    def failing_remove(path: Path) -> None:
+        raise PermissionError(13, "Permission denied", str(path))
+
+    monkeypatch.setattr(CopyEngine, "remove", staticmethod(failing_remove))
+
+    stats = CopyEngine(tmp_path / "home", [backup_folder]).sync(target, False)
+
+    assert stats["Number of errors"] == 1
+    assert stats["Number of deleted files"] == 0
+    assert (target.path / "Dev" / "a.txt").exists()
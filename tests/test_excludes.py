@@ -0,0 +1,89 @@
+from pathlib import Path
+
+from pyfakefs.fake_filesystem import FakeFilesystem
+
+from devsync.excludes import IGNORE_FILE, Excludes
+
+
+def test_matches_name_pattern_at_any_depth() -> None:
+    excludes = Excludes.from_patterns(["node_modules", "*.pyc"])
+
+    assert excludes.matches("node_modules", is_dir=True)
+    assert excludes.matches("web/app/node_modules", is_dir=True)
+    assert excludes.matches("tool/cache/module.pyc", is_dir=False)
+    assert not excludes.matches("web/node_modules_backup", is_dir=True)
+
+
+def test_matches_anchored_pattern_only_at_base() -> None:
+    excludes = Excludes.from_patterns(["/build"])
+
+    assert excludes.matches("build", is_dir=True)
+    assert not excludes.matches("project/build", is_dir=True)
+
+
+def test_matches_pattern_with_slash_matches_end_of_path() -> None:
+    excludes = Excludes.from_patterns(["target/debug"])
+
+    assert excludes.matches("target/debug", is_dir=True)
+    assert excludes.matches("rust/app/target/debug", is_dir=True)
+    assert not excludes.matches("rust/target/release", is_dir=True)
+
+
+def test_matches_trailing_slash_only_directories() -> None:
+    excludes = Excludes.from_patterns(["cache/"])
+
+    assert excludes.matches("app/cache", is_dir=True)
+    assert not excludes.matches("app/cache", is_dir=False)
+
+
+def test_from_patterns_ignores_comments_and_blank_lines() -> None:
+    excludes = Excludes.from_patterns(["# comment", "", "  dist  "])
+
+    assert excludes.patterns == ["dist"]
+
+
+def test_with_paths_matches_exact_paths_only() -> None:
+    excludes = Excludes().with_paths(["sub/repo"])
+
+    assert excludes
+    assert excludes.matches("sub/repo", is_dir=True)
+    assert not excludes.matches("other/sub/repo", is_dir=True)
+
+
+def test_with_ignore_file_patterns_apply_below_its_directory(fs: FakeFilesystem) -> None:
+    fs.create_file(f"/home/user/Dev/web/{IGNORE_FILE}", contents="/dist\n*.log\n")
+
+    excludes = Excludes().with_ignore_file(Path("/home/user/Dev/web"), "web")
+
+    assert excludes.matches("web/dist", is_dir=True)
+    assert excludes.matches("web/src/debug.log", is_dir=False)
+    assert not excludes.matches("dist", is_dir=True)
+    assert not excludes.matches("other/debug.log", is_dir=False)
+
+
+def test_is_excluded_checks_parents_and_ignore_files(fs: FakeFilesystem) -> None:
+    fs.create_file(f"/home/user/Dev/web/{IGNORE_FILE}", contents="generated\n")
+    fs.create_dir("/home/user/Dev/web/generated/deep")
+    excludes = Excludes.from_patterns(["node_modules"])
+
+    assert excludes.is_excluded(Path("/home/user/Dev"), "app/node_modules/pkg")
+    assert excludes.is_excluded(Path("/home/user/Dev"), "web/generated/deep")
+    assert not excludes.is_excluded(Path("/home/user/Dev"), "web/src")
+
+
+def test_get_rsync_rules_anchored_below_prefix() -> None:
+    excludes = Excludes.from_patterns(["/build", "*.pyc"]).extend(["dist"], "web")
+
+    rules = excludes.get_rsync_rules("/Development")
+
+    assert rules == [
+        "/Development/build",
+        "/Development/*.pyc",
+        "/Development/**/*.pyc",
+        "/Development/web/dist",
+        "/Development/web/**/dist",
+    ]
+
+
+def test_get_rsync_rules_without_prefix_unanchored_pattern_unchanged() -> None:
+    assert Excludes.from_patterns(["*.pyc", "/build"]).get_rsync_rules("") == ["*.pyc", "/build"]
@@ -0,0 +1,118 @@
+import subprocess
+import sys
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from devsync.data import HgRepo
+from devsync.hg import HgCommandServer, HgState, parse_hg_state
+from devsync.runner import command_runner
+
+NODE = "1234567890ab" + "c" * 28
+HG_STATE_OUTPUT = (
+    f"{NODE}\t1542620271 -3600\tdefault\thttps://server.com/user/repo\n"
+    f"{'d' * 40}\t1600000000 0\tmy branch\thttps://server.com/user/repo\n"
+)
+
+# Speaks the command server protocol, echoes the arguments and fails on "fail"
+FAKE_SERVER = r"""
+import struct, sys
+out = sys.stdout.buffer
+def send(channel, data):
+    out.write(channel + struct.pack(">I", len(data)) + data)
+    out.flush()
+send(b"o", b"capabilities: getencoding runcommand\nencoding: UTF-8")
+while sys.stdin.buffer.readline() == b"runcommand\n":
+    length = struct.unpack(">I", sys.stdin.buffer.read(4))[0]
+    args = sys.stdin.buffer.read(length).split(b"\0")
+    if b"stall" in args:
+        sys.stdin.buffer.readline()
+    if b"fail" in args:
+        send(b"e", b"abort: failed\n")
+        send(b"r", struct.pack(">i", 255))
+    else:
+        send(b"o", b" ".join(args))
+        send(b"r", struct.pack(">i", 0))
+"""
+
+
+def test_parse_hg_state_newest_head_and_all_refs() -> None:
+    state = parse_hg_state(HG_STATE_OUTPUT)
+
+    expected_commit_time = 1600000000
+    assert state.commit_time == expected_commit_time
+    assert state.refs == {"default/1234567890ab": NODE, "my branch/dddddddddddd": "d" * 40}
+    assert state.url == "https://server.com/user/repo"
+
+
+def test_parse_hg_state_no_heads() -> None:
+    assert parse_hg_state("") == HgState(0.0, {}, "")
+
+
+def test_command_server_runs_several_commands_in_one_process() -> None:
+    server = HgCommandServer((sys.executable, "-c", FAKE_SERVER))
+    try:
+        assert server.run(["-R", "/repo", "log"]) == "-R /repo log"
+        assert server.run(["paths"]) == "paths"
+    finally:
+        server.close()
+
+
+def test_command_server_failing_command_raises() -> None:
+    server = HgCommandServer((sys.executable, "-c", FAKE_SERVER))
+    try:
+        with pytest.raises(subprocess.CalledProcessError) as error:
+            server.run(["fail"])
+        assert "abort: failed" in error.value.stderr
+        assert server.run(["log"]) == "log"
+    finally:
+        server.close()
+
+
+def test_command_server_stalled_command_killed_after_timeout(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(command_runner, "timeout", 0.5)
+    server = HgCommandServer((sys.executable, "-c", FAKE_SERVER))
+    try:
+        start = time.perf_counter()
+        with pytest.raises(OSError, match="timed out"):
+            server.run(["stall"])
+        expected_max_seconds = 10
+        assert time.perf_counter() - start < expected_max_seconds
+        assert server.run(["log"]) == "log"
+    finally:
+        server.close()
+
+
+def test_command_server_not_startable_raises_os_error() -> None:
+    server = HgCommandServer(("/nonexistent/hg",))
+    with pytest.raises(OSError, match="nonexistent"):
+        server.run(["log"])
+    with pytest.raises(OSError, match="not available"):
+        server.run(["log"])
+
+
+@patch("devsync.data.hg_command_server.run", MagicMock(return_value=HG_STATE_OUTPUT))
+def test_hg_repo_state_read_with_one_query() -> None:
+    repo = HgRepo(Path("/repo"))
+
+    expected_commit_time = 1600000000
+    assert repo.get_refs() == parse_hg_state(HG_STATE_OUTPUT).refs
+    assert repo.is_update_required(expected_commit_time - 1)
+    assert repo.remote_host == "server.com"
+
+
+def test_hg_repo_template_not_supported_falls_back_to_plain_output() -> None:
+    server_run = MagicMock(side_effect=subprocess.CalledProcessError(255, ["hg"], "", "hg: parse error"))
+    runner_run = MagicMock(return_value=f"default {NODE}\n")
+    with patch("devsync.data.hg_command_server.run", server_run), patch("devsync.runner.CommandRunner.run", runner_run):
+        assert HgRepo(Path("/repo")).get_refs() == {"default/1234567890ab": NODE}
+
+
+def test_hg_repo_without_command_server_runs_hg() -> None:
+    server_run = MagicMock(side_effect=OSError("no hg"))
+    runner_run = MagicMock(return_value=HG_STATE_OUTPUT)
+    with patch("devsync.data.hg_command_server.run", server_run), patch("devsync.runner.CommandRunner.run", runner_run):
+        assert HgRepo(Path("/repo")).get_refs() == parse_hg_state(HG_STATE_OUTPUT).refs
+    assert runner_run.call_args.args[0].args[:2] == ["hg", "log"]
@@ -0,0 +1,71 @@
+import os
+from pathlib import Path
+
+from pyfakefs.fake_filesystem import FakeFilesystem
+
+from devsync.data import RepoScanner
+from devsync.index import DiscoveryIndex
+
+INDEX_FILE = Path("/state/discovery.json")
+
+
+def test_load_missing_index_should_be_empty(fs: FakeFilesystem) -> None:
+    assert DiscoveryIndex(INDEX_FILE).lookup("/home/user", 1) is None
+
+
+def test_load_invalid_index_should_be_empty(fs: FakeFilesystem) -> None:
+    fs.create_file(INDEX_FILE, contents="not json")
+    assert DiscoveryIndex(INDEX_FILE).lookup("/home/user", 1) is None
+
+
+def test_lookup_after_save_and_load_with_same_mtime(fs: FakeFilesystem) -> None:
+    index = DiscoveryIndex(INDEX_FILE)
+    index.record("/home/user", 42, "", ["a", "b"])
+    index.save([Path("/home/user")])
+
+    reloaded = DiscoveryIndex(INDEX_FILE)
+
+    assert reloaded.lookup("/home/user", 42) == ("", ["a", "b"])
+    assert reloaded.lookup("/home/user", 43) is None
+
+
+def test_save_drops_unvisited_directories_below_scanned_roots_only(fs: FakeFilesystem) -> None:
+    index = DiscoveryIndex(INDEX_FILE)
+    index.record("/home/user/a", 1, "git", [])
+    index.record("/home/user/b", 1, "git", [])
+    index.record("/other/c", 1, "git", [])
+    index.save([Path("/home/user"), Path("/other")])
+
+    index = DiscoveryIndex(INDEX_FILE)
+    assert index.lookup("/home/user/a", 1) is not None
+    index.save([Path("/home/user")])
+
+    reloaded = DiscoveryIndex(INDEX_FILE)
+    assert reloaded.lookup("/home/user/a", 1) is not None
+    assert reloaded.lookup("/home/user/b", 1) is None
+    assert reloaded.lookup("/other/c", 1) is not None
+
+
+def test_scan_with_index_detects_new_repo_in_unchanged_parent(fs: FakeFilesystem) -> None:
+    root = Path("/home/user/Development")
+    fs.create_dir(root / "project/repo/.git")
+    fs.create_dir(root / "project/sub")
+    RepoScanner(index=DiscoveryIndex(INDEX_FILE)).scan([root])
+
+    fs.create_dir(root / "project/sub/new/.git")
+    os.utime(root / "project/sub", ns=(1, 1))  # pyfakefs does not touch the parent on mkdir
+    found = RepoScanner(index=DiscoveryIndex(INDEX_FILE)).scan([root])
+
+    assert [repo.path for repo in found[root]] == [root / "project/repo", root / "project/sub/new"]
+
+
+def test_scan_with_cleared_index_should_find_all_repos(fs: FakeFilesystem) -> None:
+    root = Path("/home/user/Development")
+    fs.create_dir(root / "repo/.hg")
+    RepoScanner(index=DiscoveryIndex(INDEX_FILE)).scan([root])
+
+    index = DiscoveryIndex(INDEX_FILE)
+    index.clear()
+    found = RepoScanner(index=index).scan([root])
+
+    assert [repo.repo_type for repo in found[root]] == ["Hg"]
@@ -1,8 +1,9 @@
 from pathlib import Path
+from unittest.mock import MagicMock
 
 from pyfakefs.fake_filesystem import FakeFilesystem
 
-from devsync.log import init_logging
+from devsync.log import init_logging, output_groups
 
 
 def test_init_logging___logfile_path_does_not_exist__should_be_created(
@@ -10,3 +11,16 @@ def test_init_logging___logfile_path_does_not_exist__should_be_created(
 ) -> None:
     init_logging(Path("logs/logfile"))
     assert fs.exists("logs/logfile")
+
+
+def test_grouped_output__records_held_back_until_group_left(fs: FakeFilesystem) -> None:
+    dev_sync_logger = init_logging(Path("logs/logfile"))
+    released = []
+    dev_sync_logger.addHandler(MagicMock(level=0, handle=released.append))
+
+    with output_groups.group(dev_sync_logger):
+        dev_sync_logger.info("first")
+        dev_sync_logger.info("second")
+        assert not released
+
+    assert [record.getMessage() for record in released] == ["first", "second"]
@@ -0,0 +1,98 @@
+from pathlib import Path
+
+import pytest
+
+from devsync.maintenance import MaintenancePolicy, PackStats, RepoMaintenance, get_git_dir
+from devsync.report import RunReport
+
+
+def create_git_dir(git_dir: Path, loose_objects: int = 0, packs: int = 0) -> Path:
+    (git_dir / "objects" / "17").mkdir(parents=True)
+    (git_dir / "objects" / "pack").mkdir()
+    (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+    for index in range(loose_objects):
+        (git_dir / "objects" / "17" / f"{index:038x}").write_text("")
+    for index in range(packs):
+        (git_dir / "objects" / "pack" / f"pack-{index}.pack").write_bytes(b"x" * 10)
+    return git_dir
+
+
+@pytest.fixture
+def maintenance(monkeypatch: pytest.MonkeyPatch) -> RepoMaintenance:
+    monkeypatch.setattr("devsync.maintenance.shutil.which", lambda _: None)
+    return RepoMaintenance(MaintenancePolicy(loose_objects=256, packs=2))
+
+
+def test_pack_stats_read_estimates_loose_objects(tmp_path: Path) -> None:
+    git_dir = create_git_dir(tmp_path / ".git", loose_objects=3, packs=2)
+    (git_dir / "objects" / "info").mkdir()
+    (git_dir / "objects" / "info" / "commit-graph").write_text("")
+
+    stats = PackStats.read(git_dir)
+
+    expected_loose_objects = 3 * 256
+    expected_pack_bytes = 20
+    assert stats == PackStats(expected_loose_objects, 2, expected_pack_bytes, True, False)
+
+
+def test_get_git_dir_working_copy_mirror_and_bundles(tmp_path: Path) -> None:
+    create_git_dir(tmp_path / "clone" / ".git")
+    create_git_dir(tmp_path / "mirror")
+    (tmp_path / "bundles").mkdir()
+    (tmp_path / "bundles" / "bundles.json").write_text("{}")
+
+    assert get_git_dir(tmp_path / "clone") == tmp_path / "clone" / ".git"
+    assert get_git_dir(tmp_path / "mirror") == tmp_path / "mirror"
+    assert get_git_dir(tmp_path / "bundles") is None
+
+
+def test_is_due_past_thresholds(maintenance: RepoMaintenance) -> None:
+    assert not maintenance.is_due(PackStats(256, 2, 0, False, False))
+    assert maintenance.is_due(PackStats(512, 1, 0, False, False))
+    assert maintenance.is_due(PackStats(0, 3, 0, False, False))
+
+
+def test_get_commands_repack_all_only_for_too_many_packs(maintenance: RepoMaintenance) -> None:
+    loose = maintenance.get_commands(PackStats(512, 1, 0, False, False))
+    packs = maintenance.get_commands(PackStats(0, 3, 0, False, False))
+
+    assert loose[0] == ["repack", "-d", "-l"]
+    assert packs[0] == ["repack", "-d", "-l", "-a"]
+    assert [command[0] for command in packs[1:]] == ["prune", "commit-graph", "multi-pack-index"]
+
+
+def test_maintain_repos_only_due_repos_with_stats(tmp_path: Path, maintenance: RepoMaintenance, fake_process) -> None:
+    create_git_dir(tmp_path / "Dev" / "due" / ".git", packs=3)
+    create_git_dir(tmp_path / "Dev" / "fine" / ".git", packs=1)
+    (tmp_path / "Dev" / "hg" / ".hg").mkdir(parents=True)
+    fake_process.register(["git", fake_process.any()], occurrences=4)
+    run_report = RunReport()
+
+    maintenance.maintain_repos(tmp_path, [Path("Dev/due"), Path("Dev/fine"), Path("Dev/hg")], False, run_report)
+
+    expected_commands = 4
+    expected_packs = 3
+    assert fake_process.call_count(["git", fake_process.any()]) == expected_commands
+    assert fake_process.calls[0][:2] == ["git", f"--git-dir={tmp_path / 'Dev' / 'due' / '.git'}"]
+    assert list(run_report.maintenance) == ["Dev/due"]
+    assert run_report.maintenance["Dev/due"]["before"]["packs"] == expected_packs
+    assert run_report.maintenance["Dev/due"]["error"] == ""
+
+
+def test_maintain_repos_failed_command_recorded(tmp_path: Path, maintenance: RepoMaintenance, fake_process) -> None:
+    create_git_dir(tmp_path / "repo" / ".git", packs=3)
+    fake_process.register(["git", fake_process.any()], returncode=1)
+    run_report = RunReport()
+
+    maintenance.maintain_repos(tmp_path, [Path("repo")], False, run_report)
+
+    assert fake_process.call_count(["git", fake_process.any()]) == 1
+    assert run_report.maintenance["repo"]["error"]
+
+
+def test_maintain_repos_dry_run_runs_nothing(tmp_path: Path, maintenance: RepoMaintenance, fake_process) -> None:
+    create_git_dir(tmp_path / "repo" / ".git", packs=3)
+
+    maintenance.maintain_repos(tmp_path, [Path("repo")], True)
+
+    assert not fake_process.calls
@@ -0,0 +1,25 @@
+from pathlib import Path
+
+from pyfakefs.fake_filesystem import FakeFilesystem
+
+from devsync.manifest import SyncManifest
+
+STATE_DIR = Path("/target/.devsync")
+REFS = {"refs/heads/main": "a" * 40}
+
+
+def test_get__missing_manifest__none(fs: FakeFilesystem) -> None:
+    assert SyncManifest(STATE_DIR).get(Path("Development/repo")) is None
+
+
+def test_get__corrupt_manifest__none(fs: FakeFilesystem) -> None:
+    fs.create_file(STATE_DIR / SyncManifest.FILENAME, contents="{")
+    assert SyncManifest(STATE_DIR).get(Path("Development/repo")) is None
+
+
+def test_record__saved_and_loaded__same_refs(fs: FakeFilesystem) -> None:
+    manifest = SyncManifest(STATE_DIR)
+    manifest.record(Path("Development/repo"), REFS)
+    manifest.save()
+
+    assert SyncManifest(STATE_DIR).get(Path("Development/repo")) == REFS
@@ -0,0 +1,90 @@
+import os
+import subprocess
+from pathlib import Path
+
+from devsync.data import GitRepo, Target
+
+GIT_ENV = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": "test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+}
+
+
+def git(*args: str, cwd: Path | None = None) -> str:
+    return subprocess.check_output(["git", "-c", "init.defaultBranch=main", *args], cwd=cwd, env=GIT_ENV, text=True)
+
+
+def create_source(tmp_path: Path) -> Path:
+    """Working copy below home with a second branch and a tag, pushed to a bare remote."""
+    remote = tmp_path / "remote.git"
+    source = tmp_path / "home" / "repo"
+    git("init", "-q", "--bare", str(remote))
+    git("init", "-q", str(source))
+    (source / "file").write_text("content")
+    git("add", "file", cwd=source)
+    git("commit", "-q", "-m", "init", cwd=source)
+    git("branch", "feature", cwd=source)
+    git("tag", "v1", cwd=source)
+    git("remote", "add", "origin", str(remote), cwd=source)
+    git("push", "-q", "origin", "main", "feature", "v1", cwd=source)
+    return source
+
+
+def get_refs(path: Path) -> list[str]:
+    return git("for-each-ref", "--format=%(refname)", cwd=path).split()
+
+
+def create_target(tmp_path: Path, mirror: bool) -> Target:
+    (tmp_path / "target").mkdir(exist_ok=True)
+    return Target(tmp_path / "target", mirror)
+
+
+def test_update_repo_on_target_mirror_has_all_refs_and_no_working_copy(tmp_path: Path) -> None:
+    source = create_source(tmp_path)
+
+    GitRepo(source).update_repo_on_target(tmp_path / "home", create_target(tmp_path, True), False)
+
+    mirror = tmp_path / "target" / "repo"
+    assert not (mirror / "file").exists()
+    assert get_refs(mirror) == ["refs/heads/feature", "refs/heads/main", "refs/tags/v1"]
+
+
+def test_update_repo_on_target_mirror_fetches_new_branches(tmp_path: Path) -> None:
+    source = create_source(tmp_path)
+    repo = GitRepo(source)
+    repo.update_repo_on_target(tmp_path / "home", create_target(tmp_path, True), False)
+    git("branch", "other", cwd=source)
+    git("push", "-q", "origin", "other", cwd=source)
+
+    repo.update_repo_on_target(tmp_path / "home", create_target(tmp_path, False), False)
+
+    assert "refs/heads/other" in get_refs(tmp_path / "target" / "repo")
+
+
+def test_update_repo_on_target_local_source_mirror_has_unpushed_commits(tmp_path: Path) -> None:
+    source = create_source(tmp_path)
+    repo = GitRepo(source)
+    repo.update_repo_on_target(tmp_path / "home", create_target(tmp_path, True), False, local_source=True)
+    git("commit", "-q", "--allow-empty", "-m", "unpushed", cwd=source)
+
+    repo.update_repo_on_target(tmp_path / "home", create_target(tmp_path, True), False, local_source=True)
+
+    mirror = tmp_path / "target" / "repo"
+    assert git("rev-parse", "main", cwd=mirror) == git("rev-parse", "main", cwd=source)
+    assert git("remote", "get-url", "origin", cwd=mirror).strip() == str(tmp_path / "remote.git")
+
+
+def test_update_repo_on_target_working_copy_converted_to_mirror(tmp_path: Path) -> None:
+    source = create_source(tmp_path)
+    repo = GitRepo(source)
+    repo.update_repo_on_target(tmp_path / "home", create_target(tmp_path, False), False)
+
+    repo.update_repo_on_target(tmp_path / "home", create_target(tmp_path, True), False)
+
+    mirror = tmp_path / "target" / "repo"
+    assert not (mirror / ".git").exists()
+    assert git("rev-parse", "--is-bare-repository", cwd=mirror).strip() == "true"
+    assert get_refs(mirror) == ["refs/heads/feature", "refs/heads/main", "refs/tags/v1"]
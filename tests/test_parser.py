@@ -3,7 +3,9 @@ from pathlib import Path
 import pytest
 from pyfakefs.fake_filesystem import FakeFilesystem
 
+from devsync.maintenance import MaintenancePolicy
 from devsync.parser import YMLConfigParser
+from devsync.snapshots import RetentionPolicy
 
 CONFIG_CONTENT = """
 home: /home/user                    # Source root folder
@@ -38,3 +40,85 @@ def test_parse_backup_folder_for_test_config_should_be_3_folders(fs: FakeFilesys
     parser = YMLConfigParser(config)
     expected_number_of_backup_folders = 3
     assert len(parser.parse_backup_folder()) == expected_number_of_backup_folders
+
+
+PROFILE_CONFIG_CONTENT = (
+    CONFIG_CONTENT
+    + """
+targetProfile: my-nas
+profiles:
+  my-nas:
+    base: remote-ssh
+    compress: false
+    output: quiet
+"""
+)
+
+
+def test_parse_target_profile_not_set_empty(fs: FakeFilesystem):
+    config = Path("test_config.yml")
+    fs.create_file(config, contents=CONFIG_CONTENT)
+    parser = YMLConfigParser(config)
+    assert not parser.parse_target_profile()
+    assert "usb-fat" in parser.parse_profiles()
+
+
+def test_parse_profiles_custom_profile_based_on_builtin(fs: FakeFilesystem):
+    config = Path("test_config.yml")
+    fs.create_file(config, contents=PROFILE_CONFIG_CONTENT)
+    parser = YMLConfigParser(config)
+
+    profile = parser.parse_profiles()[parser.parse_target_profile()]
+
+    assert profile.name == "my-nas"
+    assert not profile.whole_file
+    assert not profile.compress
+    assert profile.output == "quiet"
+
+
+def test_parse_profiles_unknown_base_raises(fs: FakeFilesystem):
+    config = Path("test_config.yml")
+    fs.create_file(config, contents=CONFIG_CONTENT + "profiles:\n  my-nas:\n    base: foo\n")
+
+    with pytest.raises(ValueError, match="Unknown base foo of profile my-nas, choose from usb-fat, local-ext4"):
+        YMLConfigParser(config).parse_profiles()
+
+
+def test_parse_snapshot_retention_not_set_default(fs: FakeFilesystem):
+    config = Path("test_config.yml")
+    fs.create_file(config, contents=CONFIG_CONTENT)
+    assert YMLConfigParser(config).parse_snapshot_retention() == RetentionPolicy()
+
+
+def test_parse_snapshot_retention_set_overrides_default(fs: FakeFilesystem):
+    config = Path("test_config.yml")
+    fs.create_file(config, contents=CONFIG_CONTENT + "snapshotRetention:\n  daily: 3\n  monthly: 12\n")
+
+    retention = YMLConfigParser(config).parse_snapshot_retention()
+
+    assert retention == RetentionPolicy(daily=3, weekly=RetentionPolicy().weekly, monthly=12)
+
+
+def test_parse_maintenance_set_overrides_default(fs: FakeFilesystem):
+    config = Path("test_config.yml")
+    fs.create_file(config, contents=CONFIG_CONTENT + "maintenance:\n  looseObjects: 1000\n  packs: 10\n")
+
+    policy = YMLConfigParser(config).parse_maintenance()
+
+    expected_loose_objects = 1000
+    expected_packs = 10
+    assert policy == MaintenancePolicy(expected_loose_objects, expected_packs, MaintenancePolicy().prune_expire)
+
+
+def test_parse_backup_folder_global_and_folder_excludes(fs: FakeFilesystem):
+    config = Path("test_config.yml")
+    fs.create_file(
+        config,
+        contents="home: /home/user\nexclude: [node_modules]\nbackupFolder:\n"
+        "  - path: Development\n    exclude: [/build, '*.pyc']\n  - path: Documents\n",
+    )
+
+    development, documents = YMLConfigParser(config).parse_backup_folder()
+
+    assert development.excludes.patterns == ["node_modules", "/build", "*.pyc"]
+    assert documents.excludes.patterns == ["node_modules"]
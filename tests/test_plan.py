@@ -0,0 +1,132 @@
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from devsync.changes import ChangeJournal, SyncStamp
+from devsync.data import BackupFolder, GitRepo, HgRepo, Target
+from devsync.manifest import SyncManifest
+from devsync.plan import BackupPlan, PlannedFolder, PlannedRepo, Planner, format_duration
+from devsync.schedule import CostModel
+from devsync.staleness import RefCache, RefState, get_ref_fingerprint
+from tests.test_schedule import create_report
+
+REFS = {"refs/heads/main": "a" * 40}
+
+
+@pytest.fixture
+def ref_cache(monkeypatch: pytest.MonkeyPatch) -> RefCache:
+    cache = RefCache()
+    monkeypatch.setattr("devsync.plan.ref_cache", cache)
+    return cache
+
+
+def create_folder(home: Path, repo_names: list[str]) -> BackupFolder:
+    backup_folder = BackupFolder(home, "Dev")
+    for name in repo_names:
+        (home / "Dev" / name / ".git").mkdir(parents=True)
+        backup_folder.repos.append(GitRepo(home / "Dev" / name))
+    return backup_folder
+
+
+def create_target(path: Path) -> Target:
+    path.mkdir()
+    return Target(path)
+
+
+def cache_refs(ref_cache: RefCache, repo_path: Path, refs: dict[str, str]) -> None:
+    ref_cache.put(repo_path, get_ref_fingerprint(repo_path / ".git"), RefState(0.0, refs))
+
+
+def test_plan_repos_by_cached_and_recorded_refs(tmp_path: Path, ref_cache: RefCache) -> None:
+    home = tmp_path / "home"
+    backup_folder = create_folder(home, ["new", "changed", "unchanged", "uncached"])
+    backup_folder.repos.append(HgRepo(home / "Dev" / "hg"))
+    target = create_target(tmp_path / "target")
+    manifest = SyncManifest(target.state_dir)
+    for name in ("changed", "unchanged", "uncached", "hg"):
+        manifest.record(Path("Dev") / name, REFS)
+    manifest.save()
+    cache_refs(ref_cache, home / "Dev" / "changed", {**REFS, "refs/tags/v1": "b" * 40})
+    cache_refs(ref_cache, home / "Dev" / "unchanged", REFS)
+
+    backup_plan = Planner(home, [backup_folder], target, CostModel()).plan()
+
+    assert [(repo.path, repo.action) for repo in backup_plan.repos] == [
+        ("Dev/hg", "check"),
+        ("Dev/uncached", "check"),
+        ("Dev/new", "clone"),
+        ("Dev/changed", "pull"),
+    ]
+    assert backup_plan.repos[-1].reason == "1 refs changed"
+    assert backup_plan.unchanged_repos == 1
+
+
+def test_plan_repo_on_target_without_recorded_refs_check(tmp_path: Path, ref_cache: RefCache) -> None:
+    home = tmp_path / "home"
+    backup_folder = create_folder(home, ["repo"])
+    target = create_target(tmp_path / "target")
+    (target.path / "Dev" / "repo").mkdir(parents=True)
+    cache_refs(ref_cache, home / "Dev" / "repo", REFS)
+
+    backup_plan = Planner(home, [backup_folder], target, CostModel()).plan()
+
+    assert backup_plan.repos == [PlannedRepo("Dev/repo", "check", "no recorded refs", CostModel.DEFAULT_REPO_COST)]
+
+
+def test_plan_folders_full_scan_from_history(tmp_path: Path) -> None:
+    backup_folder = create_folder(tmp_path / "home", [])
+    target = create_target(tmp_path / "target")
+    transfer = {"duration": 30.0, "Total transferred file size": 5000}
+    model = CostModel([create_report({}, {"Dev": transfer})])
+
+    backup_plan = Planner(tmp_path / "home", [backup_folder], target, model).plan()
+
+    expected_seconds = 30.0
+    assert backup_plan.folders == [PlannedFolder("Dev", "sync", "full scan", 5000, expected_seconds)]
+
+
+def test_plan_folders_from_change_journal(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    home = tmp_path / "home"
+    changed_folder = create_folder(home, [])
+    (home / "Dev" / "sub").mkdir(parents=True)
+    (home / "Dev" / "sub" / "file").write_text("x" * 100)
+    unchanged_folder = BackupFolder(home, "Docs")
+    unchanged_folder.path.mkdir()
+    target = create_target(tmp_path / "target")
+    journal = ChangeJournal(tmp_path / "changes.jsonl")
+    journal.start([changed_folder.path, unchanged_folder.path])
+    SyncStamp(target.state_dir).save(time.time() + 1)
+    journal.record_dirty([str(home / "Dev" / "sub")], time.time() + 2)
+    monkeypatch.setattr("devsync.plan.CHANGE_JOURNAL", journal.path)
+
+    backup_plan = Planner(home, [changed_folder, unchanged_folder], target, CostModel()).plan()
+
+    expected_bytes = 100
+    assert [(folder.name, folder.action, folder.bytes) for folder in backup_plan.folders] == [
+        ("Dev", "sync", expected_bytes),
+        ("Docs", "skip", 0),
+    ]
+
+
+def test_backup_plan_output() -> None:
+    backup_plan = BackupPlan(
+        [PlannedRepo("Dev/a", "pull", "1 refs changed", 30.0), PlannedRepo("Dev/b", "clone", "new", 50.0)],
+        [PlannedFolder("Dev", "sync", "full scan", 2_000_000, 60.0)],
+        unchanged_repos=3,
+        jobs=2,
+    )
+
+    expected_seconds = 100.0
+    content = json.loads(json.dumps(backup_plan.to_dict()))
+    assert content["seconds"] == expected_seconds
+    assert content["unchanged_repos"] == backup_plan.unchanged_repos
+    table = backup_plan.format_table()
+    assert "Repos: 2 to update, 3 unchanged" in table
+    assert "Total: 2.0 MB in about 1m 40s" in table
+
+
+def test_format_duration() -> None:
+    assert format_duration(42.4) == "42s"
+    assert format_duration(125) == "2m 05s"
@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import pytest
+from pyfakefs.fake_filesystem import FakeFilesystem
+
+from devsync.profiles import PROFILES, TargetProfile, detect_profile, get_filesystem_type, select_profile
+
+PROC_MOUNTS_CONTENT = """\
+/dev/nvme0n1p2 / ext4 rw,relatime 0 0
+/dev/sdb1 /media/user/USB\\040STICK vfat rw,nosuid 0 0
+server:/export /mnt/nas nfs4 rw,relatime 0 0
+/dev/sdc1 /media/user/NTFS fuseblk rw,nosuid 0 0
+"""
+
+
+@pytest.fixture
+def mounts(fs: FakeFilesystem) -> FakeFilesystem:
+    fs.create_file("/proc/mounts", contents=PROC_MOUNTS_CONTENT)
+    fs.create_dir("/media/user/USB STICK/backup")
+    fs.create_dir("/mnt/nas/backup")
+    fs.create_dir("/media/user/NTFS/backup")
+    fs.create_dir("/home/user")
+    return fs
+
+
+def test_get_options_usb_fat_whole_file_with_modify_window() -> None:
+    options = PROFILES["usb-fat"].get_options()
+    assert options == ["--whole-file", "--modify-window=2", "-v", "--progress"]
+
+
+def test_get_options_remote_ssh_delta_compressed_without_per_file_output() -> None:
+    options = PROFILES["remote-ssh"].get_options()
+    assert options == ["--no-whole-file", "--compress", "--info=progress2"]
+
+
+def test_get_options_network_mount_whole_file_without_compression() -> None:
+    options = PROFILES["network-mount"].get_options()
+    assert options == ["--whole-file", "--info=progress2"]
+
+
+def test_get_options_quiet_checksum() -> None:
+    options = TargetProfile("custom", checksum=True, output="quiet").get_options()
+    assert options == ["--whole-file", "--checksum"]
+
+
+def test_get_filesystem_type_longest_mount_point_wins(mounts: FakeFilesystem) -> None:
+    assert get_filesystem_type(Path("/media/user/USB STICK/backup")) == "vfat"
+    assert get_filesystem_type(Path("/home/user")) == "ext4"
+
+
+def test_get_filesystem_type_without_proc_mounts_empty(fs: FakeFilesystem) -> None:
+    assert not get_filesystem_type(Path("/tmp"))
+
+
+def test_detect_profile_from_filesystem(mounts: FakeFilesystem) -> None:
+    assert detect_profile(Path("/media/user/USB STICK/backup")).name == "usb-fat"
+    assert detect_profile(Path("/mnt/nas/backup")).name == "network-mount"
+    assert detect_profile(Path("/home/user")).name == "local-ext4"
+    assert detect_profile(Path("/media/user/NTFS/backup")).name == "local-ext4"  # NTFS-3g is not FAT
+
+
+def test_select_profile_by_name_over_detection(mounts: FakeFilesystem) -> None:
+    assert select_profile("remote-ssh", PROFILES, Path("/home/user")).name == "remote-ssh"
+
+
+def test_select_profile_unknown_name_raises() -> None:
+    with pytest.raises(ValueError, match="Unknown target profile"):
+        select_profile("floppy", PROFILES, Path("/home/user"))
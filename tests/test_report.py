@@ -0,0 +1,95 @@
+import json
+from pathlib import Path
+
+from pyfakefs.fake_filesystem import FakeFilesystem
+
+from devsync.report import RunReport, get_speedup
+
+
+def test_get_speedup_like_rsync() -> None:
+    expected_speedup = 4.0
+    assert get_speedup({"Total file size": 400, "Total bytes sent": 90, "Total bytes received": 10}) == expected_speedup
+
+
+def test_get_speedup_no_traffic() -> None:
+    assert get_speedup({"Total file size": 400}) == 0.0
+
+
+def test_phase_repeated_phases_add_up() -> None:
+    run_report = RunReport()
+    with run_report.phase("config"):
+        pass
+    first = run_report.phases["config"]
+    with run_report.phase("config"):
+        pass
+    assert run_report.phases["config"] >= first
+
+
+def test_add_transfer_shards_of_folder_add_up() -> None:
+    run_report = RunReport()
+    run_report.add_transfer("dev", {"Number of files": 2})
+    run_report.add_transfer("dev", {"Number of files": 3})
+
+    expected_files = 5
+    assert run_report.transfers["dev"]["Number of files"] == expected_files
+
+
+def test_append_to_history_one_line_per_run(fs: FakeFilesystem) -> None:
+    history = Path("/logs/runs.jsonl")
+    for _ in range(2):
+        run_report = RunReport(Path("/target"), dry_run=True)
+        run_report.add_repo(Path("dev/repo"), 1.5)
+        run_report.append_to(history)
+
+    lines = history.read_text().splitlines()
+    report = json.loads(lines[-1])
+    expected_runs = 2
+    assert len(lines) == expected_runs
+    assert report["target"] == "/target"
+    assert report["dry_run"]
+    assert report["repos"] == {"dev/repo": {"duration": 1.5, "error": ""}}
+
+
+def test_to_dict_transfer_duration_and_skipped() -> None:
+    run_report = RunReport()
+    run_report.add_transfer("dev", {"Number of files": 2}, 1.5)
+    run_report.add_transfer("docs", {"Number of files": 1})
+    run_report.add_skipped("pictures")
+
+    report = run_report.to_dict()
+
+    expected_duration = 1.5
+    assert report["transfers"]["dev"]["duration"] == expected_duration
+    assert "duration" not in report["transfers"]["docs"]
+    assert report["skipped"] == ["pictures"]
+
+
+def test_to_dict_maintenance_stats_before_and_after() -> None:
+    run_report = RunReport()
+    run_report.add_maintenance(Path("dev/repo"), {"packs": 12}, {"packs": 1}, 2.5)
+
+    report = run_report.to_dict()
+
+    assert report["maintenance"]["dev/repo"] == {
+        "before": {"packs": 12},
+        "after": {"packs": 1},
+        "duration": 2.5,
+        "error": "",
+    }
+
+
+def test_read_history_last_reports_from_end_of_file(fs: FakeFilesystem, monkeypatch) -> None:
+    monkeypatch.setattr(RunReport, "HISTORY_BLOCK_SIZE", 64)
+    history = Path("/logs/runs.jsonl")
+    for index in range(5):
+        run_report = RunReport()
+        run_report.add_repo(Path(f"dev/repo{index}"), 1.0)
+        run_report.append_to(history)
+
+    reports = RunReport.read_history(history, 2)
+
+    assert [list(report["repos"]) for report in reports] == [["dev/repo3"], ["dev/repo4"]]
+
+
+def test_read_history_missing_file_empty(fs: FakeFilesystem) -> None:
+    assert not RunReport.read_history(Path("/logs/runs.jsonl"), 2)
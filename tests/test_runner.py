@@ -0,0 +1,142 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from devsync.log import logger, output_groups
+from devsync.runner import Command, CommandRunner
+
+
+def python(code: str) -> list[str]:
+    return [sys.executable, "-c", code]
+
+
+@pytest.fixture
+def records() -> list[logging.LogRecord]:
+    handled: list[logging.LogRecord] = []
+    handler = MagicMock(level=0, handle=handled.append)
+    logger.addHandler(handler)
+    yield handled
+    logger.removeHandler(handler)
+
+
+def test_run_returns_stdout_and_logs_both_streams_with_prefix(records: list[logging.LogRecord]) -> None:
+    command = Command(python("import sys; print('out'); print('err', file=sys.stderr)"), prefix="repo")
+
+    output = CommandRunner().run(command)
+
+    assert output == "out\n"
+    assert sorted(record.getMessage() for record in records) == ["[repo] err", "[repo] out"]
+
+
+def test_run_without_log_output_stdout_not_logged(records: list[logging.LogRecord]) -> None:
+    CommandRunner().run(Command(python("print('refs')"), log_output=False))
+    assert not records
+
+
+def test_run_failing_command_raises_with_stderr() -> None:
+    command = Command(python("import sys; sys.exit('broken')"))
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        CommandRunner().run(command)
+
+    assert error.value.returncode == 1
+    assert "broken" in error.value.stderr
+
+
+def test_run_timeout_kills_command() -> None:
+    runner = CommandRunner(timeout=0.2)
+    start = time.perf_counter()
+
+    with pytest.raises(subprocess.TimeoutExpired):
+        runner.run(Command(python("import time; time.sleep(10)")))
+
+    expected_max_duration = 5
+    assert time.perf_counter() - start < expected_max_duration
+
+
+def test_run_command_timeout_overrides_runner_timeout() -> None:
+    runner = CommandRunner(timeout=0.01)
+    assert runner.run(Command(python("import time; time.sleep(0.2); print('done')"), timeout=5)) == "done\n"
+
+
+def test_cancel_all_kills_running_commands() -> None:
+    runner = CommandRunner()
+    result: list[BaseException] = []
+
+    def run() -> None:
+        try:
+            runner.run(Command(python("import time; time.sleep(10)")))
+        except concurrent.futures.CancelledError as error:
+            result.append(error)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.5)
+    runner.cancel_all()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert result
+
+
+def test_run_async_many_commands_at_once() -> None:
+    runner = CommandRunner()
+    commands = [Command(python(f"import time; time.sleep(0.3); print({index})")) for index in range(10)]
+
+    async def run_all() -> list[str]:
+        return await asyncio.gather(*(runner.run_async(command) for command in commands))
+
+    start = time.perf_counter()
+    outputs = asyncio.run(run_all())
+
+    expected_max_duration = 2
+    assert outputs == [f"{index}\n" for index in range(10)]
+    assert time.perf_counter() - start < expected_max_duration
+
+
+def test_run_grouped_output_streamed_lines_join_group(records: list[logging.LogRecord]) -> None:
+    runner = CommandRunner()
+
+    with output_groups.group(logger):
+        logger.info("before")
+        runner.run(Command(python("print('line')"), prefix="repo"))
+        assert not records
+
+    assert [record.getMessage() for record in records] == ["before", "[repo] line"]
+
+
+def test_run_progress_without_newlines_split_at_carriage_returns(records: list[logging.LogRecord]) -> None:
+    code = "import sys; sys.stdout.write('x' * 70000 + '\\r' + ''.join(f'{i}%\\r' for i in range(100)) + 'done\\r\\n')"
+
+    output = CommandRunner().run(Command(python(code), prefix="rsync"))
+
+    expected_lines = 102
+    assert output.endswith("99%\rdone\r\n")
+    assert len(output) == 70000 + 1 + sum(len(f"{i}%\r") for i in range(100)) + len("done\r\n")
+    assert len(records) == expected_lines
+    assert records[-1].getMessage() == "[rsync] done"
+
+
+def test_run_read_error_kills_command(monkeypatch: pytest.MonkeyPatch) -> None:
+    pids: list[int] = []
+
+    def failing_add_line(text: str, *_) -> None:
+        pids.append(int(text))
+        message = "broken output"
+        raise ValueError(message)
+
+    monkeypatch.setattr(CommandRunner, "add_line", staticmethod(failing_add_line))
+
+    with pytest.raises(ValueError, match="broken output"):
+        CommandRunner().run(Command(python("import os, time; print(os.getpid(), flush=True); time.sleep(10)")))
+
+    with pytest.raises(ProcessLookupError):
+        os.kill(pids[0], 0)
@@ -0,0 +1,97 @@
+from pathlib import Path
+
+from devsync.report import RunReport
+from devsync.schedule import CostModel, Estimate, Scheduler
+
+
+def create_report(repos: dict[str, float], transfers: dict[str, dict[str, int]], dry_run: bool = False) -> dict:
+    return {
+        "version": RunReport.VERSION,
+        "dry_run": dry_run,
+        "repos": {path: {"duration": duration, "error": ""} for path, duration in repos.items()},
+        "transfers": transfers,
+    }
+
+
+def test_repo_mean_duration_and_share_of_runs_updated() -> None:
+    model = CostModel([create_report({"dev/a": 2.0}, {}), create_report({"dev/a": 4.0}, {}), create_report({}, {})])
+
+    expected_cost = 3.0
+    assert model.repo("dev/a") == Estimate(expected_cost, 2 / 3)
+
+
+def test_repo_unknown_mean_of_known_costs_and_full_churn() -> None:
+    model = CostModel([create_report({"dev/a": 2.0, "dev/b": 6.0}, {})])
+
+    expected_cost = 4.0
+    assert model.repo("dev/new") == Estimate(expected_cost, 1.0)
+
+
+def test_repo_no_history_default_cost() -> None:
+    assert CostModel().repo("dev/a") == Estimate(CostModel.DEFAULT_REPO_COST, 1.0)
+
+
+def test_folder_shared_transfer_split_and_churn_from_transferred_files() -> None:
+    changed = {"duration": 30.0, "Number of regular files transferred": 3}
+    unchanged = {"duration": 10.0, "Number of regular files transferred": 0}
+    model = CostModel([create_report({}, {"a,b": changed}), create_report({}, {"a,b": unchanged})])
+
+    expected_cost = 10.0
+    assert model.folder("a") == Estimate(expected_cost, 0.5)
+    assert model.folder("b") == model.folder("a")
+
+
+def test_load_skips_dry_runs(tmp_path: Path) -> None:
+    history = tmp_path / "runs.jsonl"
+    for dry_run in (False, True):
+        run_report = RunReport(dry_run=dry_run)
+        run_report.add_repo(Path("dev/a"), 1.0)
+        run_report.append_to(history)
+
+    model = CostModel.load(history)
+
+    assert model.runs == 1
+
+
+def test_order_without_budget_most_expensive_first() -> None:
+    estimates = {"small": Estimate(1.0, 1.0), "large": Estimate(9.0, 0.1), "medium": Estimate(5.0, 0.5)}
+
+    order = Scheduler().order(list(estimates), estimates.__getitem__)
+
+    assert order == ["large", "medium", "small"]
+
+
+def test_order_with_budget_most_churn_per_second_first() -> None:
+    estimates = {"rare": Estimate(1.0, 0.1), "large": Estimate(9.0, 0.9), "busy": Estimate(2.0, 1.0)}
+
+    order = Scheduler(budget=60).order(list(estimates), estimates.__getitem__)
+
+    assert order == ["busy", "rare", "large"]
+
+
+def test_order_same_estimates_keep_order() -> None:
+    assert Scheduler().order(["b", "a", "c"], lambda _: Estimate(1.0, 1.0)) == ["b", "a", "c"]
+
+
+def test_admit_only_estimates_fitting_into_budget() -> None:
+    scheduler = Scheduler(budget=60)
+
+    assert scheduler.admit("small", Estimate(10.0, 1.0))
+    assert not scheduler.admit("large", Estimate(100.0, 1.0))
+
+
+def test_admit_without_budget_everything() -> None:
+    scheduler = Scheduler()
+
+    assert not scheduler.has_budget
+    assert scheduler.admit("large", Estimate(1e9, 1.0))
+
+
+def test_folder_transferred_bytes_mean_per_run() -> None:
+    changed = {"duration": 30.0, "Total transferred file size": 4000}
+    unchanged = {"duration": 10.0, "Total transferred file size": 0}
+    model = CostModel([create_report({}, {"a,b": changed}), create_report({}, {"a,b": unchanged})])
+
+    expected_bytes = 1000.0
+    assert model.transferred_bytes("a") == expected_bytes
+    assert model.transferred_bytes("unknown") == 0.0
@@ -0,0 +1,70 @@
+import datetime
+from pathlib import Path
+
+from devsync.snapshots import RetentionPolicy, SnapshotStore
+
+
+def local_time(year: int, month: int, day: int, hour: int = 12) -> datetime.datetime:
+    return datetime.datetime(year, month, day, hour, tzinfo=datetime.timezone.utc).astimezone()
+
+
+def create_snapshots(path: Path, times: list[datetime.datetime]) -> SnapshotStore:
+    store = SnapshotStore(path)
+    for snapshot_time in times:
+        (path / snapshot_time.strftime(SnapshotStore.TIME_FORMAT)).mkdir(parents=True)
+    return store
+
+
+def test_select_keeps_newest_per_day_for_daily_days() -> None:
+    snapshots = [local_time(2024, 5, day, hour) for day in (1, 2, 3) for hour in (8, 18)]
+
+    keep = RetentionPolicy(daily=2, weekly=0).select(snapshots)
+
+    assert keep == {local_time(2024, 5, 3, 18), local_time(2024, 5, 2, 18)}
+
+
+def test_select_weekly_keeps_older_weeks_than_daily() -> None:
+    snapshots = [local_time(2024, 5, day) for day in range(1, 22)]
+
+    keep = RetentionPolicy(daily=3, weekly=3).select(snapshots)
+
+    # 2024-05-19 is the last Sunday before the days kept as daily
+    assert keep == {
+        local_time(2024, 5, 21),
+        local_time(2024, 5, 20),
+        local_time(2024, 5, 19),
+        local_time(2024, 5, 12),
+    }
+
+
+def test_select_nothing_to_keep_latest_still_kept() -> None:
+    snapshots = [local_time(2024, 5, 1), local_time(2024, 5, 2)]
+    assert RetentionPolicy(daily=0, weekly=0).select(snapshots) == {local_time(2024, 5, 2)}
+
+
+def test_snapshots_sorted_and_in_progress_left_out(tmp_path: Path) -> None:
+    store = create_snapshots(tmp_path, [local_time(2024, 5, 2), local_time(2024, 5, 1)])
+    store.in_progress.mkdir()
+
+    assert [path.name for path in store.snapshots()] == ["2024-05-01T120000", "2024-05-02T120000"]
+    assert store.latest() == store.snapshots()[-1]
+
+
+def test_commit_renames_in_progress_to_start_time(tmp_path: Path) -> None:
+    store = SnapshotStore(tmp_path)
+    store.in_progress.mkdir()
+
+    snapshot = store.commit(local_time(2024, 5, 1))
+
+    assert snapshot.name == "2024-05-01T120000"
+    assert not store.in_progress.exists()
+
+
+def test_prune_removes_expired_and_leftovers(tmp_path: Path) -> None:
+    store = create_snapshots(tmp_path, [local_time(2024, 5, day) for day in (1, 2, 3)])
+    (tmp_path / "2024-04-01T120000.prune" / "file").mkdir(parents=True)
+
+    pruning = store.prune_in_background(RetentionPolicy(daily=2, weekly=0))
+    pruning.join()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["2024-05-02T120000", "2024-05-03T120000"]
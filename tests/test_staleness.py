@@ -0,0 +1,108 @@
+import os
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from pyfakefs.fake_filesystem import FakeFilesystem
+
+from devsync.data import GitRepo
+from devsync.staleness import RefCache, RefState, get_ref_fingerprint
+
+GIT_DIR = Path("/repo/.git")
+
+
+def test_get_ref_fingerprint__unchanged_refs__same_fingerprint(fs: FakeFilesystem) -> None:
+    fs.create_file(GIT_DIR / "refs/heads/main", contents="a" * 40)
+    fs.create_file(GIT_DIR / "packed-refs")
+    assert get_ref_fingerprint(GIT_DIR) == get_ref_fingerprint(GIT_DIR)
+
+
+def test_get_ref_fingerprint__updated_branch__different_fingerprint(fs: FakeFilesystem) -> None:
+    fs.create_file(GIT_DIR / "refs/heads/feature/foo", contents="a" * 40)
+    before = get_ref_fingerprint(GIT_DIR)
+
+    os.utime(GIT_DIR / "refs/heads/feature/foo", ns=(1, 1))
+
+    assert get_ref_fingerprint(GIT_DIR) != before
+
+
+def test_get_ref_fingerprint__new_branch__different_fingerprint(fs: FakeFilesystem) -> None:
+    fs.create_file(GIT_DIR / "refs/heads/main", contents="a" * 40)
+    before = get_ref_fingerprint(GIT_DIR)
+
+    fs.create_file(GIT_DIR / "refs/heads/feature", contents="b" * 40)
+
+    assert get_ref_fingerprint(GIT_DIR) != before
+
+
+def test_ref_cache__saved_and_loaded__same_entries(fs: FakeFilesystem) -> None:
+    ref_state = RefState(42.0, {"refs/heads/main": "a" * 40})
+    cache = RefCache()
+    cache.load(Path("/state/refs.json"))
+    cache.put(Path("/repo"), "fingerprint", ref_state)
+    cache.save()
+
+    reloaded = RefCache()
+    reloaded.load(Path("/state/refs.json"))
+
+    assert reloaded.get(Path("/repo"), "fingerprint") == ref_state
+    assert reloaded.get(Path("/repo"), "other") is None
+
+
+FOR_EACH_REF_OUTPUT = (
+    "aaaa 1542620271 refs/heads/main\n"
+    "bbbb 1600000000 refs/heads/feature\n"
+    "cccc  refs/tags/v1.0\n"
+    "dddd 1700000000 refs/tags/v2.0\n"
+)
+
+
+@patch("devsync.runner.CommandRunner.run", MagicMock(return_value=FOR_EACH_REF_OUTPUT))
+def test_read_ref_state__several_heads_and_tags__newest_head_and_all_refs() -> None:
+    ref_state = GitRepo.read_ref_state(Path())
+
+    expected_commit_time = 1600000000
+    assert ref_state.commit_time == expected_commit_time
+    assert ref_state.refs == {
+        "refs/heads/main": "aaaa",
+        "refs/heads/feature": "bbbb",
+        "refs/tags/v1.0": "cccc",
+        "refs/tags/v2.0": "dddd",
+    }
+
+
+@patch("devsync.runner.CommandRunner.run", MagicMock(return_value=""))
+def test_read_ref_state__no_heads__zero() -> None:
+    assert GitRepo.read_ref_state(Path()) == RefState(0, {})
+
+
+def test_is_update_required__cached__git_not_called(fs: FakeFilesystem) -> None:
+    fs.create_file(GIT_DIR / "refs/heads/main", contents="a" * 40)
+    run = MagicMock(return_value="aaaa 100 refs/heads/main\n")
+    with patch("devsync.runner.CommandRunner.run", run):
+        assert GitRepo("/repo").is_update_required(99)
+        assert not GitRepo("/repo").is_update_required(100)
+        assert not GitRepo("/repo").is_update_required(0, {"refs/heads/main": "aaaa"})
+        assert GitRepo("/repo").is_update_required(0, {"refs/heads/main": "bbbb"})
+    run.assert_called_once()
+
+
+def test_get_ref_fingerprint__fetched_origin_branch__different_fingerprint(fs: FakeFilesystem) -> None:
+    fs.create_file(GIT_DIR / "refs/heads/main", contents="a" * 40)
+    fs.create_file(GIT_DIR / "refs/remotes/origin/main", contents="a" * 40)
+    before = get_ref_fingerprint(GIT_DIR)
+
+    os.utime(GIT_DIR / "refs/remotes/origin/main", ns=(1, 1))
+
+    assert get_ref_fingerprint(GIT_DIR) != before
+
+
+@patch(
+    "devsync.runner.CommandRunner.run",
+    MagicMock(return_value="aaaa 100 refs/heads/main\nbbbb 200 refs/remotes/origin/main\n"),
+)
+def test_read_ref_state__origin_branches__included() -> None:
+    ref_state = GitRepo.read_ref_state(Path())
+
+    expected_commit_time = 200
+    assert ref_state.commit_time == expected_commit_time
+    assert ref_state.refs == {"refs/heads/main": "aaaa", "refs/remotes/origin/main": "bbbb"}
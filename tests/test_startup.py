@@ -0,0 +1,34 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# Generous, so that it only fails if something heavy is imported at startup again
+IMPORT_BUDGET_US = 500_000
+SLOW_MODULES = ("coloredlogs", "git", "logging.handlers", "yaml")
+
+
+def get_import_times(module: str) -> dict[str, int]:
+    """Cumulative import time in microseconds per module, as reported by
+    ``python -X importtime``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).resolve().parent.parent,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    import_times = {}
+    for line in result.stderr.splitlines():
+        _, _, cumulative, name = (part.strip() for part in line.replace(":", "|", 1).split("|"))
+        if cumulative.isdigit():
+            import_times[name] = int(cumulative)
+    return import_times
+
+
+def test_import_sync_within_budget() -> None:
+    assert get_import_times("devsync.sync")["devsync.sync"] < IMPORT_BUDGET_US
+
+
+def test_import_sync_slow_modules_not_imported() -> None:
+    import_times = get_import_times("devsync.sync")
+    assert not [module for module in SLOW_MODULES if module in import_times]
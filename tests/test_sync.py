@@ -1,59 +1,494 @@
 from pathlib import Path
+from subprocess import CalledProcessError
 
-from devsync.data import BackupFolder, Target
-from devsync.sync import RepoSync, RSync
+import pytest
+from pyfakefs.fake_filesystem import FakeFilesystem
+
+from devsync.checkpoint import CheckpointJournal
+from devsync.data import BackupFolder, Repo, Target
+from devsync.excludes import Excludes
+from devsync.manifest import SyncManifest
+from devsync.profiles import PROFILES
+from devsync.report import RunReport
+from devsync.schedule import CostModel, Scheduler
+from devsync.snapshots import RetentionPolicy, SnapshotStore
+from devsync.sync import BackupOptions, RepoSync, RSync, Shard, SlotLimiter, parse_rsync_stats
 
 
 def test_get_options_with_dry_run() -> None:
-    assert "-n" in RSync.get_options(True, [])
+    assert "-n" in RSync.get_options(True)
 
 
 def test_get_options_without_dry_run() -> None:
-    assert "-n" not in RSync.get_options(False, [])
+    assert "-n" not in RSync.get_options(False)
 
 
 def test_get_options_no_excludes() -> None:
-    assert "--exclude" not in RSync.get_options(False, [])
+    assert not any(option.startswith("--exclude") for option in RSync.get_options(False))
+
+
+def test_get_options_exclude_file() -> None:
+    assert "--exclude-from=/tmp/excludes" in RSync.get_options(False, Path("/tmp/excludes"))
+
+
+def test_get_exclude_patterns_anchored_per_folder() -> None:
+    development = BackupFolder(Path("/foo"), "Development")
+    development.repos.extend([FakeRepo("/foo/Development/repo"), FakeRepo("/foo/Development/sub/my repo")])
+    documents = BackupFolder(Path("/foo"), "Documents")
+    documents.repos.append(FakeRepo("/foo/Documents/notes[1]"))
+
+    patterns = RSync.get_exclude_patterns([development, documents])
+
+    assert patterns == ["/Development/repo/", "/Development/sub/my repo/", "/Documents/notes\\[1]/"]
+
+
+def test_get_exclude_patterns_config_excludes_below_folder() -> None:
+    development = BackupFolder(Path("/foo"), "Development", Excludes.from_patterns(["/build", "node_modules"]))
+    development.repos.append(FakeRepo("/foo/Development/repo"))
 
+    patterns = RSync.get_exclude_patterns([development])
 
-def test_get_options_2_excludes() -> None:
-    assert '--exclude="/tmp/foo"' in RSync.get_options(False, [Path("/tmp/foo"), Path("/tmp/bar")])
-    assert '--exclude="/tmp/bar"' in RSync.get_options(False, [Path("/tmp/foo"), Path("/tmp/bar")])
+    assert patterns == [
+        "/Development/build",
+        "/Development/node_modules",
+        "/Development/**/node_modules",
+        "/Development/repo/",
+    ]
 
 
 def test_sync_no_excludes(fake_process) -> None:
     backup_folder = BackupFolder(Path("/foo"), "blub")
-    backup_folder.get_relative_repo_paths = list
+    fake_process.register(["rsync", fake_process.any()])
 
-    command = f"rsync {RSync.get_options(False, [])} {backup_folder.path} /tmp"
-
-    fake_process.register(command)
     rsync = RSync(Path("/foo"), [backup_folder])
-    rsync.sync(Target("/tmp"), False)
-    assert fake_process.call_count(f"rsync {RSync.get_options(False, [])} {backup_folder.path} /tmp") == 1
+    rsync.sync(Target("/tmp"), BackupOptions())
 
+    command = fake_process.calls[0]
+    assert command[-2:] == [str(backup_folder.path), "/tmp"]
+    assert fake_process.call_count(["rsync", fake_process.any()]) == 1
+
+
+def test_sync_three_backup_folders_single_rsync(fake_process) -> None:
+    backup_folders = [BackupFolder(Path("/foo"), name) for name in ("a", "b", "c")]
+    fake_process.register(["rsync", fake_process.any()])
+
+    rsync = RSync(Path("/foo"), backup_folders)
+    rsync.sync(Target("/tmp"), BackupOptions())
+
+    assert fake_process.call_count(["rsync", fake_process.any()]) == 1
+    assert fake_process.calls[0][-4:] == ["/foo/a", "/foo/b", "/foo/c", "/tmp"]
+
+
+RSYNC_STATS_OUTPUT = """
+Number of files: 3,215 (reg: 2,800, dir: 415)
+Number of regular files transferred: 12
+Total file size: 1,234,567,890 bytes
+Total transferred file size: 2,048 bytes
+Literal data: 2,048 bytes
+Total bytes sent: 3,100
+File list generation time: 0.001 seconds
+
+sent 3,100 bytes  received 95 bytes  6,390.00 bytes/sec
+"""
 
-def test_sync_three_backup_folders(fake_process):
-    backup_folder = BackupFolder(Path("/foo"), "blub")
-    backup_folder.get_relative_repo_paths = list
 
-    command = f"rsync {RSync.get_options(False, [])} {backup_folder.path} /tmp"
+def test_parse_rsync_stats_numbers_without_separators() -> None:
+    stats = parse_rsync_stats(RSYNC_STATS_OUTPUT)
 
-    fake_process.register(command, occurrences=3)
+    expected_files = 3215
+    expected_transferred = 2048
+    assert stats["Number of files"] == expected_files
+    assert stats["Total transferred file size"] == expected_transferred
+    assert "File list generation time" not in stats
 
-    rsync = RSync(Path("/foo"), [backup_folder, backup_folder, backup_folder])
-    rsync.sync(Target("/tmp"), False)
+
+def test_get_shards_by_folder_one_shard_per_folder() -> None:
+    backup_folders = [BackupFolder(Path("/foo"), name) for name in ("a", "b")]
+
+    shards = RSync(Path("/foo"), backup_folders).get_shards(Path("/tmp"), "folder")
+
+    assert [shard.sources for shard in shards] == [[Path("/foo/a")], [Path("/foo/b")]]
+    assert all(shard.destination == Path("/tmp") for shard in shards)
+
+
+def test_get_shards_by_subdir_top_shard_excludes_subdirectories(fs: FakeFilesystem) -> None:
+    fs.create_dir("/target")
+    fs.create_dir("/foo/dev/project/repo/.git")
+    fs.create_dir("/foo/dev/toprepo/.git")
+    fs.create_dir("/foo/dev/other")
+    fs.create_file("/foo/dev/notes.txt")
+    backup_folder = BackupFolder(Path("/foo"), "dev")
+    backup_folder.find_repos_in_path()
+
+    shards = RSync(Path("/foo"), [backup_folder]).get_shards(Path("/target"), "subdir")
+
+    top, other, project = shards
+    assert top.sources == [Path("/foo/dev")]
+    assert top.excludes == ["/dev/other/", "/dev/project/", "/dev/toprepo/"]
+    assert other.sources == [Path("/foo/dev/other")]
+    assert other.destination == Path("/target/dev")
+    assert not other.excludes
+    assert project.excludes == ["/project/repo/"]
+
+
+def test_sync_parallel_one_rsync_per_shard(fake_process) -> None:
+    backup_folders = [BackupFolder(Path("/foo"), name) for name in ("a", "b", "c")]
+    fake_process.register(["rsync", fake_process.any()], stdout=RSYNC_STATS_OUTPUT, occurrences=3)
+
+    rsync = RSync(Path("/foo"), backup_folders)
+    rsync.sync(Target("/tmp"), BackupOptions(rsync_jobs=2, report=True))
 
     expected_count = 3
-    assert fake_process.call_count(command) == expected_count
+    assert fake_process.call_count(["rsync", fake_process.any()]) == expected_count
+
+
+def test_sync_parallel_stats_reported_per_folder(fake_process) -> None:
+    backup_folders = [BackupFolder(Path("/foo"), name) for name in ("a", "b")]
+    fake_process.register(["rsync", fake_process.any()], stdout=RSYNC_STATS_OUTPUT, occurrences=2)
+    run_report = RunReport()
+
+    rsync = RSync(Path("/foo"), backup_folders)
+    rsync.sync(Target("/tmp"), BackupOptions(rsync_jobs=2, report=True), run_report)
+
+    expected_transferred = 12
+    assert list(run_report.transfers) == ["a", "b"]
+    assert run_report.transfers["a"]["Number of regular files transferred"] == expected_transferred
+
+
+def test_sync_single_rsync_stats_reported(fake_process) -> None:
+    backup_folders = [BackupFolder(Path("/foo"), name) for name in ("a", "b")]
+    fake_process.register(["rsync", fake_process.any()], stdout=RSYNC_STATS_OUTPUT)
+    run_report = RunReport()
+
+    rsync = RSync(Path("/foo"), backup_folders)
+    rsync.sync(Target("/tmp"), BackupOptions(), run_report)
+
+    expected_sent = 3100
+    assert run_report.transfers["a,b"]["Total bytes sent"] == expected_sent
+
+
+def test_sync_time_budget_skips_folders_not_fitting(fake_process, monkeypatch) -> None:
+    history = {"repos": {}, "transfers": {"a": {"duration": 10.0}, "b": {"duration": 1000.0}}}
+    monkeypatch.setattr("devsync.sync.scheduler", Scheduler(CostModel([history]), budget=60))
+    backup_folders = [BackupFolder(Path("/foo"), name) for name in ("a", "b")]
+    fake_process.register(["rsync", fake_process.any()], stdout=RSYNC_STATS_OUTPUT)
+    run_report = RunReport()
+
+    complete = RSync(Path("/foo"), backup_folders).sync(Target("/tmp"), BackupOptions(report=True), run_report)
+
+    assert not complete
+    assert list(run_report.transfers) == ["a"]
+    assert run_report.skipped == ["b"]
+    assert fake_process.calls[0][-2] == "/foo/a"
+
+
+def test_sync_folders_recorded_in_checkpoint_once_all_shards_done(fs: FakeFilesystem, fake_process) -> None:
+    fs.create_dir("/foo/a/sub")
+    fs.create_dir("/foo/b")
+    fs.create_dir("/target")
+    checkpoint = CheckpointJournal(Path("/target/.devsync"))
+    checkpoint.start()
+    fake_process.register(["rsync", fake_process.any()], stdout=RSYNC_STATS_OUTPUT, occurrences=3)
+    backup_folders = [BackupFolder(Path("/foo"), name) for name in ("a", "b")]
+
+    rsync = RSync(Path("/foo"), backup_folders, checkpoint=checkpoint)
+    rsync.sync(Target("/target"), BackupOptions(rsync_jobs=2, shard_by="subdir"))
+
+    resumed = CheckpointJournal(Path("/target/.devsync"))
+    assert resumed.load()
+    assert resumed.folders == {"a", "b"}
+    assert checkpoint.path.read_text().count('"folder"') == len(backup_folders)
 
 
 def test_sync_no_backup(fake_process) -> None:
     rsync = RSync(Path("/foo"), [])
-    rsync.sync(Target("/tmp"), False)
+    rsync.sync(Target("/tmp"), BackupOptions())
+    assert not fake_process.calls
+
+
+def test_sync_snapshots_links_to_latest_and_commits_new_snapshot(tmp_path: Path, fake_process) -> None:
+    backup_folder = BackupFolder(Path("/foo"), "blub")
+    fake_process.register(["rsync", fake_process.any()])
+    store = SnapshotStore(tmp_path / SnapshotStore.DIRECTORY)
+    (store.path / "2024-05-01T120000").mkdir(parents=True)
+
+    RSync(Path("/foo"), [backup_folder], retention=RetentionPolicy()).sync(Target(tmp_path), BackupOptions())
+
+    command = fake_process.calls[0]
+    assert f"--link-dest={store.path / '2024-05-01T120000'}" in command
+    assert command[-1] == str(store.in_progress)
+    expected_snapshots = 2
+    assert len(store.snapshots()) == expected_snapshots
+    assert not store.in_progress.exists()
+
+
+def test_sync_snapshots_dry_run_nothing_created(tmp_path: Path, fake_process) -> None:
+    fake_process.register(["rsync", fake_process.any()])
+
+    rsync = RSync(Path("/foo"), [BackupFolder(Path("/foo"), "blub")], retention=RetentionPolicy())
+    rsync.sync(Target(tmp_path), BackupOptions(report=True))
+
+    assert not any(option.startswith("--link-dest") for option in fake_process.calls[0])
+    assert not (tmp_path / SnapshotStore.DIRECTORY).exists()
+
+
+def test_sync_snapshots_not_in_place(tmp_path: Path, fake_process) -> None:
+    fake_process.register(["rsync", fake_process.any()])
+
+    rsync = RSync(Path("/foo"), [BackupFolder(Path("/foo"), "blub")], PROFILES["local-ext4"], RetentionPolicy())
+    rsync.sync(Target(tmp_path), BackupOptions())
+
+    assert "--inplace" not in fake_process.calls[0]
+
+
+def test_run_shard_link_dest_not_in_place(fake_process) -> None:
+    fake_process.register(["rsync", fake_process.any()])
+    backup_folders = [BackupFolder(Path("/foo"), "blub")]
+    rsync = RSync(Path("/foo"), backup_folders, PROFILES["local-ext4"])
+
+    rsync.run_shard(Shard(backup_folders, Path("/new"), [], link_dest=Path("/previous")), True, grouped=False)
+
+    assert "--inplace" not in fake_process.calls[0]
+    assert "--link-dest=/previous" in fake_process.calls[0]
+
+
+def test_get_shards_by_folder_link_dest_previous_snapshot() -> None:
+    backup_folders = [BackupFolder(Path("/foo"), name) for name in ("a", "b")]
+
+    shards = RSync(Path("/foo"), backup_folders).get_shards(Path("/new"), "folder", Path("/previous"))
+
+    assert [shard.link_dest for shard in shards] == [Path("/previous"), Path("/previous")]
+
+
+def test_get_changed_paths_relative_outermost_and_without_repos(fs: FakeFilesystem) -> None:
+    fs.create_dir("/foo/a/sub/deeper")
+    fs.create_dir("/foo/a/other")
+    backup_folder = BackupFolder(Path("/foo"), "a")
+    backup_folder.repos.append(FakeRepo("/foo/a/repo"))
+    changed = [
+        Path("/foo/a/sub/deeper"),
+        Path("/foo/a/sub"),
+        Path("/foo/a/repo/src"),
+        Path("/foo/a/other/deleted/gone"),
+        Path("/foo/unknown"),
+    ]
+
+    paths = RSync(Path("/foo"), [backup_folder]).get_changed_paths(changed)
+
+    assert paths == [Path("a/other"), Path("a/sub")]
+
+
+def test_sync_changed_files_from_and_recursive(fs: FakeFilesystem, fake_process) -> None:
+    fs.create_dir("/foo/a/sub")
+    fake_process.register(["rsync", fake_process.any()], stdout=RSYNC_STATS_OUTPUT)
+    run_report = RunReport()
+
+    rsync = RSync(Path("/foo"), [BackupFolder(Path("/foo"), "a")])
+    rsync.sync_changed(Target("/tmp"), [Path("/foo/a/sub")], False, run_report)
+
+    command = fake_process.calls[0]
+    assert "--recursive" in command
+    assert any(option.startswith("--files-from=") for option in command)
+    assert command[-2:] == ["/foo/", "/tmp"]
+    assert "a" in run_report.transfers
+
+
+def test_sync_changed_nothing_changed_no_rsync(fake_process) -> None:
+    rsync = RSync(Path("/foo"), [BackupFolder(Path("/foo"), "a")])
+    rsync.sync_changed(Target("/tmp"), [], False)
     assert not fake_process.calls
 
 
 def test_get_all_repos_no_repos_set_empty() -> None:
     repo_sync = RepoSync(Path(), [])
     assert not repo_sync.get_all_repos()
+
+
+FAKE_REFS = {"refs/heads/main": "a" * 40}
+
+
+class FakeRepo(Repo):
+    def __init__(self, path: str, error: Exception | None = None):
+        super().__init__(path)
+        self.__error = error
+        self.updated = False
+
+    @property
+    def _get_latest_commit_time(self) -> float:
+        return 1
+
+    def get_refs(self) -> dict[str, str]:
+        return FAKE_REFS
+
+    def update_repo_on_target(self, root: Path, target: Target, report: bool, local_source: bool = False):
+        if self.__error:
+            raise self.__error
+        self.updated = True
+
+    @property
+    def remote_host(self) -> str:
+        return "github.com"
+
+
+def test_update_repos_parallel_all_repos_updated() -> None:
+    backup_folder = BackupFolder(Path("/foo"), "blub")
+    backup_folder.repos.extend(FakeRepo(f"/foo/blub/repo{i}") for i in range(8))
+    repo_sync = RepoSync(Path("/foo"), [backup_folder])
+
+    failures = repo_sync.update_repos(Target("/tmp"), BackupOptions(jobs=4, jobs_per_host=2))
+
+    assert not failures
+    assert all(repo.updated for repo in backup_folder.repos)
+
+
+def test_update_repos_failing_repo_collected_and_others_updated() -> None:
+    backup_folder = BackupFolder(Path("/foo"), "blub")
+    failing = FakeRepo("/foo/blub/failing", CalledProcessError(1, ["git", "fetch"]))
+    working = FakeRepo("/foo/blub/working")
+    backup_folder.repos.extend([failing, working])
+    repo_sync = RepoSync(Path("/foo"), [backup_folder])
+
+    failures = repo_sync.update_repos(Target("/tmp"), BackupOptions())
+
+    assert list(failures) == [Path("/foo/blub/failing")]
+    assert working.updated
+
+
+class UnreadableRepo(FakeRepo):
+    @property
+    def _get_latest_commit_time(self) -> float:
+        raise CalledProcessError(128, ["git", "for-each-ref"])
+
+
+def test_update_repos_failing_staleness_check_reported_as_failure() -> None:
+    backup_folder = BackupFolder(Path("/foo"), "blub")
+    unreadable = UnreadableRepo("/foo/blub/unreadable", CalledProcessError(128, ["git", "fetch"]))
+    working = FakeRepo("/foo/blub/working")
+    backup_folder.repos.extend([unreadable, working])
+
+    failures = RepoSync(Path("/foo"), [backup_folder]).update_repos(Target("/tmp"), BackupOptions(jobs=2))
+
+    assert list(failures) == [Path("/foo/blub/unreadable")]
+    assert working.updated
+
+
+class NoOriginRepo(FakeRepo):
+    @property
+    def remote_host(self) -> str:
+        return Repo.remote_host.fget(self)
+
+    def _get_clone_url(self) -> str:
+        raise CalledProcessError(2, ["git", "remote", "get-url", "origin"])
+
+
+def test_update_repos_host_limit_repo_without_origin_updated() -> None:
+    backup_folder = BackupFolder(Path("/foo"), "blub")
+    backup_folder.repos.extend(NoOriginRepo(f"/foo/blub/repo{i}") for i in range(8))
+
+    failures = RepoSync(Path("/foo"), [backup_folder]).update_repos(Target("/tmp"), BackupOptions(jobs=8))
+
+    assert not failures
+    assert all(repo.updated for repo in backup_folder.repos)
+
+
+def test_update_repos_local_source_without_host_limit(monkeypatch) -> None:
+    monkeypatch.setattr(SlotLimiter, "slot", lambda *_: pytest.fail("local sources are not limited per host"))
+    backup_folder = BackupFolder(Path("/foo"), "blub")
+    backup_folder.repos.extend(FakeRepo(f"/foo/blub/repo{i}") for i in range(8))
+
+    options = BackupOptions(jobs=8, local_source=True)
+    failures = RepoSync(Path("/foo"), [backup_folder]).update_repos(Target("/tmp"), options)
+
+    assert not failures
+
+
+def test_update_repos_durations_reported() -> None:
+    backup_folder = BackupFolder(Path("/foo"), "blub")
+    backup_folder.repos.extend(
+        [FakeRepo("/foo/blub/failing", CalledProcessError(1, ["git", "fetch"])), FakeRepo("/foo/blub/working")]
+    )
+    run_report = RunReport()
+
+    RepoSync(Path("/foo"), [backup_folder]).update_repos(Target("/tmp"), BackupOptions(), run_report=run_report)
+
+    assert sorted(run_report.repos) == ["blub/failing", "blub/working"]
+    assert run_report.repos["blub/failing"]["error"]
+    assert not run_report.repos["blub/working"]["error"]
+    assert set(run_report.phases) == {"staleness", "repo_updates"}
+
+
+def test_update_repos_time_budget_skips_repos_not_fitting(monkeypatch) -> None:
+    history = {"repos": {"blub/slow": {"duration": 1000.0, "error": ""}, "blub/fast": {"duration": 1.0, "error": ""}}}
+    monkeypatch.setattr("devsync.sync.scheduler", Scheduler(CostModel([history]), budget=60))
+    backup_folder = BackupFolder(Path("/foo"), "blub")
+    slow = FakeRepo("/foo/blub/slow")
+    fast = FakeRepo("/foo/blub/fast")
+    backup_folder.repos.extend([slow, fast])
+    run_report = RunReport()
+
+    failures = RepoSync(Path("/foo"), [backup_folder]).update_repos(Target("/tmp"), BackupOptions(), None, run_report)
+
+    assert not failures
+    assert fast.updated
+    assert not slow.updated
+    assert run_report.skipped == ["blub/slow"]
+
+
+def test_update_repos_with_checkpoint_completed_repos_skipped_and_new_recorded(fs: FakeFilesystem) -> None:
+    fs.create_dir("/target")
+    checkpoint = CheckpointJournal(Path("/target/.devsync"))
+    checkpoint.start()
+    checkpoint.record_repo(Path("blub/done"))
+    checkpoint.load()
+    backup_folder = BackupFolder(Path("/foo"), "blub")
+    done = FakeRepo("/foo/blub/done")
+    remaining = FakeRepo("/foo/blub/remaining")
+    backup_folder.repos.extend([done, remaining])
+
+    RepoSync(Path("/foo"), [backup_folder], checkpoint).update_repos(Target("/target"), BackupOptions())
+
+    assert not done.updated
+    assert remaining.updated
+    resumed = CheckpointJournal(Path("/target/.devsync"))
+    resumed.load()
+    assert resumed.repos == {"blub/done", "blub/remaining"}
+
+
+def test_slot_limiter_same_key_same_slot() -> None:
+    slot_limiter = SlotLimiter(2)
+    assert slot_limiter.slot("github.com") is slot_limiter.slot("github.com")
+    assert slot_limiter.slot("github.com") is not slot_limiter.slot("gitlab.com")
+
+
+def test_update_repos_with_manifest_only_changed_repos_updated_and_recorded(fs: FakeFilesystem) -> None:
+    fs.create_dir("/target/blub/unchanged")
+    fs.create_dir("/target/blub/changed")
+    backup_folder = BackupFolder(Path("/foo"), "blub")
+    unchanged = FakeRepo("/foo/blub/unchanged")
+    changed = FakeRepo("/foo/blub/changed")
+    new = FakeRepo("/foo/blub/new")
+    backup_folder.repos.extend([unchanged, changed, new])
+    target = Target("/target")
+    manifest = SyncManifest(target.state_dir)
+    manifest.record(Path("blub/unchanged"), FAKE_REFS)
+    manifest.record(Path("blub/changed"), {"refs/heads/main": "b" * 40})
+
+    RepoSync(Path("/foo"), [backup_folder]).update_repos(target, BackupOptions(last_update=2), manifest)
+
+    assert not unchanged.updated
+    assert changed.updated
+    assert new.updated
+    assert manifest.get(Path("blub/changed")) == FAKE_REFS
+    assert manifest.get(Path("blub/new")) == FAKE_REFS
+
+
+def test_update_repos_with_manifest_dry_run_nothing_recorded(fs: FakeFilesystem) -> None:
+    fs.create_dir("/target")
+    backup_folder = BackupFolder(Path("/foo"), "blub")
+    backup_folder.repos.append(FakeRepo("/foo/blub/new"))
+    target = Target("/target")
+    manifest = SyncManifest(target.state_dir)
+
+    RepoSync(Path("/foo"), [backup_folder]).update_repos(target, BackupOptions(report=True), manifest)
+
+    assert manifest.get(Path("blub/new")) is None
@@ -0,0 +1,122 @@
+import os
+from pathlib import Path
+
+from devsync.data import BackupFolder, Target
+from devsync.engine import CopyEngine
+from devsync.excludes import Excludes
+from devsync.verify import SourceHashCache, TargetHashManifest, Verifier, VerifyResult, hash_file
+from tests.test_engine import create_source, create_target
+
+
+def create_backup(root: Path) -> tuple[BackupFolder, Target]:
+    backup_folder = create_source(root / "home")
+    target = create_target(root / "target")
+    CopyEngine(root / "home", [backup_folder]).sync(target, False)
+    return backup_folder, target
+
+
+def run_verify(root: Path, backup_folder: BackupFolder, target: Target, sample_percent: float = 0) -> VerifyResult:
+    verifier = Verifier([backup_folder], target.path, jobs=2, sample_percent=sample_percent)
+    return verifier.verify(SourceHashCache(root / "hashes.json"), TargetHashManifest(target.state_dir))
+
+
+def corrupt(path: Path) -> None:
+    """Change the content but keep size and mtime, like bit rot."""
+    path_stat = path.stat()
+    path.write_text("x" * path_stat.st_size)
+    os.utime(path, ns=(path_stat.st_atime_ns, path_stat.st_mtime_ns))
+
+
+def test_hash_file(tmp_path: Path) -> None:
+    (tmp_path / "a").write_text("content")
+    (tmp_path / "b").write_text("content")
+    (tmp_path / "c").write_text("other")
+
+    assert hash_file(tmp_path / "a") == hash_file(tmp_path / "b")
+    assert hash_file(tmp_path / "a") != hash_file(tmp_path / "c")
+
+
+def test_verify_matching_backup(tmp_path: Path) -> None:
+    backup_folder, target = create_backup(tmp_path)
+
+    result = run_verify(tmp_path, backup_folder, target)
+
+    expected_files = 2
+    assert result.ok
+    assert result.files == expected_files
+    assert result.hashed_source == expected_files
+    assert result.hashed_target == expected_files
+
+
+def test_verify_skips_repos_and_excludes(tmp_path: Path) -> None:
+    backup_folder, target = create_backup(tmp_path)
+    (tmp_path / "home" / "Dev" / "debug.log").write_text("log")
+    excluding_folder = BackupFolder(tmp_path / "home", "Dev", Excludes.from_patterns(["*.log"]))
+    excluding_folder.repos.extend(backup_folder.repos)
+
+    result = run_verify(tmp_path, excluding_folder, target)
+
+    expected_files = 2
+    assert result.ok
+    assert result.files == expected_files
+
+
+def test_verify_reports_missing_and_outdated_files(tmp_path: Path) -> None:
+    backup_folder, target = create_backup(tmp_path)
+    (target.path / "Dev" / "sub" / "b.txt").unlink()
+    (tmp_path / "home" / "Dev" / "a.txt").write_text("changed after the backup")
+
+    result = run_verify(tmp_path, backup_folder, target)
+
+    assert not result.ok
+    assert result.missing == ["Dev/sub/b.txt"]
+    assert result.outdated == ["Dev/a.txt"]
+    assert result.hashed_source == 0
+
+
+def test_verify_detects_corrupted_target(tmp_path: Path) -> None:
+    backup_folder, target = create_backup(tmp_path)
+    corrupt(target.path / "Dev" / "a.txt")
+
+    result = run_verify(tmp_path, backup_folder, target)
+
+    assert not result.ok
+    assert result.mismatched == ["Dev/a.txt"]
+
+
+def test_verify_reuses_cached_hashes(tmp_path: Path) -> None:
+    backup_folder, target = create_backup(tmp_path)
+    run_verify(tmp_path, backup_folder, target)
+    (tmp_path / "home" / "Dev" / "a.txt").rename(tmp_path / "home" / "Dev" / "renamed.txt")
+    (target.path / "Dev" / "a.txt").rename(target.path / "Dev" / "renamed.txt")
+
+    result = run_verify(tmp_path, backup_folder, target)
+
+    assert result.ok
+    assert result.hashed_source == 0  # Same inode
+    assert result.hashed_target == 1  # New path on the target
+
+
+def test_verify_cached_hashes_miss_corruption_until_sampled(tmp_path: Path) -> None:
+    backup_folder, target = create_backup(tmp_path)
+    run_verify(tmp_path, backup_folder, target)
+    corrupt(target.path / "Dev" / "a.txt")
+
+    assert run_verify(tmp_path, backup_folder, target).ok
+    assert run_verify(tmp_path, backup_folder, target, sample_percent=100).mismatched == ["Dev/a.txt"]
+
+
+def test_verify_sample_rotates_over_all_files(tmp_path: Path) -> None:
+    backup_folder, target = create_backup(tmp_path)
+    for index in range(20):
+        (tmp_path / "home" / "Dev" / f"file{index}").write_text(str(index))
+    CopyEngine(tmp_path / "home", [backup_folder]).sync(target, False)
+    run_verify(tmp_path, backup_folder, target)
+
+    sample_percent = 25
+    rounds = 100 // sample_percent
+    hashed = [run_verify(tmp_path, backup_folder, target, sample_percent).hashed_target for _ in range(rounds)]
+
+    expected_files = 22
+    assert sum(hashed) == expected_files
+    assert TargetHashManifest(target.state_dir).round == rounds + 1
@@ -0,0 +1,130 @@
+import errno
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from devsync.changes import ChangeJournal
+from devsync.watch import IN_CREATE, IN_Q_OVERFLOW, Inotify, Watcher
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is only available on Linux")
+
+
+class Watching:
+    """Watcher running in a thread, stopped with the context."""
+
+    def __init__(self, roots: list[Path], journal: ChangeJournal):
+        self.watcher = Watcher(roots, journal)
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.watcher.run, args=(self.__stop,))
+
+    def __enter__(self) -> Watcher:
+        self.__thread.start()
+        time.sleep(0.2)
+        return self.watcher
+
+    def __exit__(self, *args) -> None:
+        self.__stop.set()
+        self.__thread.join()
+
+
+class FailingInotify:
+    """Inotify that can't watch the directories with the given names."""
+
+    def __init__(self, failing: set[str]):
+        self.__failing = failing
+        self.descriptors = 0
+
+    def add_watch(self, path: Path, _mask: int) -> int:
+        if path.name in self.__failing:
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC), str(path))
+        self.descriptors += 1
+        return self.descriptors
+
+
+def dirty(journal: ChangeJournal) -> set[str]:
+    entries = [json.loads(line) for line in journal.path.read_text().splitlines()]
+    return {entry["path"] for entry in entries if entry["event"] == "dirty"}
+
+
+def test_parse_events_name_without_padding() -> None:
+    data = struct.pack("iIII", 1, IN_CREATE, 0, 16) + b"file\0".ljust(16, b"\0")
+    data += struct.pack("iIII", 2, IN_Q_OVERFLOW, 0, 0)
+
+    assert Inotify.parse_events(data) == [(1, IN_CREATE, "file"), (2, IN_Q_OVERFLOW, "")]
+
+
+def test_run_changed_file_records_its_directory(tmp_path: Path) -> None:
+    (tmp_path / "home" / "sub").mkdir(parents=True)
+    (tmp_path / "home" / "repo" / ".git").mkdir(parents=True)
+    journal = ChangeJournal(tmp_path / "changes.jsonl")
+
+    with Watching([tmp_path / "home"], journal) as watcher:
+        (tmp_path / "home" / "sub" / "file").write_text("content")
+        time.sleep(0.2)
+
+    expected_watches = 3  # home, sub and repo without .git
+    assert watcher.watches == expected_watches
+    assert dirty(journal) == {str(tmp_path / "home" / "sub")}
+
+
+def test_run_new_directory_watched(tmp_path: Path) -> None:
+    (tmp_path / "home").mkdir()
+    journal = ChangeJournal(tmp_path / "changes.jsonl")
+
+    with Watching([tmp_path / "home"], journal):
+        (tmp_path / "home" / "new").mkdir()
+        time.sleep(0.2)
+        (tmp_path / "home" / "new" / "file").write_text("content")
+        time.sleep(0.2)
+
+    assert dirty(journal) == {str(tmp_path / "home"), str(tmp_path / "home" / "new")}
+
+
+def test_handle_overflow_recorded(tmp_path: Path) -> None:
+    journal = ChangeJournal(tmp_path / "changes.jsonl")
+    journal.start([tmp_path])
+
+    Watcher([tmp_path], journal).handle(-1, IN_Q_OVERFLOW, "")
+
+    assert journal.get_dirty([tmp_path], time.time()) is None
+
+
+def test_add_tree_unwatched_directory_scanned_by_every_sync(tmp_path: Path) -> None:
+    (tmp_path / "home" / "sub").mkdir(parents=True)
+    journal = ChangeJournal(tmp_path / "changes.jsonl")
+    journal.start([tmp_path / "home"])
+    first_sync = time.time() + 1000
+
+    Watcher([tmp_path / "home"], journal, FailingInotify({"sub"})).add_tree(tmp_path / "home")
+    first = journal.get_dirty([tmp_path / "home"], first_sync)
+    journal.compact()
+    second = journal.get_dirty([tmp_path / "home"], first_sync + 1000)
+
+    assert first is None
+    assert second is None
+
+
+def test_add_tree_unlistable_directory_still_watched(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    (tmp_path / "home").mkdir()
+    journal = ChangeJournal(tmp_path / "changes.jsonl")
+    journal.start([tmp_path / "home"])
+    watcher = Watcher([tmp_path / "home"], journal, FailingInotify(set()))
+
+    def scandir(path: Path) -> None:
+        raise PermissionError(errno.EACCES, os.strerror(errno.EACCES), str(path))
+
+    monkeypatch.setattr(os, "scandir", scandir)
+    watcher.add_tree(tmp_path / "home")
+    watcher.handle(1, IN_CREATE, "file")
+    watcher.flush()
+    monkeypatch.undo()
+
+    assert watcher.watches == 1
+    assert dirty(journal) == {str(tmp_path / "home")}
+    assert journal.get_dirty([tmp_path / "home"], time.time()) is None